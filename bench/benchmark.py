@@ -0,0 +1,219 @@
+#!/usr/bin/env python3
+
+"""
+ SPDX-License-Identifier: MIT
+
+ Copyright (C) 2023 Advanced Micro Devices, Inc.
+
+ Benchmark suite for pylibelf. Times open, section walk, string table
+ parse, symbol and relocation decoding and write throughput over files
+ produced by elfgen. Results are stored as JSON and can be compared against
+ a baseline run, regressions beyond the tolerance fail the run.
+"""
+
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import compileall
+import statistics
+import subprocess
+
+import pylibelf.elf
+import pylibelf.cache
+import pylibelf.libelf
+import pylibelf.relocate
+import pylibelf.sections
+
+import elfgen
+# elfgen has put the test directory on sys.path
+import testhelper # pylint: disable=wrong-import-order
+
+PRESETS = {
+    "small":  elfgen.ElfSpec(symbols = 10 ** 4, sections = 10 ** 3, relocations = 10 ** 4,
+                             payload = 16 << 20),
+    "medium": elfgen.ElfSpec(symbols = 10 ** 5, sections = 10 ** 4, relocations = 10 ** 5,
+                             payload = 256 << 20),
+    "large":  elfgen.ElfSpec(symbols = 10 ** 6, sections = 10 ** 5, relocations = 10 ** 6,
+                             payload = 2 << 30)
+}
+
+RESULTS_VERSION = 1
+
+# Published budget for the self time of importing pylibelf.elf and pylibelf.libelf,
+# stdlib dependencies (ctypes, enum) excluded, see README.rst
+IMPORT_BUDGET_US = 3000
+
+def _open(filename):
+    return pylibelf.libelf.ElfDescriptor.fromfile(filename, pylibelf.libelf.Elf_Cmd.ELF_C_READ)
+
+def _section_table(filename, name, table):
+    # The descriptor has to outlive the table constructor which copies from d_buf
+    melf = _open(filename)
+    section = pylibelf.sections.SectionIndex(melf).by_name(name)
+    data = melf.elf_getscn(section.index).elf_getdata()
+    return table(data.contents.d_buf, data.contents.d_size)
+
+def bench_open(filename, count = 100):
+    # A single open is too quick to time reliably
+    for _ in range(count):
+        _open(filename).gelf_getehdr()
+    return count
+
+def bench_section_walk(filename):
+    return len(pylibelf.sections.SectionIndex(_open(filename)))
+
+def bench_strtab_parse(filename):
+    return len(_section_table(filename, ".strtab", testhelper.ElfStringTable))
+
+def bench_symbol_decode(filename):
+    # Records are decoded on access, read a field of each to keep the case comparable
+    table = _section_table(filename, ".symtab", testhelper.ElfSymbolTable)
+    return sum(1 for item in table if item.st_name >= 0)
+
+def bench_reloc_decode(filename):
+    table = _section_table(filename, ".rela.text", testhelper.ElfRelaTable)
+    return sum(1 for item in table if item.r_offset >= 0)
+
+def bench_relocate(filename):
+    engine = pylibelf.relocate.RelocationEngine(_open(filename))
+    return len(engine.apply())
+
+def bench_cached_open(filename):
+    # The first repeat fills the cache, the best of the repeats is a warm reopen
+    cache = pylibelf.cache.MetadataCache(filename + ".cache")
+    with cache.open(filename) as cached:
+        return sum(len(cached.symbols(table).value) for table in cached.symbol_tables())
+
+def bench_range_scan(filename):
+    # Constant memory pass over .symtab in 64 KiB chunks of whole entries
+    melf = pylibelf.libelf.ElfDescriptor.fromfile(filename,
+                                                  pylibelf.libelf.Elf_Cmd.ELF_C_READ_MMAP)
+    section = pylibelf.sections.SectionIndex(melf).by_name(".symtab")
+    return sum(len(chunk) for _, chunk in melf.iter_range(section.offset, section.size,
+                                                          pylibelf.libelf.Elf_Type.ELF_T_SYM,
+                                                          1 << 16))
+
+CASES = {
+    "open":          bench_open,
+    "section_walk":  bench_section_walk,
+    "strtab_parse":  bench_strtab_parse,
+    "symbol_decode": bench_symbol_decode,
+    "reloc_decode":  bench_reloc_decode,
+    "relocate":      bench_relocate,
+    "cached_open":   bench_cached_open,
+    "range_scan":    bench_range_scan
+}
+
+def measure_import(repeat):
+    """
+    Best of repeat fresh interpreters of the pylibelf import self time in us as
+    reported by -X importtime
+    """
+    # Stale bytecode is compiled on every import when PYTHONDONTWRITEBYTECODE
+    # is set, refresh it so that only the import itself is measured
+    compileall.compile_dir(os.path.dirname(pylibelf.elf.__file__), quiet = 1)
+    best = None
+    for _ in range(repeat):
+        command = [sys.executable, "-X", "importtime", "-c", "import pylibelf.libelf"]
+        result = subprocess.run(command, capture_output = True, check = True, text = True)
+        total = 0
+        for line in result.stderr.splitlines():
+            fields = [item.strip() for item in line.split(":", 1)[1].split("|")]
+            # The first line is the column header
+            if (fields[0].isdigit() and fields[2] in ("pylibelf", "pylibelf.elf",
+                                                      "pylibelf.libelf")):
+                total += int(fields[0])
+        best = total if best is None else min(best, total)
+    return best
+
+def _timeit(func, repeat):
+    timings = []
+    items = 0
+    for _ in range(repeat):
+        start = time.perf_counter()
+        items = func()
+        timings.append(time.perf_counter() - start)
+    return {"min": min(timings), "median": statistics.median(timings), "repeat": repeat,
+            "items": items}
+
+def run(preset, workdir, repeat, selected):
+    spec = PRESETS[preset]
+    os.makedirs(workdir, exist_ok = True)
+    filename = os.path.join(workdir, f"bench-{preset}.elf")
+    results = {}
+
+    if (selected is None or "import" in selected):
+        usec = measure_import(max(repeat, 5))
+        results["import"] = {"min": usec / 1e6, "median": usec / 1e6, "repeat": max(repeat, 5),
+                             "items": 1, "budget": IMPORT_BUDGET_US / 1e6}
+        print(f"{'import':16} self {usec}us budget {IMPORT_BUDGET_US}us", file = sys.stderr)
+
+    if (selected is None or "write" in selected):
+        result = _timeit(lambda: elfgen.generate(filename, spec), repeat)
+        result["bytes_per_sec"] = os.path.getsize(filename) / result["median"]
+        results["write"] = result
+    elif (not os.path.exists(filename)):
+        elfgen.generate(filename, spec)
+
+    for name, func in CASES.items():
+        if (selected is not None and name not in selected):
+            continue
+        results[name] = _timeit(lambda func = func: func(filename), repeat)
+        print(f"{name:16} median {results[name]['median']:.6f}s", file = sys.stderr)
+
+    return {"version": RESULTS_VERSION, "preset": preset, "spec": vars(spec),
+            "python": platform.python_version(), "machine": platform.machine(),
+            "filesize": os.path.getsize(filename), "results": results}
+
+def compare(current, baseline, tolerance):
+    """
+    Print the ratio of every case against the baseline, return the list of
+    regressions. The best of the repeats is compared as it is the least noisy.
+    """
+    regressions = []
+    print(f"{'case':16} {'baseline':>12} {'current':>12} {'ratio':>8}")
+    for name, result in current["results"].items():
+        if (name not in baseline["results"]):
+            continue
+        before = baseline["results"][name]["min"]
+        ratio = result["min"] / before if before else float("inf")
+        flag = ""
+        if (ratio > 1.0 + tolerance):
+            regressions.append(name)
+            flag = " REGRESSION"
+        print(f"{name:16} {before:12.6f} {result['min']:12.6f} {ratio:8.2f}{flag}")
+    return regressions
+
+def parse_command_line(args):
+    parser = argparse.ArgumentParser(description = "Run the pylibelf benchmark suite")
+    parser.add_argument("-p", "--preset", choices = sorted(PRESETS), default = "small")
+    parser.add_argument("-o", "--output", dest = "output", help = "Write results as JSON")
+    parser.add_argument("-b", "--baseline", dest = "baseline", help = "JSON results to compare to")
+    parser.add_argument("-t", "--tolerance", type = float, default = 0.25,
+                        help = "Allowed slowdown against the baseline as a fraction")
+    parser.add_argument("-n", "--repeat", type = int, default = 3)
+    parser.add_argument("-w", "--workdir", default = ".")
+    parser.add_argument("-c", "--case", dest = "cases", action = "append",
+                        choices = ["import", "write"] + sorted(CASES),
+                        help = "Only run the given cases")
+    return parser.parse_args(args[1:])
+
+if __name__ == "__main__":
+    argtab = parse_command_line(sys.argv)
+    report = run(argtab.preset, argtab.workdir, argtab.repeat, argtab.cases)
+    status = 0
+    imported = report["results"].get("import")
+    if (imported is not None and imported["min"] > imported["budget"]):
+        print("Import time is over budget", file = sys.stderr)
+        status = 1
+    if (argtab.output is not None):
+        with open(argtab.output, "w", encoding = "utf-8") as handle:
+            json.dump(report, handle, indent = 2)
+    if (argtab.baseline is not None):
+        with open(argtab.baseline, "r", encoding = "utf-8") as handle:
+            if (compare(report, json.load(handle), argtab.tolerance)):
+                status = 1
+    sys.exit(status)
@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+
+"""
+ SPDX-License-Identifier: MIT
+
+ Copyright (C) 2023 Advanced Micro Devices, Inc.
+
+ Deterministic generator of large synthetic ELF files for benchmarking. The
+ files are built through the regular writer APIs: ElfDescriptor for the
+ layout and the testhelper string, symbol and relocation tables for the
+ contents. Payload sections are made of many Elf_Data descriptors sharing
+ one pattern buffer so multi-GB files need constant memory. Being ELFCLASS32
+ the files are limited to 4 GB.
+"""
+
+import os
+import sys
+import ctypes
+import random
+import argparse
+
+import pylibelf.elf
+import pylibelf.libelf
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "test"))
+
+import testhelper # pylint: disable=wrong-import-position
+
+PATTERN_SIZE = 16 << 20
+
+class ElfSpec:
+    """ Shape of the generated file """
+    def __init__(self, symbols = 1000, sections = 16, relocations = 1000, payload = 1 << 20,
+                 seed = 0):
+        self.symbols = symbols
+        self.sections = sections
+        self.relocations = relocations
+        self.payload = payload
+        self.seed = seed
+
+    def __repr__(self):
+        return (f"ElfSpec(symbols={self.symbols}, sections={self.sections}, "
+                f"relocations={self.relocations}, payload={self.payload}, seed={self.seed})")
+
+
+def _new_section(melf, strtab, name, sh_type, flags, align = 1, entsize = 0):
+    scn = melf.elf_newscn()
+    shdr = scn.elf32_getshdr()
+    shdr.contents.sh_name = strtab.add(name)
+    shdr.contents.sh_type = sh_type
+    shdr.contents.sh_flags = flags
+    shdr.contents.sh_addralign = align
+    shdr.contents.sh_entsize = entsize
+    return scn
+
+def _attach(scn, buf, size, align = 1, d_type = pylibelf.libelf.Elf_Type.ELF_T_BYTE):
+    data = scn.elf_newdata()
+    data.contents.d_align = align
+    data.contents.d_off = 0
+    data.contents.d_buf = ctypes.cast(buf, ctypes.c_void_p)
+    data.contents.d_type = d_type
+    data.contents.d_size = size
+    data.contents.d_version = pylibelf.elf.EV_CURRENT
+    return data
+
+def _pattern(rng, size):
+    """ Deterministic pseudo random bytes used for every payload chunk """
+    block = rng.randbytes(min(size, 1 << 16))
+    data = (block * (size // len(block) + 1))[:size]
+    return (ctypes.c_char * size).from_buffer_copy(data)
+
+def generate(filename, spec):
+    """ Write an ELF file shaped by spec to filename, returns the number of bytes written """
+    rng = random.Random(spec.seed)
+    keep = []
+    strtab = testhelper.ElfStringTable()
+    melf = pylibelf.libelf.ElfDescriptor.fromfile(filename, pylibelf.libelf.Elf_Cmd.ELF_C_WRITE)
+    ehdr = melf.elf32_newehdr()
+
+    ehdr.contents.e_ident[pylibelf.elf.EI_DATA] = pylibelf.elf.ELFDATA2LSB
+    ehdr.contents.e_ident[pylibelf.elf.EI_VERSION] = pylibelf.elf.EV_CURRENT
+    ehdr.contents.e_machine = pylibelf.elf.EM_M32
+    ehdr.contents.e_type = pylibelf.elf.ET_REL
+    ehdr.contents.e_flags = 0x0
+
+    strtab.add("")
+    # Section name table goes first so that its index always fits e_shstrndx
+    shstrscn = _new_section(melf, strtab, ".shstrtab", pylibelf.elf.SHT_STRTAB,
+                            pylibelf.elf.SHF_STRINGS)
+
+    pattern = _pattern(rng, min(PATTERN_SIZE, max(spec.payload, 4)))
+    keep.append(pattern)
+    text = _new_section(melf, strtab, ".text", pylibelf.elf.SHT_PROGBITS,
+                        pylibelf.elf.SHF_ALLOC | pylibelf.elf.SHF_EXECINSTR, 16)
+    remaining = spec.payload
+    while (remaining > 0):
+        chunk = min(remaining, ctypes.sizeof(pattern))
+        _attach(text, pattern, chunk)
+        remaining -= chunk
+
+    # Small function sections as emitted by -ffunction-sections
+    for index in range(spec.sections):
+        scn = _new_section(melf, strtab, f".text.f{index}", pylibelf.elf.SHT_PROGBITS,
+                           pylibelf.elf.SHF_ALLOC | pylibelf.elf.SHF_EXECINSTR, 4)
+        _attach(scn, pattern, 4 * (1 + rng.randrange(16)), 4)
+
+    symstrtab = testhelper.ElfStringTable()
+    symtab = testhelper.ElfSymbolTable()
+    symtab.add(pylibelf.elf.Elf32_Sym(symstrtab.add(""), 0, 0, 0, 0, pylibelf.elf.SHN_UNDEF))
+    textindex = text.elf_ndxscn()
+    # Local symbols have to precede the global ones
+    nlocal = spec.symbols // 8
+    def symbols():
+        for index in range(spec.symbols):
+            bind = pylibelf.elf.STB_LOCAL if index < nlocal else pylibelf.elf.STB_GLOBAL
+            kind = pylibelf.elf.STT_FUNC if index % 3 else pylibelf.elf.STT_OBJECT
+            info = pylibelf.elf.ELF32_ST_INFO(bind, kind)
+            value = rng.randrange(max(spec.payload, 1)) & ~3
+            name = symstrtab.add(f"sym_{index}_{rng.getrandbits(24):06x}")
+            yield pylibelf.elf.Elf32_Sym(name, value, 4 * (1 + index % 64), info, 0, textindex)
+    symtab.reserve(spec.symbols)
+    symtab.extend(symbols())
+
+    strscn = _new_section(melf, strtab, ".strtab", pylibelf.elf.SHT_STRTAB, 0)
+    strdata = symstrtab.packsyms()
+    keep.append(strdata)
+    _attach(strscn, strdata, ctypes.sizeof(strdata))
+
+    symscn = _new_section(melf, strtab, ".symtab", pylibelf.elf.SHT_SYMTAB, 0, 4,
+                          ctypes.sizeof(pylibelf.elf.Elf32_Sym))
+    symdata = symtab.packsyms()
+    keep.append(symdata)
+    _attach(symscn, symdata, ctypes.sizeof(symdata), 4)
+    symshdr = symscn.elf32_getshdr()
+    symshdr.contents.sh_link = strscn.elf_ndxscn()
+    symshdr.contents.sh_info = nlocal + 1
+
+    def relocations():
+        for index in range(spec.relocations):
+            sym = 1 + rng.randrange(max(spec.symbols, 1)) if spec.symbols else 0
+            offset = rng.randrange(max(spec.payload - 4, 1)) & ~3
+            yield pylibelf.elf.Elf32_Rela(offset, pylibelf.elf.ELF32_R_INFO(
+                sym, pylibelf.elf.R_M32R_32_RELA), index % 256)
+    relatab = testhelper.ElfRelaTable()
+    relatab.extend(relocations())
+    relascn = _new_section(melf, strtab, ".rela.text", pylibelf.elf.SHT_RELA,
+                           pylibelf.elf.SHF_INFO_LINK, 4, ctypes.sizeof(pylibelf.elf.Elf32_Rela))
+    if (len(relatab)):
+        reladata = relatab.packsyms()
+        keep.append(reladata)
+        _attach(relascn, reladata, ctypes.sizeof(reladata), 4)
+    relashdr = relascn.elf32_getshdr()
+    relashdr.contents.sh_link = symscn.elf_ndxscn()
+    relashdr.contents.sh_info = textindex
+
+    shstrdata = strtab.packsyms()
+    keep.append(shstrdata)
+    _attach(shstrscn, shstrdata, ctypes.sizeof(shstrdata))
+    ehdr.contents.e_shstrndx = shstrscn.elf_ndxscn()
+
+    size = melf.elf_update(pylibelf.libelf.Elf_Cmd.ELF_C_WRITE)
+    del keep
+    return size
+
+def parse_command_line(args):
+    parser = argparse.ArgumentParser(description = "Generate a synthetic ELF file")
+    parser.add_argument("-o", "--output", dest = "filename", required = True)
+    parser.add_argument("--symbols", type = int, default = 1000)
+    parser.add_argument("--sections", type = int, default = 16)
+    parser.add_argument("--relocations", type = int, default = 1000)
+    parser.add_argument("--payload", type = int, default = 1 << 20,
+                        help = "Size in bytes of the .text payload")
+    parser.add_argument("--seed", type = int, default = 0)
+    return parser.parse_args(args[1:])
+
+if __name__ == "__main__":
+    argtab = parse_command_line(sys.argv)
+    elfspec = ElfSpec(argtab.symbols, argtab.sections, argtab.relocations, argtab.payload,
+                      argtab.seed)
+    print(f"Writing {elfspec} to {argtab.filename}")
+    print(f"{generate(argtab.filename, elfspec)} bytes written")
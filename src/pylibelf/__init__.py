@@ -7,3 +7,17 @@
  ctypes based Python binding for elf.h
  Please see elf.h man page for definition of the enumerations and structures
 """
+
+def stats():
+    """
+    Snapshot of the per function libelf call statistics collected since
+    pylibelf.instrument.enable(), see pylibelf.instrument
+    """
+    # Imported here so that importing pylibelf stays cheap
+    import pylibelf.instrument # pylint: disable=import-outside-toplevel
+    return pylibelf.instrument.stats()
+
+def profiled():
+    """ Context manager measuring the libelf calls made inside it, see pylibelf.instrument """
+    import pylibelf.instrument # pylint: disable=import-outside-toplevel
+    return pylibelf.instrument.profiled()
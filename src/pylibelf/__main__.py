@@ -0,0 +1,13 @@
+"""
+ SPDX-License-Identifier: MIT
+
+ Copyright (C) 2023 Advanced Micro Devices, Inc.
+
+ Entry point of "python -m pylibelf", see pylibelf.readelf
+"""
+
+import sys
+
+import pylibelf.readelf
+
+sys.exit(pylibelf.readelf.main(sys.argv))
@@ -0,0 +1,48 @@
+"""
+ SPDX-License-Identifier: MIT
+
+ Copyright (C) 2023 Advanced Micro Devices, Inc.
+
+ Files replaced atomically: the contents go to a unique temporary file next
+ to the destination which is renamed over it once complete, so readers and
+ concurrent writers never see a partial file.
+"""
+
+import os
+import tempfile
+import contextlib
+
+def umask():
+    """ umask of the process, read without changing it where the system allows """
+    try:
+        with open("/proc/self/status", "r", encoding = "ascii") as handle:
+            for line in handle:
+                if (line.startswith("Umask:")):
+                    return int(line.split()[1], 8)
+    except OSError:
+        pass
+    # Setting is the only portable way of reading it
+    mask = os.umask(0o22)
+    os.umask(mask)
+    return mask
+
+@contextlib.contextmanager
+def atomic_file(filename, mode = "wb", **kwargs):
+    """
+    Context manager giving the file object to write filename through, opened
+    with mode and the open() keyword arguments. The file replaces filename
+    when the block completes and is removed if it raises. Like a file made by
+    open() its permissions follow the umask.
+    """
+    fd, tmpname = tempfile.mkstemp(dir = os.path.dirname(os.path.abspath(filename)))
+    try:
+        os.fchmod(fd, 0o666 & ~umask())
+        with os.fdopen(fd, mode, **kwargs) as handle:
+            fd = None
+            yield handle
+        os.replace(tmpname, filename)
+    except BaseException:
+        if (fd is not None):
+            os.close(fd)
+        os.remove(tmpname)
+        raise
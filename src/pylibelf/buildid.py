@@ -0,0 +1,139 @@
+"""
+ SPDX-License-Identifier: MIT
+
+ Copyright (C) 2023 Advanced Micro Devices, Inc.
+
+ Local build ID indexed store of ELF files, works like an offline debuginfod.
+ A directory tree is indexed once into an on-disk JSON map of build ID to
+ path which is later refreshed incrementally by only re-reading the files
+ whose size or mtime changed.
+"""
+
+import os
+import json
+
+import pylibelf.elf
+import pylibelf.atomic
+import pylibelf.libelf
+import pylibelf.notes
+import pylibelf.probe
+import pylibelf.sections
+
+_STORE_VERSION = 1
+
+def _has_debuginfo(melf):
+    section = pylibelf.sections.SectionIndex(melf).by_name(".debug_info")
+    return section is not None and section.type != pylibelf.elf.SHT_NOBITS
+
+def _scan_file(filename):
+    """ Return (build_id_hex, has_debuginfo) or None for files without build ID """
+    if (pylibelf.probe.probe(filename) is None):
+        return None
+    try:
+        melf = pylibelf.libelf.ElfDescriptor.fromfile(filename,
+                                                       pylibelf.libelf.Elf_Cmd.ELF_C_READ_MMAP)
+        build_id = pylibelf.notes.elf_build_id(melf)
+        if (build_id is None):
+            return None
+        return (build_id.hex(), _has_debuginfo(melf))
+    except (OSError, pylibelf.libelf.ElfError):
+        return None
+
+
+class BuildIdStore:
+    """
+    Build ID to path map persisted in a JSON file. Every indexed file is
+    recorded with its size and mtime, refresh() only rescans files whose
+    stat information has changed and drops files which have disappeared.
+    """
+    def __init__(self, storename):
+        self._storename = storename
+        self._roots = []
+        # path -> [mtime_ns, size, build_id, debuginfo]
+        self._files = {}
+        # build_id -> [path, ...]
+        self._index = {}
+        if (os.path.exists(storename)):
+            self._load()
+
+    def _load(self):
+        with open(self._storename, "r", encoding = "utf-8") as handle:
+            state = json.load(handle)
+        if (state.get("version") != _STORE_VERSION):
+            return
+        self._roots = state["roots"]
+        self._files = state["files"]
+        self._reindex()
+
+    def save(self):
+        state = {"version": _STORE_VERSION, "roots": self._roots, "files": self._files}
+        with pylibelf.atomic.atomic_file(self._storename, "w", encoding = "utf-8") as handle:
+            json.dump(state, handle)
+
+    def _reindex(self):
+        self._index = {}
+        for path, entry in self._files.items():
+            if (entry[2] is not None):
+                self._index.setdefault(entry[2], []).append(path)
+
+    def _walk(self, root):
+        for dirpath, _, filenames in os.walk(root):
+            for name in filenames:
+                yield os.path.join(dirpath, name)
+
+    def add_root(self, root):
+        """ Add a directory tree to the store and index it """
+        root = os.path.abspath(root)
+        if (root not in self._roots):
+            self._roots.append(root)
+        return self.refresh()
+
+    def refresh(self):
+        """
+        Incrementally bring the store in sync with the indexed trees. Returns the
+        number of files which were (re)scanned.
+        """
+        seen = set()
+        scanned = 0
+        for root in self._roots:
+            for path in self._walk(root):
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                seen.add(path)
+                entry = self._files.get(path)
+                if (entry is not None and entry[0] == stat.st_mtime_ns and entry[1] == stat.st_size):
+                    continue
+                scanned += 1
+                result = _scan_file(path)
+                if (result is None):
+                    self._files[path] = [stat.st_mtime_ns, stat.st_size, None, False]
+                else:
+                    self._files[path] = [stat.st_mtime_ns, stat.st_size, result[0], result[1]]
+
+        for path in list(self._files):
+            if (path not in seen):
+                del self._files[path]
+        self._reindex()
+        self.save()
+        return scanned
+
+    def find_by_build_id(self, build_id, debuginfo = None):
+        """
+        Return a path for the build ID given either as bytes or hex string, None if
+        not present in the store. With debuginfo True only files carrying .debug_info
+        are returned, with False only files without, e.g. stripped executables.
+        """
+        if (isinstance(build_id, (bytes, bytearray))):
+            build_id = build_id.hex()
+        for path in self._index.get(build_id.lower(), ()):
+            if (debuginfo is None or self._files[path][3] == debuginfo):
+                return path
+        return None
+
+    def __len__(self):
+        return len(self._index)
+
+    def __contains__(self, build_id):
+        return self.find_by_build_id(build_id) is not None
@@ -0,0 +1,317 @@
+"""
+ SPDX-License-Identifier: MIT
+
+ Copyright (C) 2023 Advanced Micro Devices, Inc.
+
+ On-disk cache of the parsed metadata of ELF files: section index, segment
+ map, symbol tables, dynamic entries and build ID. Entries are keyed by the
+ path, size, mtime and inode of the file and can also be found by build ID.
+ An entry is a flat file of native byte order arrays which is mmap'ed on
+ reopen, so a cached file is served without libelf parsing it again and
+ symbol columns are read in place without being decoded.
+"""
+
+import os
+import sys
+import mmap
+import array
+import struct
+import hashlib
+import collections
+
+import pylibelf.elf
+import pylibelf.atomic
+import pylibelf.libelf
+import pylibelf.notes
+import pylibelf.dynamic
+import pylibelf.sections
+import pylibelf.segments
+
+SymbolColumns = collections.namedtuple("SymbolColumns", ["name", "value", "size", "info",
+                                                         "other", "shndx"])
+
+_MAGIC = b"PYLIBELF"
+_VERSION = 2
+# Written natively, an entry made on a machine of the other byte order reads back swapped
+_BYTE_ORDER = 0x01020304
+_HEADER = struct.Struct("=8sIII")
+# Block name, array typecode, offset and length in bytes
+_TOC_ENTRY = struct.Struct("=24s1s7xQQ")
+_ALIGN = 8
+
+# (class, data) -> struct format of Elf*_Sym and where name, value, size, info, other
+# and shndx are in it
+_SYM_FORMATS = {
+    (pylibelf.elf.ELFCLASS32, pylibelf.elf.ELFDATA2LSB): ("<IIIBBH", (0, 1, 2, 3, 4, 5)),
+    (pylibelf.elf.ELFCLASS32, pylibelf.elf.ELFDATA2MSB): (">IIIBBH", (0, 1, 2, 3, 4, 5)),
+    (pylibelf.elf.ELFCLASS64, pylibelf.elf.ELFDATA2LSB): ("<IBBHQQ", (0, 4, 5, 1, 2, 3)),
+    (pylibelf.elf.ELFCLASS64, pylibelf.elf.ELFDATA2MSB): (">IBBHQQ", (0, 4, 5, 1, 2, 3))
+}
+
+# shndx holds the section index with SHN_XINDEX resolved, which can exceed 16 bits
+_SYM_TYPECODES = dict(zip(SymbolColumns._fields, "IQQBBI"))
+
+def _join(strings):
+    return "\0".join(strings).encode("utf-8")
+
+def _split(block):
+    return bytes(block).decode("utf-8").split("\0")
+
+def _symbol_blocks(melf, sections):
+    """ Blocks holding the columns of every symbol table and its raw string table """
+    ident = melf.gelf_getehdr().e_ident
+    layout, fields = _SYM_FORMATS[(ident[pylibelf.elf.EI_CLASS], ident[pylibelf.elf.EI_DATA])]
+    entsize = struct.calcsize(layout)
+    image = melf.elf_rawfile()
+    blocks = []
+    tables = [item for item in sections
+              if item.type in (pylibelf.elf.SHT_SYMTAB, pylibelf.elf.SHT_DYNSYM)]
+    for section in tables:
+        count = sections.file_size(section) // entsize
+        chunk = image[section.offset:section.offset + count * entsize]
+        columns = list(zip(*struct.iter_unpack(layout, chunk))) if count else [()] * 6
+        chunk.release()
+        xsection = sections.shndx_section(section.index)
+        if (xsection is not None):
+            msb = ident[pylibelf.elf.EI_DATA] == pylibelf.elf.ELFDATA2MSB
+            xindexes = pylibelf.sections.xindex_words(
+                image[xsection.offset:xsection.offset + sections.file_size(xsection)], msb)
+            columns[fields[5]] = pylibelf.sections.resolve_shndx(columns[fields[5]], xindexes)
+        for column, position in zip(SymbolColumns._fields, fields):
+            typecode = _SYM_TYPECODES[column]
+            blocks.append((f"sym.{section.index}.{column}", typecode,
+                           array.array(typecode, columns[position])))
+        strtab = sections[section.link]
+        blocks.append((f"sym.{section.index}.strtab", "B",
+                       image[strtab.offset:strtab.offset + sections.file_size(strtab)].tobytes()))
+    image.release()
+    return [section.index for section in tables], blocks
+
+def _collect(melf):
+    """ All the blocks of a cache entry for an open ElfDescriptor """
+    ehdr = melf.gelf_getehdr()
+    sections = pylibelf.sections.SectionIndex(melf)
+    segments = pylibelf.segments.SegmentIndex(melf, sections)
+    dynamic = list(pylibelf.dynamic.iter_dynamic(melf))
+    tables, symbols = _symbol_blocks(melf, sections)
+    build_id = pylibelf.notes.elf_build_id(melf) or b""
+
+    fields = pylibelf.sections.SectionInfo._fields[2:]
+    # (segment, section) pairs
+    segment_map = array.array("Q")
+    for item in segments.segments:
+        for index in segments.sections_in_segment(item.index):
+            segment_map.extend((item.index, index))
+    blocks = [
+        ("header", "Q", array.array("Q", [ehdr.e_ident[pylibelf.elf.EI_CLASS],
+                                          ehdr.e_ident[pylibelf.elf.EI_DATA],
+                                          ehdr.e_ident[pylibelf.elf.EI_OSABI],
+                                          ehdr.e_type, ehdr.e_machine, ehdr.e_entry,
+                                          ehdr.e_flags])),
+        ("build_id", "B", build_id),
+        ("section.names", "B", _join(item.name for item in sections)),
+        ("sections", "Q", array.array("Q", [getattr(item, field) for item in sections
+                                            for field in fields])),
+        ("segments", "Q", array.array("Q", [value for item in segments.segments
+                                            for value in item[1:]])),
+        ("segment.map", "Q", segment_map),
+        ("dynamic.tags", "q", array.array("q", [item.tag for item in dynamic])),
+        ("dynamic.values", "Q", array.array("Q", [item.value for item in dynamic])),
+        ("dynamic.has", "B", bytes(item.string is not None for item in dynamic)),
+        ("dynamic.strings", "B", _join(item.string for item in dynamic
+                                       if item.string is not None)),
+        ("symtabs", "Q", array.array("Q", tables))
+    ]
+    return blocks + symbols
+
+def _write_entry(filename, blocks):
+    """ Header, table of contents and the 8 byte aligned blocks, written atomically """
+    offset = _HEADER.size + _TOC_ENTRY.size * len(blocks)
+    toc = []
+    payload = []
+    for name, typecode, data in blocks:
+        data = memoryview(data).cast("B")
+        pad = -offset % _ALIGN
+        payload.append(bytes(pad))
+        offset += pad
+        toc.append(_TOC_ENTRY.pack(name.encode("ascii"), typecode.encode("ascii"), offset,
+                                   len(data)))
+        payload.append(data)
+        offset += len(data)
+    with pylibelf.atomic.atomic_file(filename) as handle:
+        handle.write(_HEADER.pack(_MAGIC, _VERSION, _BYTE_ORDER, len(blocks)))
+        handle.write(b"".join(toc))
+        for data in payload:
+            handle.write(data)
+
+class CachedMetadata:
+    """
+    Read only view of one cache entry. The numeric tables are memoryviews
+    into the mapped entry, the small ones are decoded into the same named
+    tuples pylibelf uses elsewhere.
+    """
+    def __init__(self, filename):
+        with open(filename, "rb") as handle:
+            self._map = mmap.mmap(handle.fileno(), 0, access = mmap.ACCESS_READ)
+        view = memoryview(self._map)
+        magic, version, order, count = _HEADER.unpack_from(view)
+        if (magic != _MAGIC or version != _VERSION or order != _BYTE_ORDER):
+            view.release()
+            self._map.close()
+            raise ValueError(f"{filename} is not a usable pylibelf cache entry")
+        self._blocks = {}
+        for index in range(count):
+            name, typecode, offset, size = _TOC_ENTRY.unpack_from(
+                view, _HEADER.size + index * _TOC_ENTRY.size)
+            self._blocks[name.rstrip(b"\0").decode("ascii")] = \
+                view[offset:offset + size].cast(typecode.decode("ascii"))
+        self._view = view
+
+        header = self._blocks["header"]
+        self.elfclass, self.data, self.osabi, self.type, self.machine, self.entry, \
+            self.flags = header.tolist()
+        self.build_id = bytes(self._blocks["build_id"]) or None
+        self.sections = self._sections()
+        self.segments = self._segments()
+        self.dynamic = self._dynamic()
+
+    def close(self):
+        """ Unmap the entry, the mapping stays until the last column from symbols() is gone """
+        for view in self._blocks.values():
+            view.release()
+        self._view.release()
+        self._blocks = {}
+        try:
+            self._map.close()
+        except BufferError:
+            pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def _sections(self):
+        values = self._blocks["sections"]
+        width = len(pylibelf.sections.SectionInfo._fields) - 2
+        names = _split(self._blocks["section.names"]) if values else []
+        return pylibelf.sections.SectionIndex.from_sections(
+            pylibelf.sections.SectionInfo(index, name, *values[index * width:(index + 1) * width])
+            for index, name in enumerate(names))
+
+    def _segments(self):
+        values = self._blocks["segments"]
+        width = len(pylibelf.segments.SegmentInfo._fields) - 1
+        return [pylibelf.segments.SegmentInfo(index, *values[index * width:(index + 1) * width])
+                for index in range(len(values) // width)]
+
+    def _dynamic(self):
+        strings = iter(_split(self._blocks["dynamic.strings"]))
+        return [pylibelf.dynamic.DynEntry(tag, value, next(strings) if has else None)
+                for tag, value, has in zip(self._blocks["dynamic.tags"],
+                                           self._blocks["dynamic.values"],
+                                           self._blocks["dynamic.has"])]
+
+    def sections_in_segment(self, index):
+        """ Section indices contained in the program header with the given index """
+        pairs = self._blocks["segment.map"]
+        return [pairs[pos + 1] for pos in range(0, len(pairs), 2) if pairs[pos] == index]
+
+    def symbol_tables(self):
+        """ Section indices of the SHT_SYMTAB and SHT_DYNSYM sections """
+        return self._blocks["symtabs"].tolist()
+
+    def symbols(self, section):
+        """
+        SymbolColumns of memoryviews over the symbols of the table with the
+        given index. They are views of their own which stay valid after close().
+        """
+        # Slices are new views, close() only releases the ones of the entry
+        return SymbolColumns(*[self._blocks[f"sym.{section}.{column}"][:]
+                               for column in SymbolColumns._fields])
+
+    def symbol_names(self, section):
+        """ List of the names of all the symbols of the table with the given index """
+        strtab = self._blocks[f"sym.{section}.strtab"].tobytes()
+        result = []
+        for offset in self._blocks[f"sym.{section}.name"]:
+            end = strtab.find(b"\0", offset)
+            result.append(strtab[offset:end if end >= 0 else len(strtab)].decode("utf-8",
+                                                                                "replace"))
+        return result
+
+class MetadataCache:
+    """
+    Cache rooted at a directory. entries/ holds one entry per (path, size,
+    mtime, inode) and build-id/ maps build IDs to the entry key.
+    """
+    def __init__(self, root):
+        self._root = root
+        os.makedirs(os.path.join(root, "entries"), exist_ok = True)
+        os.makedirs(os.path.join(root, "build-id"), exist_ok = True)
+
+    @staticmethod
+    def _key(path, stat):
+        source = f"{path}\0{stat.st_size}\0{stat.st_mtime_ns}\0{stat.st_ino}\0{stat.st_dev}"
+        return hashlib.sha256(source.encode("utf-8", "surrogateescape")).hexdigest()
+
+    def _entry(self, key):
+        return os.path.join(self._root, "entries", key[:2], key[2:])
+
+    def _build_id(self, build_id):
+        if (isinstance(build_id, (bytes, bytearray))):
+            build_id = build_id.hex()
+        return os.path.join(self._root, "build-id", build_id.lower())
+
+    def lookup(self, path):
+        """ CachedMetadata of the file as it is now or None if it is not cached """
+        path = os.path.realpath(path)
+        entry = self._entry(self._key(path, os.stat(path)))
+        return CachedMetadata(entry) if os.path.exists(entry) else None
+
+    def lookup_build_id(self, build_id):
+        """ CachedMetadata of the last file added with the build ID, bytes or hex, or None """
+        try:
+            with open(self._build_id(build_id), "r", encoding = "utf-8") as handle:
+                key = handle.read().strip()
+        except FileNotFoundError:
+            return None
+        entry = self._entry(key)
+        return CachedMetadata(entry) if os.path.exists(entry) else None
+
+    def add(self, path):
+        """ Parse the file with libelf and store its entry, returns the CachedMetadata """
+        path = os.path.realpath(path)
+        stat = os.stat(path)
+        melf = pylibelf.libelf.ElfDescriptor.fromfile(path, pylibelf.libelf.Elf_Cmd.ELF_C_READ_MMAP)
+        if (melf.elf_kind() != pylibelf.libelf.Elf_Kind.ELF_K_ELF):
+            raise ValueError(f"{path} is not an ELF file")
+        blocks = _collect(melf)
+        del melf
+        key = self._key(path, stat)
+        entry = self._entry(key)
+        if (self._key(path, os.stat(path)) != key):
+            # Changed while being parsed, do not cache what may be a mix of both
+            raise ValueError(f"{path} changed while it was being cached")
+        os.makedirs(os.path.dirname(entry), exist_ok = True)
+        _write_entry(entry, blocks)
+        metadata = CachedMetadata(entry)
+        if (metadata.build_id is not None):
+            with pylibelf.atomic.atomic_file(self._build_id(metadata.build_id), "w",
+                                             encoding = "utf-8") as handle:
+                handle.write(key)
+        return metadata
+
+    def open(self, path):
+        """ CachedMetadata of the file, parsed and added to the cache on a miss """
+        metadata = self.lookup(path)
+        return metadata if metadata is not None else self.add(path)
+
+if __name__ == "__main__":
+    store = MetadataCache(sys.argv[1])
+    for item in sys.argv[2:]:
+        with store.open(item) as cached:
+            print(f"{item}: {len(cached.sections)} sections "
+                  f"{sum(len(cached.symbols(table).value) for table in cached.symbol_tables())} "
+                  f"symbols {len(cached.dynamic)} dynamic entries")
@@ -0,0 +1,122 @@
+"""
+ SPDX-License-Identifier: MIT
+
+ Copyright (C) 2023 Advanced Micro Devices, Inc.
+
+ In-process structural comparison of two ELF files. Headers, program
+ headers, section headers, symbols and relocations are compared field by
+ field through libelf and the differences reported with their location.
+"""
+
+import itertools
+import collections
+
+import pylibelf.elf
+import pylibelf.libelf
+import pylibelf.sections
+import pylibelf.segments
+
+Difference = collections.namedtuple("Difference", ["where", "left", "right"])
+
+def _fields(struct):
+    return [item[0] for item in struct._fields_]
+
+_EHDR_FIELDS = [item for item in _fields(pylibelf.elf.Elf64_Ehdr) if item != "e_ident"]
+_SYM_FIELDS = _fields(pylibelf.elf.Elf64_Sym)
+_RELA_FIELDS = _fields(pylibelf.elf.Elf64_Rela)
+_REL_FIELDS = _fields(pylibelf.elf.Elf64_Rel)
+
+# Decoder and fields of the table sections compared entry by entry
+_TABLES = {
+    pylibelf.elf.SHT_SYMTAB: (pylibelf.libelf.gelf_getsym, _SYM_FIELDS),
+    pylibelf.elf.SHT_DYNSYM: (pylibelf.libelf.gelf_getsym, _SYM_FIELDS),
+    pylibelf.elf.SHT_RELA:   (pylibelf.libelf.gelf_getrela, _RELA_FIELDS),
+    pylibelf.elf.SHT_REL:    (pylibelf.libelf.gelf_getrel, _REL_FIELDS)
+}
+
+# Metadata sections whose data is always compared, other data only on request
+_METADATA = {pylibelf.elf.SHT_STRTAB, pylibelf.elf.SHT_HASH, pylibelf.elf.SHT_DYNAMIC,
+             pylibelf.elf.SHT_NOTE, pylibelf.elf.SHT_GNU_HASH, pylibelf.elf.SHT_GNU_verdef,
+             pylibelf.elf.SHT_GNU_verneed, pylibelf.elf.SHT_GNU_versym}
+
+def _compare_records(where, left, right, fields):
+    for field in fields:
+        lvalue = getattr(left, field)
+        rvalue = getattr(right, field)
+        if (lvalue != rvalue):
+            yield Difference(f"{where}.{field}", lvalue, rvalue)
+
+def _data_bytes(melf, index):
+    data = melf.elf_getscn(index).elf_getdata()
+    return data, melf.string_at(data.contents.d_buf, data.contents.d_size)
+
+def _compare_table(where, left, right, section):
+    decoder, fields = _TABLES[section.type]
+    ldata, lbytes = _data_bytes(left, section.index)
+    rdata, rbytes = _data_bytes(right, section.index)
+    # Identical tables are the common case, only decode entries when the bytes differ
+    if (lbytes == rbytes):
+        return
+    lcount = len(lbytes) // section.entsize if section.entsize else 0
+    rcount = len(rbytes) // section.entsize if section.entsize else 0
+    if (lcount != rcount):
+        yield Difference(f"{where}.count", lcount, rcount)
+    for index in range(min(lcount, rcount)):
+        yield from _compare_records(f"{where}[{index}]", decoder(ldata, index),
+                                    decoder(rdata, index), fields)
+
+def iter_differences(left, right, contents = False):
+    """
+    Generator over the Difference tuples between the two ElfDescriptors. With
+    contents True the data of every section is compared, otherwise only the
+    symbol, relocation and other metadata sections are.
+    """
+    lclass = left.gelf_getclass()
+    rclass = right.gelf_getclass()
+    if (lclass != rclass):
+        yield Difference("class", lclass, rclass)
+        return
+
+    lehdr = left.gelf_getehdr()
+    rehdr = right.gelf_getehdr()
+    if (bytes(lehdr.e_ident) != bytes(rehdr.e_ident)):
+        yield Difference("ehdr.e_ident", bytes(lehdr.e_ident), bytes(rehdr.e_ident))
+    yield from _compare_records("ehdr", lehdr, rehdr, _EHDR_FIELDS)
+
+    lphdrs = list(pylibelf.segments.iter_phdrs(left))
+    rphdrs = list(pylibelf.segments.iter_phdrs(right))
+    if (len(lphdrs) != len(rphdrs)):
+        yield Difference("phdr.count", len(lphdrs), len(rphdrs))
+    for lphdr, rphdr in zip(lphdrs, rphdrs):
+        yield from _compare_records(f"phdr[{lphdr.index}]", lphdr, rphdr, lphdr._fields)
+
+    lsections = pylibelf.sections.SectionIndex(left)
+    rsections = pylibelf.sections.SectionIndex(right)
+    if (len(lsections) != len(rsections)):
+        yield Difference("section.count", len(lsections), len(rsections))
+    for lsection, rsection in zip(lsections, rsections):
+        where = f"section[{lsection.index}]({lsection.name})"
+        headers = list(_compare_records(where, lsection, rsection, lsection._fields))
+        yield from headers
+        if (headers or lsection.type == pylibelf.elf.SHT_NOBITS):
+            continue
+        if (lsection.type in _TABLES):
+            yield from _compare_table(where, left, right, lsection)
+        elif (contents or lsection.type in _METADATA):
+            lbytes = _data_bytes(left, lsection.index)[1]
+            rbytes = _data_bytes(right, rsection.index)[1]
+            if (lbytes != rbytes):
+                offset = next(pos for pos, (lbyte, rbyte) in
+                              enumerate(itertools.zip_longest(lbytes, rbytes)) if lbyte != rbyte)
+                yield Difference(f"{where}.data[{offset}]", lbytes[offset:offset + 16],
+                                 rbytes[offset:offset + 16])
+
+def compare_elf(leftname, rightname, limit = 10, contents = False):
+    """ Return up to limit Difference tuples between the two ELF files, empty if they match """
+    mode = pylibelf.libelf.Elf_Cmd.ELF_C_READ_MMAP
+    left = pylibelf.libelf.ElfDescriptor.fromfile(leftname, mode)
+    right = pylibelf.libelf.ElfDescriptor.fromfile(rightname, mode)
+    return list(itertools.islice(iter_differences(left, right, contents), limit))
+
+def format_differences(differences):
+    return "\n".join(f"  {item.where}: {item.left} != {item.right}" for item in differences)
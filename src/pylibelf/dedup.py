@@ -0,0 +1,188 @@
+"""
+ SPDX-License-Identifier: MIT
+
+ Copyright (C) 2023 Advanced Micro Devices, Inc.
+
+ Content-addressed section store. ELF files are split along their sections
+ into objects named by their sha256 plus a small JSON manifest, sections
+ shared between files are stored once. The bytes in between sections (ELF
+ header, program and section header tables, padding) are stored the same
+ way so files are rebuilt bit for bit from the manifest.
+"""
+
+import os
+import sys
+import json
+import hashlib
+import argparse
+import collections
+
+import pylibelf.atomic
+import pylibelf.libelf
+import pylibelf.sections
+
+DedupStats = collections.namedtuple("DedupStats", ["files", "chunks", "unique_chunks",
+                                                   "logical_size", "stored_size", "ratio"])
+
+_MANIFEST_VERSION = 1
+
+def _write_atomic(filename, data):
+    # A unique temporary name so concurrent writers of the same file do not collide
+    with pylibelf.atomic.atomic_file(filename) as handle:
+        handle.write(data)
+
+class SectionStore:
+    """
+    Store rooted at a directory holding objects/ with the section contents
+    and manifests/ with one manifest per added file. A manifest lists the
+    (size, sha256) chunks which concatenated give back the original file
+    and the permission bits the file had.
+    """
+    def __init__(self, root):
+        self._root = root
+        os.makedirs(os.path.join(root, "objects"), exist_ok = True)
+        os.makedirs(os.path.join(root, "manifests"), exist_ok = True)
+
+    def _object(self, digest):
+        return os.path.join(self._root, "objects", digest[:2], digest[2:])
+
+    def _manifest(self, name):
+        if (not name or os.sep in name or name.startswith(".")):
+            raise ValueError(f"Invalid manifest name {name!r}")
+        return os.path.join(self._root, "manifests", name + ".json")
+
+    def _put(self, chunks, view, digest = None):
+        """ Append the chunk entry and store the bytes unless present, returns bytes stored """
+        if (digest is None):
+            digest = hashlib.sha256(view).hexdigest()
+        chunks.append([len(view), digest])
+        objname = self._object(digest)
+        if (os.path.exists(objname)):
+            return 0
+        os.makedirs(os.path.dirname(objname), exist_ok = True)
+        _write_atomic(objname, view)
+        return len(view)
+
+    def add(self, filename, name = None, max_workers = None):
+        """
+        Split the ELF file into the store under the given manifest name, the file
+        basename by default. Returns the number of bytes newly stored. Raises
+        ValueError if a different file is already stored under that name.
+        """
+        if (name is None):
+            name = os.path.basename(filename)
+        melf = pylibelf.libelf.ElfDescriptor.fromfile(filename,
+                                                      pylibelf.libelf.Elf_Cmd.ELF_C_READ_MMAP)
+        image = melf.elf_rawfile()
+        checksum = hashlib.sha256(image).hexdigest()
+        if (os.path.exists(self._manifest(name)) and
+            self.manifest(name)["sha256"] != checksum):
+            image.release()
+            raise ValueError(f"A different file is already stored as {name}")
+        # The sha256 section hashes double as the object names
+        hashes = melf.fingerprint("sha256", max_workers = max_workers).sections
+        index = pylibelf.sections.SectionIndex(melf)
+        chunks = []
+        stored = 0
+        pos = 0
+        for section in sorted(index, key = lambda item: item.offset):
+            size = index.file_size(section)
+            end = min(section.offset + size, len(image))
+            if (size == 0 or end <= pos):
+                continue
+            if (section.offset < pos):
+                # Overlaps the previous section, only store the tail
+                stored += self._put(chunks, image[pos:end])
+            else:
+                if (section.offset > pos):
+                    stored += self._put(chunks, image[pos:section.offset])
+                digest = hashes[section.index] if end == section.offset + size else None
+                stored += self._put(chunks, image[section.offset:end], digest)
+            pos = end
+        if (pos < len(image)):
+            stored += self._put(chunks, image[pos:])
+
+        manifest = {"version": _MANIFEST_VERSION, "name": name, "size": len(image),
+                    "sha256": checksum, "chunks": chunks,
+                    "mode": os.stat(filename).st_mode & 0o7777}
+        image.release()
+        _write_atomic(self._manifest(name), json.dumps(manifest).encode("utf-8"))
+        return stored
+
+    def manifest(self, name):
+        with open(self._manifest(name), "r", encoding = "utf-8") as handle:
+            return json.load(handle)
+
+    def names(self):
+        """ Names of all the files in the store """
+        return sorted(item[:-len(".json")] for item in
+                      os.listdir(os.path.join(self._root, "manifests")) if item.endswith(".json"))
+
+    def rebuild(self, name, filename):
+        """
+        Write back the file stored under name with the permissions it was
+        added with, raises ValueError if it does not verify
+        """
+        manifest = self.manifest(name)
+        checksum = hashlib.sha256()
+        with pylibelf.atomic.atomic_file(filename) as handle:
+            for size, digest in manifest["chunks"]:
+                with open(self._object(digest), "rb") as objhandle:
+                    data = objhandle.read()
+                if (len(data) != size):
+                    raise ValueError(f"Object {digest} of {name} is corrupt")
+                checksum.update(data)
+                handle.write(data)
+            if (checksum.hexdigest() != manifest["sha256"]):
+                raise ValueError(f"Rebuilt {name} does not match its manifest")
+            if ("mode" in manifest):
+                # Manifests written before the mode was recorded keep the umask default
+                os.fchmod(handle.fileno(), manifest["mode"])
+
+    def stats(self):
+        """ DedupStats of the whole store, ratio is the logical over the stored size """
+        files = 0
+        chunks = 0
+        logical = 0
+        stored = 0
+        unique = {}
+        for name in self.names():
+            manifest = self.manifest(name)
+            files += 1
+            logical += manifest["size"]
+            stored += os.path.getsize(self._manifest(name))
+            chunks += len(manifest["chunks"])
+            for size, digest in manifest["chunks"]:
+                unique[digest] = size
+        stored += sum(unique.values())
+        return DedupStats(files, chunks, len(unique), logical, stored,
+                          logical / stored if stored else 0.0)
+
+def parse_command_line(args):
+    parser = argparse.ArgumentParser(description = "Content-addressed ELF section store")
+    parser.add_argument("-s", "--store", required = True, help = "Store directory")
+    commands = parser.add_subparsers(dest = "command", required = True)
+    add = commands.add_parser("add", help = "Add ELF files to the store")
+    add.add_argument("-n", "--name", help = "Manifest name of a single file, its basename "
+                     "by default")
+    add.add_argument("files", nargs = "+")
+    rebuild = commands.add_parser("rebuild", help = "Rebuild a file from the store")
+    rebuild.add_argument("name")
+    rebuild.add_argument("output")
+    commands.add_parser("stats", help = "Print the dedup ratio of the store")
+    argtab = parser.parse_args(args[1:])
+    if (argtab.command == "add" and argtab.name is not None and len(argtab.files) > 1):
+        parser.error("--name needs exactly one file")
+    return argtab
+
+if __name__ == "__main__":
+    argtab = parse_command_line(sys.argv)
+    store = SectionStore(argtab.store)
+    if (argtab.command == "add"):
+        for item in argtab.files:
+            print(f"{item}: {store.add(item, argtab.name)} new bytes")
+    elif (argtab.command == "rebuild"):
+        store.rebuild(argtab.name, argtab.output)
+    result = store.stats()
+    print(f"{result.files} files {result.logical_size} bytes stored in {result.stored_size} "
+          f"bytes, {result.unique_chunks}/{result.chunks} unique chunks, ratio {result.ratio:.2f}")
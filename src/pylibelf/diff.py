@@ -0,0 +1,193 @@
+"""
+ SPDX-License-Identifier: MIT
+
+ Copyright (C) 2023 Advanced Micro Devices, Inc.
+
+ Section level diff of two ELF files. The payload of every section is hashed
+ straight from an mmap of each file on a thread pool, sections are matched
+ by name and only the symbol tables whose hashes differ are decoded to
+ report symbol level changes.
+"""
+
+import os
+import sys
+import mmap
+import struct
+import hashlib
+import argparse
+import collections
+import concurrent.futures
+
+import pylibelf.elf
+import pylibelf.libelf
+import pylibelf.sections
+
+SectionChange = collections.namedtuple("SectionChange", ["name", "change", "left", "right"])
+SymbolChange = collections.namedtuple("SymbolChange", ["section", "name", "change", "left",
+                                                       "right"])
+SymbolInfo = collections.namedtuple("SymbolInfo", ["value", "size"])
+
+ADDED = "added"
+REMOVED = "removed"
+CHANGED = "changed"
+MOVED = "moved"
+RESIZED = "resized"
+
+# Elf32_Sym and Elf64_Sym layouts, only the name, value and size are used
+_SYM_FORMATS = {
+    (pylibelf.elf.ELFCLASS32, pylibelf.elf.ELFDATA2LSB): ("<IIIBBH", 0, 1, 2),
+    (pylibelf.elf.ELFCLASS32, pylibelf.elf.ELFDATA2MSB): (">IIIBBH", 0, 1, 2),
+    (pylibelf.elf.ELFCLASS64, pylibelf.elf.ELFDATA2LSB): ("<IBBHQQ", 0, 4, 5),
+    (pylibelf.elf.ELFCLASS64, pylibelf.elf.ELFDATA2MSB): (">IBBHQQ", 0, 4, 5)
+}
+
+class _ElfFile:
+    """ Section index and read only mapping of one side of the diff """
+    def __init__(self, filename):
+        self._filehandle = open(filename, "rb")
+        size = os.fstat(self._filehandle.fileno()).st_size
+        self._map = mmap.mmap(self._filehandle.fileno(), size, access = mmap.ACCESS_READ)
+        self.view = memoryview(self._map)
+        melf = pylibelf.libelf.ElfDescriptor.fromfile(filename,
+                                                      pylibelf.libelf.Elf_Cmd.ELF_C_READ_MMAP)
+        ident = melf.gelf_getehdr().e_ident
+        self.layout = _SYM_FORMATS[(ident[pylibelf.elf.EI_CLASS], ident[pylibelf.elf.EI_DATA])]
+        self.sections = pylibelf.sections.SectionIndex(melf)
+
+    def close(self):
+        self.view.release()
+        self._map.close()
+        self._filehandle.close()
+
+    def payload(self, section):
+        size = self.sections.file_size(section)
+        return self.view[section.offset:section.offset + size]
+
+    def keyed(self):
+        """ Sections keyed by name and occurrence so repeated names pair up in order """
+        seen = collections.Counter()
+        result = {}
+        for section in self.sections:
+            if (section.index == 0):
+                continue
+            result[(section.name, seen[section.name])] = section
+            seen[section.name] += 1
+        return result
+
+    def symbols(self, section):
+        """ Symbols of a SHT_SYMTAB/SHT_DYNSYM section keyed by name and occurrence """
+        layout, name_at, value_at, size_at = self.layout
+        strtab = self.payload(self.sections[section.link]).tobytes()
+        seen = collections.Counter()
+        result = {}
+        # Entry 0 is the reserved null symbol
+        for entry in struct.iter_unpack(layout, self.payload(section)[struct.calcsize(layout):]):
+            offset = entry[name_at]
+            stop = strtab.find(b"\0", offset)
+            name = strtab[offset:stop if stop >= 0 else len(strtab)].decode("utf-8", "replace")
+            result[(name, seen[name])] = SymbolInfo(entry[value_at], entry[size_at])
+            seen[name] += 1
+        return result
+
+def _hash(view):
+    # hashlib drops the GIL for large buffers so the pool hashes in parallel
+    return hashlib.blake2b(view, digest_size = 20).digest()
+
+def _diff_symbols(name, left, right):
+    changes = []
+    for key, lsym in left.items():
+        rsym = right.get(key)
+        if (rsym is None):
+            changes.append(SymbolChange(name, key[0], REMOVED, lsym, None))
+            continue
+        if (lsym.value != rsym.value):
+            changes.append(SymbolChange(name, key[0], MOVED, lsym, rsym))
+        if (lsym.size != rsym.size):
+            changes.append(SymbolChange(name, key[0], RESIZED, lsym, rsym))
+    for key, rsym in right.items():
+        if (key not in left):
+            changes.append(SymbolChange(name, key[0], ADDED, None, rsym))
+    return changes
+
+class ElfDiff:
+    """
+    Differences between two ELF files: .sections is a list of SectionChange
+    and .symbols a list of SymbolChange for the symbol tables which differ.
+    Sections are compared by their header and payload hash, the file offset
+    alone moving does not make a section changed.
+    """
+    def __init__(self, leftname, rightname, max_workers = None):
+        self.sections = []
+        self.symbols = []
+        left = _ElfFile(leftname)
+        try:
+            right = _ElfFile(rightname)
+            try:
+                self._diff(left, right, max_workers)
+            finally:
+                right.close()
+        finally:
+            left.close()
+
+    def __bool__(self):
+        return bool(self.sections or self.symbols)
+
+    def _diff(self, left, right, max_workers):
+        lkeyed = left.keyed()
+        rkeyed = right.keyed()
+        common = [key for key in lkeyed if key in rkeyed]
+        with concurrent.futures.ThreadPoolExecutor(max_workers = max_workers) as executor:
+            lhashes = executor.map(_hash, [left.payload(lkeyed[key]) for key in common])
+            rhashes = executor.map(_hash, [right.payload(rkeyed[key]) for key in common])
+            changed = [key for key, lhash, rhash in zip(common, lhashes, rhashes)
+                       if lhash != rhash or not _same_header(lkeyed[key], rkeyed[key])]
+
+        for key, section in lkeyed.items():
+            if (key not in rkeyed):
+                self.sections.append(SectionChange(key[0], REMOVED, section, None))
+        for key in changed:
+            lsection = lkeyed[key]
+            rsection = rkeyed[key]
+            self.sections.append(SectionChange(key[0], CHANGED, lsection, rsection))
+            if (lsection.type in (pylibelf.elf.SHT_SYMTAB, pylibelf.elf.SHT_DYNSYM)
+                and lsection.type == rsection.type):
+                self.symbols += _diff_symbols(key[0], left.symbols(lsection),
+                                              right.symbols(rsection))
+        for key, section in rkeyed.items():
+            if (key not in lkeyed):
+                self.sections.append(SectionChange(key[0], ADDED, None, section))
+
+    def __str__(self):
+        lines = []
+        for item in self.sections:
+            section = item.right if item.right is not None else item.left
+            lines.append(f"{item.change:8} section {item.name} size {hex(section.size)}")
+        for item in self.symbols:
+            before = "" if item.left is None else f"{hex(item.left.value)}/{item.left.size}"
+            after = "" if item.right is None else f"{hex(item.right.value)}/{item.right.size}"
+            lines.append(f"{item.change:8} symbol  {item.section}:{item.name} {before} -> {after}")
+        return "\n".join(lines)
+
+def _same_header(left, right):
+    """ Compare section headers ignoring the position fields which shift with other sections """
+    return (left.type, left.flags, left.addr, left.size, left.addralign, left.entsize) == \
+        (right.type, right.flags, right.addr, right.size, right.addralign, right.entsize)
+
+def diff_elf(leftname, rightname, max_workers = None):
+    """ Return the ElfDiff of the two ELF files """
+    return ElfDiff(leftname, rightname, max_workers)
+
+def parse_command_line(args):
+    parser = argparse.ArgumentParser(description = "Section level diff of two ELF files")
+    parser.add_argument("left")
+    parser.add_argument("right")
+    parser.add_argument("-j", "--jobs", type = int, default = None,
+                        help = "Number of hashing threads")
+    return parser.parse_args(args[1:])
+
+if __name__ == "__main__":
+    argtab = parse_command_line(sys.argv)
+    result = diff_elf(argtab.left, argtab.right, argtab.jobs)
+    if (result):
+        print(result)
+    sys.exit(1 if result else 0)
@@ -0,0 +1,260 @@
+"""
+ SPDX-License-Identifier: MIT
+
+ Copyright (C) 2023 Advanced Micro Devices, Inc.
+
+ Reader for the .dynamic section and a parallel shared library dependency
+ graph resolver built on top of it
+"""
+
+import os
+import glob
+import ctypes
+import functools
+import collections
+import concurrent.futures
+
+import pylibelf.elf
+import pylibelf.libelf
+import pylibelf.probe
+import pylibelf.segments
+
+DynEntry = collections.namedtuple("DynEntry", ["tag", "value", "string"])
+
+DynamicInfo = collections.namedtuple("DynamicInfo", ["elfclass", "machine", "soname",
+                                                     "needed", "rpath", "runpath"])
+
+# Tags whose d_val is an offset into the DT_STRTAB string table
+_STRING_TAGS = frozenset([pylibelf.elf.DT_NEEDED, pylibelf.elf.DT_SONAME,
+                          pylibelf.elf.DT_RPATH, pylibelf.elf.DT_RUNPATH])
+
+def _find_dynamic(melf):
+    scn = melf.elf_nextscn(None)
+    while (scn is not None):
+        shdr = scn.gelf_getshdr()
+        if (shdr.sh_type == pylibelf.elf.SHT_DYNAMIC):
+            return scn, shdr
+        scn = melf.elf_nextscn(scn)
+    return None, None
+
+def _find_strtab(melf, addr, default):
+    """ Index of the section loaded at the DT_STRTAB address, sh_link of .dynamic otherwise """
+    scn = melf.elf_nextscn(None)
+    while (scn is not None):
+        shdr = scn.gelf_getshdr()
+        if (shdr.sh_type == pylibelf.elf.SHT_STRTAB and shdr.sh_addr == addr):
+            return scn.elf_ndxscn()
+        scn = melf.elf_nextscn(scn)
+    return default
+
+def _dyn_entsize(melf):
+    if (melf.gelf_getclass() == pylibelf.elf.ELFCLASS64):
+        return ctypes.sizeof(pylibelf.elf.Elf64_Dyn)
+    return ctypes.sizeof(pylibelf.elf.Elf32_Dyn)
+
+def _segment_strings(melf, addr, size):
+    """ DT_STRTAB of a file without section headers read through the segment holding it """
+    offset = pylibelf.segments.SegmentIndex(melf).vaddr_to_offset(addr) if addr else None
+    if (offset is None or not size):
+        return None
+    return melf.read_range(offset, size)
+
+def _segment_string(strings, offset):
+    if (strings is None):
+        return None
+    end = strings.find(b"\0", offset)
+    return strings[offset:end if end >= 0 else len(strings)].decode("utf-8", "replace")
+
+def iter_dynamic(melf):
+    """
+    Generator over the entries of the .dynamic section up to DT_NULL. Yields
+    DynEntry tuples; string valued tags (DT_NEEDED, DT_SONAME, DT_RPATH and
+    DT_RUNPATH) carry the string resolved through DT_STRTAB, others None.
+    Files without section headers are read through the PT_DYNAMIC segment.
+    """
+    scn, shdr = _find_dynamic(melf)
+    if (scn is not None):
+        data = scn.elf_getdata()
+        size = shdr.sh_size
+        entsize = shdr.sh_entsize or _dyn_entsize(melf)
+    else:
+        segment = next((item for item in pylibelf.segments.iter_phdrs(melf)
+                        if item.type == pylibelf.elf.PT_DYNAMIC and item.filesz), None)
+        if (segment is None):
+            return
+        size = segment.filesz
+        entsize = _dyn_entsize(melf)
+        data = melf.elf_getdata_rawchunk(segment.offset, size - size % entsize,
+                                         pylibelf.libelf.Elf_Type.ELF_T_DYN)
+    entries = []
+    strtab_addr = None
+    strtab_size = 0
+    for index in range(size // entsize):
+        dyn = pylibelf.libelf.gelf_getdyn(data, index)
+        if (dyn.d_tag == pylibelf.elf.DT_NULL):
+            break
+        if (dyn.d_tag == pylibelf.elf.DT_STRTAB):
+            strtab_addr = dyn.d_un.d_ptr
+        elif (dyn.d_tag == pylibelf.elf.DT_STRSZ):
+            strtab_size = dyn.d_un.d_val
+        entries.append((dyn.d_tag, dyn.d_un.d_val))
+    if (scn is not None):
+        strndx = shdr.sh_link
+        if (strtab_addr is not None):
+            strndx = _find_strtab(melf, strtab_addr, shdr.sh_link)
+        lookup = functools.partial(melf.elf_strptr, strndx)
+    else:
+        lookup = functools.partial(_segment_string,
+                                   _segment_strings(melf, strtab_addr, strtab_size))
+    for tag, value in entries:
+        yield DynEntry(tag, value, lookup(value) if tag in _STRING_TAGS else None)
+
+def read_dynamic(filename):
+    """ Summarize the dynamic linking information of the given file as DynamicInfo """
+    melf = pylibelf.libelf.ElfDescriptor.fromfile(filename, pylibelf.libelf.Elf_Cmd.ELF_C_READ_MMAP)
+    ehdr = melf.gelf_getehdr()
+    soname = None
+    needed = []
+    rpath = []
+    runpath = []
+    for entry in iter_dynamic(melf):
+        if (entry.string is None):
+            # Not a string tag or DT_STRTAB outside of every segment
+            continue
+        if (entry.tag == pylibelf.elf.DT_NEEDED):
+            needed.append(entry.string)
+        elif (entry.tag == pylibelf.elf.DT_SONAME):
+            soname = entry.string
+        elif (entry.tag == pylibelf.elf.DT_RPATH):
+            rpath.extend(entry.string.split(":"))
+        elif (entry.tag == pylibelf.elf.DT_RUNPATH):
+            runpath.extend(entry.string.split(":"))
+    return DynamicInfo(melf.gelf_getclass(), ehdr.e_machine, soname, needed, rpath, runpath)
+
+
+def _elf_identity(filename):
+    """ (class, machine) read straight from the ELF header or None if not an ELF file """
+    header = pylibelf.probe.probe(filename)
+    return (header.elfclass, header.machine) if header is not None else None
+
+def _parse_ld_so_conf(filename, dirs):
+    try:
+        with open(filename, "r", encoding = "utf-8") as handle:
+            lines = handle.read().splitlines()
+    except OSError:
+        return
+    for line in lines:
+        line = line.split("#", 1)[0].strip()
+        if (not line):
+            continue
+        if (line.startswith("include ")):
+            pattern = line.split(None, 1)[1]
+            if (not os.path.isabs(pattern)):
+                pattern = os.path.join(os.path.dirname(filename), pattern)
+            for name in sorted(glob.glob(pattern)):
+                _parse_ld_so_conf(name, dirs)
+        elif (line not in dirs):
+            dirs.append(line)
+
+def default_search_paths():
+    """ Trusted directories of the dynamic loader, from /etc/ld.so.conf and the builtin defaults """
+    dirs = []
+    _parse_ld_so_conf("/etc/ld.so.conf", dirs)
+    for name in ["/lib64", "/usr/lib64", "/lib", "/usr/lib"]:
+        if (name not in dirs):
+            dirs.append(name)
+    return dirs
+
+
+class DependencyGraph:
+    """
+    Result of DependencyResolver.resolve(). edges maps every visited file to
+    the list of resolved paths of its DT_NEEDED entries in order, missing maps
+    files to the DT_NEEDED names which could not be found.
+    """
+    def __init__(self):
+        self.edges = {}
+        self.missing = {}
+        self.info = {}
+
+    def closure(self, path):
+        """ Transitive set of shared libraries needed by path """
+        seen = set()
+        pending = list(self.edges.get(os.path.realpath(path), []))
+        while (pending):
+            curr = pending.pop()
+            if (curr in seen):
+                continue
+            seen.add(curr)
+            pending.extend(self.edges.get(curr, []))
+        return seen
+
+
+class DependencyResolver:
+    """
+    Compute the transitive shared library dependency graph for a set of
+    binaries. Library lookup follows the dynamic loader order: DT_RPATH
+    (ignored when DT_RUNPATH is present), LD_LIBRARY_PATH, DT_RUNPATH and
+    finally the trusted directories. Every unique file is parsed exactly once
+    and each wave of newly discovered files is parsed on a thread pool.
+    """
+    def __init__(self, search_paths = None, ld_library_path = None, max_workers = None):
+        self._search_paths = search_paths if search_paths is not None else default_search_paths()
+        self._ld_library_path = [item for item in (ld_library_path or "").split(":") if item]
+        self._max_workers = max_workers
+        self._identity = {}
+
+    def _compatible(self, path, identity):
+        if (path not in self._identity):
+            self._identity[path] = _elf_identity(path)
+        return self._identity[path] == identity
+
+    def _expand(self, dirs, origin):
+        for item in dirs:
+            yield item.replace("$ORIGIN", origin).replace("${ORIGIN}", origin)
+
+    def _lookup(self, name, path, info):
+        identity = (info.elfclass, info.machine)
+        if ("/" in name):
+            return name if self._compatible(name, identity) else None
+        origin = os.path.dirname(path)
+        dirs = []
+        if (not info.runpath):
+            dirs.extend(self._expand(info.rpath, origin))
+        dirs.extend(self._ld_library_path)
+        dirs.extend(self._expand(info.runpath, origin))
+        dirs.extend(self._search_paths)
+        for item in dirs:
+            candidate = os.path.join(item, name)
+            if (self._compatible(candidate, identity)):
+                return candidate
+        return None
+
+    def resolve(self, binaries):
+        """ Build and return the DependencyGraph for the given list of files """
+        graph = DependencyGraph()
+        pending = set(os.path.realpath(item) for item in binaries)
+        with concurrent.futures.ThreadPoolExecutor(max_workers = self._max_workers) as executor:
+            while (pending):
+                futures = {executor.submit(read_dynamic, path): path for path in pending}
+                pending = set()
+                for future in concurrent.futures.as_completed(futures):
+                    path = futures[future]
+                    try:
+                        info = future.result()
+                    except (OSError, pylibelf.libelf.ElfError):
+                        graph.edges[path] = []
+                        continue
+                    graph.info[path] = info
+                    resolved = []
+                    for name in info.needed:
+                        candidate = self._lookup(name, path, info)
+                        if (candidate is None):
+                            graph.missing.setdefault(path, []).append(name)
+                            continue
+                        candidate = os.path.realpath(candidate)
+                        resolved.append(candidate)
+                        pending.add(candidate)
+                    graph.edges[path] = resolved
+                pending.difference_update(graph.edges)
+        return graph
@@ -29,6 +29,15 @@ Elf64_Off = ctypes.c_ulonglong
 Elf32_Section = ctypes.c_ushort
 Elf64_Section = ctypes.c_ushort
 
+Elf32_Xword = ctypes.c_ulonglong
+Elf64_Xword = ctypes.c_ulonglong
+
+Elf32_Sxword = ctypes.c_longlong
+Elf64_Sxword = ctypes.c_longlong
+
+Elf32_Relr = Elf32_Word
+Elf64_Relr = Elf64_Xword
+
 EI_NIDENT = 16
 
 EI_MAG0 =   0
@@ -352,7 +361,8 @@ SHT_FINI_ARRAY =   15
 SHT_PREINIT_ARRAY = 16
 SHT_GROUP =   17
 SHT_SYMTAB_SHNDX  = 18
-SHT_NUM =    19
+SHT_RELR =   19
+SHT_NUM =    20
 SHT_LOOS =   0x60000000
 SHT_GNU_ATTRIBUTES = 0x6ffffff5
 SHT_GNU_HASH =   0x6ffffff6
@@ -415,6 +425,11 @@ STT_HIOS          = 12
 STT_LOPROC        = 13
 STT_HIPROC        = 15
 
+STV_DEFAULT       = 0
+STV_INTERNAL      = 1
+STV_HIDDEN        = 2
+STV_PROTECTED     = 3
+
 R_386_NONE        = 0
 R_386_32          = 1
 R_386_PC32        = 2
@@ -484,6 +499,24 @@ class Elf32_Ehdr(ctypes.Structure):
         ("e_shnum",     Elf32_Half),
         ("e_shstrndx",  Elf32_Half) ]
 
+class Elf64_Ehdr(ctypes.Structure):
+    """ Python binding for ELF struct Elf64_Ehdr """
+    _fields_ = [
+        ("e_ident",     ctypes.c_ubyte * EI_NIDENT),
+        ("e_type",      Elf64_Half),
+        ("e_machine",   Elf64_Half),
+        ("e_version",   Elf64_Word),
+        ("e_entry",     Elf64_Addr),
+        ("e_phoff",     Elf64_Off),
+        ("e_shoff",     Elf64_Off),
+        ("e_flags",     Elf64_Word),
+        ("e_ehsize",    Elf64_Half),
+        ("e_phentsize", Elf64_Half),
+        ("e_phnum",     Elf64_Half),
+        ("e_shentsize", Elf64_Half),
+        ("e_shnum",     Elf64_Half),
+        ("e_shstrndx",  Elf64_Half) ]
+
 class Elf32_Phdr(ctypes.Structure):
     """ Python binding for ELF struct Elf32_Phdr """
     _fields_ = [
@@ -497,6 +530,19 @@ class Elf32_Phdr(ctypes.Structure):
         ("p_align",  Elf32_Word) ]
 
 
+class Elf64_Phdr(ctypes.Structure):
+    """ Python binding for ELF struct Elf64_Phdr """
+    _fields_ = [
+        ("p_type",   Elf64_Word),
+        ("p_flags",  Elf64_Word),
+        ("p_offset", Elf64_Off),
+        ("p_vaddr",  Elf64_Addr),
+        ("p_paddr",  Elf64_Addr),
+        ("p_filesz", Elf64_Xword),
+        ("p_memsz",  Elf64_Xword),
+        ("p_align",  Elf64_Xword) ]
+
+
 class Elf32_Shdr(ctypes.Structure):
     """ Python binding for ELF struct Elf32_Shdr """
     _fields_ = [
@@ -512,6 +558,21 @@ class Elf32_Shdr(ctypes.Structure):
         ("sh_entsize",   Elf32_Word) ]
 
 
+class Elf64_Shdr(ctypes.Structure):
+    """ Python binding for ELF struct Elf64_Shdr """
+    _fields_ = [
+        ("sh_name",      Elf64_Word),
+        ("sh_type",      Elf64_Word),
+        ("sh_flags",     Elf64_Xword),
+        ("sh_addr",      Elf64_Addr),
+        ("sh_offset",    Elf64_Off),
+        ("sh_size",      Elf64_Xword),
+        ("sh_link",      Elf64_Word),
+        ("sh_info",      Elf64_Word),
+        ("sh_addralign", Elf64_Xword),
+        ("sh_entsize",   Elf64_Xword) ]
+
+
 class Elf32_Rela(ctypes.Structure):
     """ Python binding for ELF struct Elf32_Rela """
     _fields_ = [
@@ -520,6 +581,28 @@ class Elf32_Rela(ctypes.Structure):
         ("r_addend", Elf32_Sword) ]
 
 
+class Elf64_Rela(ctypes.Structure):
+    """ Python binding for ELF struct Elf64_Rela """
+    _fields_ = [
+        ("r_offset", Elf64_Addr),
+        ("r_info",   Elf64_Xword),
+        ("r_addend", Elf64_Sxword) ]
+
+
+class Elf32_Rel(ctypes.Structure):
+    """ Python binding for ELF struct Elf32_Rel """
+    _fields_ = [
+        ("r_offset", Elf32_Addr),
+        ("r_info",   Elf32_Word) ]
+
+
+class Elf64_Rel(ctypes.Structure):
+    """ Python binding for ELF struct Elf64_Rel """
+    _fields_ = [
+        ("r_offset", Elf64_Addr),
+        ("r_info",   Elf64_Xword) ]
+
+
 def ELF32_R_SYM(val):
     return (val >> 8)
 
@@ -529,6 +612,15 @@ def ELF32_R_TYPE(val):
 def ELF32_R_INFO(rsym, rtype):
     return ((rsym << 8) + (rtype & 0xff))
 
+def ELF64_R_SYM(val):
+    return (val >> 32)
+
+def ELF64_R_TYPE(val):
+    return (val & 0xffffffff)
+
+def ELF64_R_INFO(rsym, rtype):
+    return ((rsym << 32) + (rtype & 0xffffffff))
+
 
 class _d_un(ctypes.Union):
     """ Python binding for ELF struct Elf32_Dyn::d_un """
@@ -543,6 +635,19 @@ class Elf32_Dyn(ctypes.Structure):
         ("d_un", _d_un)]
 
 
+class _d_un64(ctypes.Union):
+    """ Python binding for ELF struct Elf64_Dyn::d_un """
+    _fields_ = [("d_val", Elf64_Xword),
+                ("d_ptr", Elf64_Addr)]
+
+
+class Elf64_Dyn(ctypes.Structure):
+    """ Python binding for ELF struct Elf64_Dyn """
+    _fields_ = [
+        ("d_tag", Elf64_Sxword),
+        ("d_un", _d_un64)]
+
+
 class Elf32_Sym(ctypes.Structure):
     """ Python binding for ELF struct Elf32_Sym """
     _fields_ = [
@@ -562,6 +667,45 @@ def ELF32_ST_TYPE(val):
 def ELF32_ST_INFO(sbind, stype):
     return ((sbind << 4) + (stype & 0xf))
 
+def ELF32_ST_VISIBILITY(val):
+    return (val & 0x03)
+
+
+class Elf64_Sym(ctypes.Structure):
+    """ Python binding for ELF struct Elf64_Sym """
+    _fields_ = [
+        ("st_name",  Elf64_Word),
+        ("st_info",  ctypes.c_ubyte),
+        ("st_other", ctypes.c_ubyte),
+        ("st_shndx", Elf64_Section),
+        ("st_value", Elf64_Addr),
+        ("st_size",  Elf64_Xword)]
+
+
+class Elf32_Nhdr(ctypes.Structure):
+    """ Python binding for ELF struct Elf32_Nhdr """
+    _fields_ = [
+        ("n_namesz", Elf32_Word),
+        ("n_descsz", Elf32_Word),
+        ("n_type",   Elf32_Word) ]
+
+
+class Elf64_Nhdr(ctypes.Structure):
+    """ Python binding for ELF struct Elf64_Nhdr """
+    _fields_ = [
+        ("n_namesz", Elf64_Word),
+        ("n_descsz", Elf64_Word),
+        ("n_type",   Elf64_Word) ]
+
+
+ELF_NOTE_GNU          = "GNU"
+
+NT_GNU_ABI_TAG        = 1
+NT_GNU_HWCAP          = 2
+NT_GNU_BUILD_ID       = 3
+NT_GNU_GOLD_VERSION   = 4
+NT_GNU_PROPERTY_TYPE_0 = 5
+
 
 R_M32R_NONE               = 0
 R_M32R_16                 = 1
@@ -0,0 +1,124 @@
+"""
+ SPDX-License-Identifier: MIT
+
+ Copyright (C) 2023 Advanced Micro Devices, Inc.
+
+ Content fingerprints of ELF files. Every section and segment is hashed over
+ a zero-copy view of the file image on a thread pool, hashlib releases the
+ GIL for large buffers so the hashing runs in parallel. A combined digest
+ over the headers, the section hashes and the segment bytes no section holds
+ identifies the file as a whole.
+"""
+
+import bisect
+import struct
+import hashlib
+import collections
+import concurrent.futures
+
+import pylibelf.elf
+import pylibelf.notes
+import pylibelf.sections
+import pylibelf.segments
+
+Fingerprint = collections.namedtuple("Fingerprint", ["sections", "segments", "digest"])
+
+# Sections left out of the combined digest with volatile set, they only
+# record where the debug information was split to
+VOLATILE_SECTIONS = frozenset([".gnu_debuglink", ".gnu_debugaltlink"])
+
+_DIGEST_VERSION = 2
+
+def _hexdigest(algorithm, view):
+    return hashlib.new(algorithm, view).hexdigest()
+
+def _covered(melf, ehdr, sections):
+    """ Sorted disjoint file ranges of the ELF header, program headers and sections """
+    ranges = [(0, ehdr.e_ehsize)]
+    count = melf.elf_getphdrnum()
+    if (count):
+        ranges.append((ehdr.e_phoff, ehdr.e_phoff + count * ehdr.e_phentsize))
+    ranges += [(item.offset, item.offset + item.size) for item in sections
+               if item.index and item.type != pylibelf.elf.SHT_NOBITS and item.size]
+    merged = []
+    for start, end in sorted(ranges):
+        if (merged and start <= merged[-1][1]):
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return merged
+
+def _uncovered(segment, covered, starts):
+    """ (start, end) ranges of the segment file contents outside of the covered ranges """
+    pos = segment.offset
+    end = segment.offset + segment.filesz
+    first = max(bisect.bisect_right(starts, pos) - 1, 0)
+    for start, stop in covered[first:]:
+        if (start >= end):
+            break
+        if (start > pos):
+            yield pos, start
+        pos = max(pos, stop)
+    if (pos < end):
+        yield pos, end
+
+def fingerprint(melf, algorithm = "sha256", volatile = False, ignore = (), max_workers = None):
+    """
+    Fingerprint of an ElfDescriptor opened for reading. Returns a Fingerprint
+    with .sections the hex digests indexed by section number, .segments the
+    hex digests of the file contents of the program headers and .digest the
+    combined hex digest. With volatile True the build ID and the sections in
+    VOLATILE_SECTIONS do not contribute to the combined digest, the names in
+    ignore are always left out of it. File offsets do not contribute either
+    so the digest survives relayout of the file.
+    """
+    image = melf.elf_rawfile()
+    sections = pylibelf.sections.SectionIndex(melf)
+    segments = list(pylibelf.segments.iter_phdrs(melf))
+    views = [image[item.offset:item.offset + sections.file_size(item)] for item in sections]
+    views += [image[item.offset:item.offset + item.filesz] for item in segments]
+    with concurrent.futures.ThreadPoolExecutor(max_workers = max_workers) as executor:
+        hashes = list(executor.map(lambda view: _hexdigest(algorithm, view), views))
+    for view in views:
+        view.release()
+    section_hashes = hashes[:len(sections)]
+    segment_hashes = hashes[len(sections):]
+
+    skip = set(ignore)
+    build_id = None
+    if (volatile):
+        skip |= VOLATILE_SECTIONS
+        build_id = pylibelf.notes.elf_build_id(melf)
+
+    ehdr = melf.gelf_getehdr()
+    combined = hashlib.new(algorithm)
+    combined.update(struct.pack("<I", _DIGEST_VERSION))
+    combined.update(bytes(ehdr.e_ident))
+    combined.update(struct.pack("<HHIQQ", ehdr.e_type, ehdr.e_machine, ehdr.e_version,
+                                ehdr.e_entry, ehdr.e_flags))
+    for item, digest in zip(sections, section_hashes):
+        if (item.name in skip):
+            continue
+        if (build_id and item.type == pylibelf.elf.SHT_NOTE):
+            start = item.offset
+            contents = image[start:start + item.size].tobytes()
+            digest = _hexdigest(algorithm, contents.replace(build_id, bytes(len(build_id))))
+        combined.update(item.name.encode("utf-8") + b"\0")
+        combined.update(struct.pack("<IQQQIIQQ", item.type, item.flags, item.addr, item.size,
+                                    item.link, item.info, item.addralign, item.entsize))
+        combined.update(bytes.fromhex(digest))
+    # Segment contents held by sections are covered by their hashes, the rest
+    # e.g. everything of a file without section headers is hashed here
+    covered = _covered(melf, ehdr, sections)
+    starts = [start for start, _ in covered]
+    for item in segments:
+        combined.update(struct.pack("<IIQQQQQ", item.type, item.flags, item.vaddr, item.paddr,
+                                    item.filesz, item.memsz, item.align))
+        for start, end in _uncovered(item, covered, starts):
+            contents = image[start:end].tobytes()
+            if (build_id):
+                contents = contents.replace(build_id, bytes(len(build_id)))
+            combined.update(struct.pack("<QQ", start - item.offset, end - start))
+            combined.update(hashlib.new(algorithm, contents).digest())
+    image.release()
+    return Fingerprint(section_hashes, segment_hashes, combined.hexdigest())
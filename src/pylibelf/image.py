@@ -0,0 +1,108 @@
+"""
+ SPDX-License-Identifier: MIT
+
+ Copyright (C) 2023 Advanced Micro Devices, Inc.
+
+ Read the loaded memory image of an ELF file by virtual address. Reads are
+ served as zero-copy memoryview slices of an mmap of the file, only reads
+ which touch the zero filled tail of a segment or span segments are copied.
+"""
+
+import mmap
+import struct
+
+import pylibelf.elf
+import pylibelf.libelf
+import pylibelf.segments
+
+class ElfImage:
+    """
+    Memory image of an ELF file as described by its PT_LOAD segments. Use as
+    a context manager or call close() to drop the mapping; memoryviews handed
+    out must be released before that.
+    """
+    def __init__(self, filename):
+        self._filehandle = open(filename, "rb")
+        self._map = mmap.mmap(self._filehandle.fileno(), 0, access = mmap.ACCESS_READ)
+        self._view = memoryview(self._map)
+        melf = pylibelf.libelf.ElfDescriptor.fromfile(filename, pylibelf.libelf.Elf_Cmd.ELF_C_READ_MMAP)
+        self.index = pylibelf.segments.SegmentIndex(melf)
+        ident = melf.gelf_getehdr().e_ident
+        self.byteorder = ">" if ident[pylibelf.elf.EI_DATA] == pylibelf.elf.ELFDATA2MSB else "<"
+        self.pointer_size = 8 if ident[pylibelf.elf.EI_CLASS] == pylibelf.elf.ELFCLASS64 else 4
+
+    def close(self):
+        if (self._map is not None):
+            self._view.release()
+            self._map.close()
+            self._filehandle.close()
+            self._map = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def _assemble(self, segment, addr, size):
+        """ Slow path for reads touching zero filled memory or more than one segment """
+        result = bytearray(size)
+        pos = 0
+        while (pos < size):
+            if (segment is None):
+                raise ValueError(f"Address {hex(addr + pos)} is not mapped by any PT_LOAD segment")
+            start = addr + pos - segment.vaddr
+            count = min(size - pos, segment.memsz - start)
+            backed = max(0, min(count, segment.filesz - start))
+            if (backed):
+                offset = segment.offset + start
+                result[pos:pos + backed] = self._view[offset:offset + backed]
+            # The rest of count is the zero filled p_memsz > p_filesz tail
+            pos += count
+            if (pos < size):
+                segment = self.index.segment_for_vaddr(addr + pos)
+        return memoryview(result)
+
+    def _read(self, segment, addr, size):
+        start = addr - segment.vaddr
+        if (start + size <= segment.filesz):
+            offset = segment.offset + start
+            return self._view[offset:offset + size]
+        return self._assemble(segment, addr, size)
+
+    def read_vaddr(self, addr, size):
+        """ Return size bytes of memory at virtual address addr as a memoryview """
+        segment = self.index.segment_for_vaddr(addr)
+        if (segment is None):
+            raise ValueError(f"Address {hex(addr)} is not mapped by any PT_LOAD segment")
+        return self._read(segment, addr, size)
+
+    def read_vaddrs(self, requests, size = None):
+        """
+        Batched read_vaddr(), requests is a sequence of (addr, size) tuples or
+        of plain addresses when size is given. Consecutive addresses falling
+        in the same segment skip the segment lookup.
+        """
+        result = []
+        segment = None
+        for item in requests:
+            if (size is None):
+                addr, count = item
+            else:
+                addr, count = item, size
+            if (segment is None or not segment.vaddr <= addr < segment.vaddr + segment.memsz):
+                segment = self.index.segment_for_vaddr(addr)
+                if (segment is None):
+                    raise ValueError(f"Address {hex(addr)} is not mapped by any PT_LOAD segment")
+            result.append(self._read(segment, addr, count))
+        return result
+
+    def unpack_vaddrs(self, addrs, fmt = None):
+        """
+        Decode one value of the struct format fmt, by default a pointer, at
+        every address in addrs honouring the byte order of the file
+        """
+        if (fmt is None):
+            fmt = "Q" if self.pointer_size == 8 else "I"
+        decoder = struct.Struct(self.byteorder + fmt)
+        return [decoder.unpack(item)[0] for item in self.read_vaddrs(addrs, decoder.size)]
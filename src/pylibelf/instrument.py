@@ -0,0 +1,142 @@
+"""
+ SPDX-License-Identifier: MIT
+
+ Copyright (C) 2023 Advanced Micro Devices, Inc.
+
+ Opt-in per function statistics of the calls into libelf: number of calls,
+ cumulative and maximum latency and bytes returned. While nothing is being
+ measured the bindings call the plain ctypes functions, the timing wrappers
+ are only installed between enable() and disable() or inside profiled().
+"""
+
+import time
+import ctypes
+import threading
+import contextlib
+import collections
+
+import pylibelf.libelf
+
+CallStats = collections.namedtuple("CallStats", ["calls", "total", "max", "bytes"])
+
+# Every active set of counters, name -> [calls, total ns, max ns, bytes]. The global
+# counters of enable() and those of each running profiled() block are updated together.
+_sinks = []
+_global = {}
+_lock = threading.Lock()
+
+# Metaclass of all the ctypes pointer types
+_POINTER_TYPE = type(ctypes.POINTER(ctypes.c_char))
+
+def _result_size(name, restype):
+    """ Function returning the number of bytes a call handed back or None if it returns none """
+    if (name == "elf_rawfile"):
+        # The image size is returned through the second argument
+        return lambda result, args: args[1]._obj.value if result else 0
+    if (restype is ctypes.POINTER(pylibelf.libelf.Elf_Data)):
+        return lambda result, args: result.contents.d_size if result else 0
+    if (restype is ctypes.c_char_p):
+        return lambda result, args: len(result) if result is not None else 0
+    if (isinstance(restype, _POINTER_TYPE)):
+        size = ctypes.sizeof(restype._type_)
+        return lambda result, args: size if result else 0
+    return None
+
+def _wrap(name, func):
+    measure = _result_size(name, func.restype)
+    clock = time.perf_counter_ns
+    def call(*args):
+        start = clock()
+        result = func(*args)
+        elapsed = clock() - start
+        size = measure(result, args) if measure is not None else 0
+        with _lock:
+            for sink in _sinks:
+                entry = sink.get(name)
+                if (entry is None):
+                    entry = sink[name] = [0, 0, 0, 0]
+                entry[0] += 1
+                entry[1] += elapsed
+                entry[2] = max(entry[2], elapsed)
+                entry[3] += size
+        return result
+    call.__name__ = name
+    call.__wrapped__ = func
+    return call
+
+def _attach(sink):
+    with _lock:
+        if (not any(item is sink for item in _sinks)):
+            _sinks.append(sink)
+        first = len(_sinks) == 1
+    if (first):
+        pylibelf.libelf._libelf.set_wrapper(_wrap) # pylint: disable=protected-access
+
+def _detach(sink):
+    with _lock:
+        _sinks[:] = [item for item in _sinks if item is not sink]
+        last = not _sinks
+    if (last):
+        pylibelf.libelf._libelf.set_wrapper(None) # pylint: disable=protected-access
+
+def _snapshot(sink):
+    with _lock:
+        return {name: CallStats(entry[0], entry[1] / 1e9, entry[2] / 1e9, entry[3])
+                for name, entry in sorted(sink.items())}
+
+def enable():
+    """ Start collecting the global statistics returned by stats() """
+    _attach(_global)
+
+def disable():
+    """ Stop collecting, the statistics gathered so far are kept """
+    _detach(_global)
+
+def enabled():
+    return any(item is _global for item in _sinks)
+
+def reset():
+    """ Clear the global statistics """
+    with _lock:
+        _global.clear()
+
+def stats():
+    """ Snapshot of the global statistics, libelf function name -> CallStats in seconds """
+    return _snapshot(_global)
+
+class Profile:
+    """ Statistics of the calls made inside one profiled() block """
+    def __init__(self):
+        self.counters = {}
+
+    def stats(self):
+        """ libelf function name -> CallStats in seconds, complete once the block is left """
+        return _snapshot(self.counters)
+
+    def __str__(self):
+        return format_stats(self.stats())
+
+@contextlib.contextmanager
+def profiled():
+    """
+    Measure the libelf calls made inside the with block, independently of the
+    global statistics and of other profiled() blocks
+
+        with pylibelf.instrument.profiled() as profile:
+            ...
+        print(profile)
+    """
+    profile = Profile()
+    _attach(profile.counters)
+    try:
+        yield profile
+    finally:
+        _detach(profile.counters)
+
+def format_stats(table):
+    """ Text table of stats() output, slowest functions first """
+    lines = [f"{'function':<20} {'calls':>10} {'total ms':>12} {'max us':>10} {'bytes':>12}"]
+    for name, item in sorted(table.items(), key = lambda pair: pair[1].total, reverse = True):
+        lines.append(f"{name:<20} {item.calls:>10} {item.total * 1e3:>12.3f} "
+                     f"{item.max * 1e6:>10.1f} {item.bytes:>12}")
+    return "\n".join(lines)
@@ -8,83 +8,231 @@
  Enumerations and classes
 """
 
-import errno
+import os
+import sys
 import ctypes
-import enum
+import threading
+import collections
 
 import pylibelf.elf
 
-_libelf = ctypes.CDLL("libelf.so", mode=ctypes.RTLD_GLOBAL)
-
-class CtypesEnum(enum.IntEnum):
+class _LazyLibrary:
     """
-    A ctypes-compatible IntEnum superclass.
-    https://stackoverflow.com/questions/38356698/how-to-pass-enum-as-argument-in-ctypes-python
+    Stand-in for the libelf CDLL so that importing the module does not load
+    the library. It is loaded on the first call into it and every function
+    gets its prototype from _prototypes() bound on first use. A wrapper set
+    with set_wrapper() is put around every bound function, see
+    pylibelf.instrument.
     """
-    @classmethod
-    def from_param(cls, obj):
-        return int(obj)
-
-class Elf_Type(CtypesEnum):
-    """ Binding for Elf_Type enumeration in libelf library """
-    ELF_T_BYTE =     0
-    ELF_T_ADDR =     1
-    ELF_T_DYN =      2
-    ELF_T_EHDR =     3
-    ELF_T_HALF =     4
-    ELF_T_OFF =      5
-    ELF_T_PHDR =     6
-    ELF_T_RELA =     7
-    ELF_T_REL =      8
-    ELF_T_SHDR =     9
-    ELF_T_SWORD =   10
-    ELF_T_SYM =     11
-    ELF_T_WORD =    12
-    ELF_T_XWORD =   13
-    ELF_T_SXWORD =  14
-    ELF_T_VDEF =    15
-    ELF_T_VDAUX =   16
-    ELF_T_VNEED =   17
-    ELF_T_VNAUX =   18
-    ELF_T_NHDR =    19
-    ELF_T_SYMINFO = 20
-    ELF_T_MOVE =    21
-    ELF_T_LIB =     22
-    ELF_T_GNUHASH = 23
-    ELF_T_AUXV =    24
-    ELF_T_CHDR =    25
-    ELF_T_NHDR8 =   26
-    ELF_T_NUM =     27
-
-class Elf_Cmd(CtypesEnum):
-    """ Binding for Elf_Cmd enumeration in libelf library """
-    ELF_C_NULL =               0
-    ELF_C_READ =               1
-    ELF_C_RDWR =               2
-    ELF_C_WRITE =              3
-    ELF_C_CLR =                4
-    ELF_C_SET =                5
-    ELF_C_FDDONE =             6
-    ELF_C_FDREAD =             7
-    ELF_C_READ_MMAP =          8
-    ELF_C_RDWR_MMAP =          9
-    ELF_C_WRITE_MMAP =        10
-    ELF_C_READ_MMAP_PRIVATE = 11
-    ELF_C_EMPTY =             12
-    ELF_C_NUM =               13
-
+    def __init__(self, name):
+        self._name = name
+        self._cdll = None
+        self._prototypes = None
+        self._functions = {}
+        self._wrapper = None
+
+    def _load(self):
+        # Two threads racing here is harmless, dlopen and elf_version are idempotent
+        cdll = ctypes.CDLL(self._name, mode=ctypes.RTLD_GLOBAL)
+        self._prototypes = _prototypes()
+        cdll.elf_version.restype, cdll.elf_version.argtypes = self._prototypes["elf_version"]
+        self._cdll = cdll
+        _true_or_error(cdll.elf_version(pylibelf.elf.EV_CURRENT) != pylibelf.elf.EV_NONE)
+
+    def loaded(self):
+        return self._cdll is not None
+
+    def __getattr__(self, name):
+        # Only reached for functions which are not bound yet
+        if (self._cdll is None):
+            self._load()
+        func = getattr(self._cdll, name)
+        prototype = self._prototypes.get(name)
+        if (prototype is not None):
+            func.restype, func.argtypes = prototype
+        self._functions[name] = func
+        if (self._wrapper is not None):
+            func = self._wrapper(name, func)
+        setattr(self, name, func)
+        return func
+
+    def set_wrapper(self, wrapper):
+        """
+        Call wrapper(name, func) for every function bound now or later and use
+        what it returns in place of the function. None restores the plain
+        ctypes functions so there is no cost left once the wrapper is removed.
+        """
+        self._wrapper = wrapper
+        for name, func in self._functions.items():
+            setattr(self, name, wrapper(name, func) if wrapper is not None else func)
+
+_libelf = _LazyLibrary("libelf.so")
+
+def is_loaded():
+    """ True once libelf has been loaded by a first call into it """
+    return _libelf.loaded()
+
+MemoryUsage = collections.namedtuple("MemoryUsage", ["mapped", "copied", "pinned"])
+
+class _MemoryTracker:
+    """
+    Process wide sum of the memory accounted to the open ElfDescriptor objects
+    with its high-water mark and an optional alarm, see set_memory_alarm().
+    Copies are a running count only, they belong to Python once made, so the
+    high-water mark and the alarm only follow the mapped and pinned memory.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.usage = [0, 0, 0]
+        self.peak = 0
+        self.limit = None
+        self.callback = None
+        self._armed = True
+
+    def add(self, kind, delta):
+        fire = None
+        with self._lock:
+            self.usage[kind] += delta
+            usage = MemoryUsage(*self.usage)
+            total = usage.mapped + usage.pinned
+            self.peak = max(self.peak, total)
+            if (self.limit is not None):
+                if (total < self.limit):
+                    self._armed = True
+                elif (self._armed):
+                    # Fire once per crossing of the limit
+                    self._armed = False
+                    fire = (self.callback, usage)
+        if (fire is not None):
+            fire[0](fire[1])
+
+    def set_alarm(self, limit, callback):
+        with self._lock:
+            self.limit = limit if callback is not None else None
+            self.callback = callback
+            self._armed = True
+
+_memory = _MemoryTracker()
+
+def memory_usage():
+    """ MemoryUsage summed over all the open ElfDescriptor objects """
+    return MemoryUsage(*_memory.usage)
+
+def memory_peak():
+    """ Highest total of the mapped and pinned memory_usage() seen so far """
+    return _memory.peak
+
+def set_memory_alarm(limit, callback):
+    """
+    Call callback(memory_usage()) whenever the mapped and pinned memory of the
+    open descriptors reaches limit bytes. It fires once per crossing, the total
+    has to drop below the limit again to re-arm it. A callback of None removes
+    the alarm. The callback runs in the thread which crossed the limit.
+    """
+    _memory.set_alarm(limit, callback)
 
 ELF_F_DIRTY =      0x1
 ELF_F_LAYOUT =     0x4
 ELF_F_PERMISSIVE = 0x8
 
-class Elf_Kind(CtypesEnum):
-    """ Binding for Elf_Kind enumeration in libelf library """
-    ELF_K_NONE = 0
-    ELF_K_AR   = 1
-    ELF_K_COFF = 2
-    ELF_K_ELF  = 3
-    ELF_K_NUM  = 4
+# Names of the enumerations created on first use by __getattr__()
+_ENUMERATIONS = ("CtypesEnum", "Elf_Type", "Elf_Cmd", "Elf_Kind")
+
+_enumerations_lock = threading.Lock()
+
+# Elf_Type.ELF_T_BYTE for the defaults of the methods below
+_ELF_T_BYTE = 0
+
+def _define_enumerations():
+    """
+    Creating the enumerations, together with importing enum, is most of the
+    cost of importing the module so like the library they are only created
+    on first use. The qualified names keep them picklable.
+    """
+    import enum # pylint: disable=import-outside-toplevel
+
+    class CtypesEnum(enum.IntEnum):
+        """
+        A ctypes-compatible IntEnum superclass.
+        https://stackoverflow.com/questions/38356698/how-to-pass-enum-as-argument-in-ctypes-python
+        """
+        __qualname__ = "CtypesEnum"
+        @classmethod
+        def from_param(cls, obj):
+            return int(obj)
+
+    class Elf_Type(CtypesEnum):
+        """ Binding for Elf_Type enumeration in libelf library """
+        __qualname__ = "Elf_Type"
+        ELF_T_BYTE =     0
+        ELF_T_ADDR =     1
+        ELF_T_DYN =      2
+        ELF_T_EHDR =     3
+        ELF_T_HALF =     4
+        ELF_T_OFF =      5
+        ELF_T_PHDR =     6
+        ELF_T_RELA =     7
+        ELF_T_REL =      8
+        ELF_T_SHDR =     9
+        ELF_T_SWORD =   10
+        ELF_T_SYM =     11
+        ELF_T_WORD =    12
+        ELF_T_XWORD =   13
+        ELF_T_SXWORD =  14
+        ELF_T_VDEF =    15
+        ELF_T_VDAUX =   16
+        ELF_T_VNEED =   17
+        ELF_T_VNAUX =   18
+        ELF_T_NHDR =    19
+        ELF_T_SYMINFO = 20
+        ELF_T_MOVE =    21
+        ELF_T_LIB =     22
+        ELF_T_GNUHASH = 23
+        ELF_T_AUXV =    24
+        ELF_T_CHDR =    25
+        ELF_T_NHDR8 =   26
+        ELF_T_NUM =     27
+
+    class Elf_Cmd(CtypesEnum):
+        """ Binding for Elf_Cmd enumeration in libelf library """
+        __qualname__ = "Elf_Cmd"
+        ELF_C_NULL =               0
+        ELF_C_READ =               1
+        ELF_C_RDWR =               2
+        ELF_C_WRITE =              3
+        ELF_C_CLR =                4
+        ELF_C_SET =                5
+        ELF_C_FDDONE =             6
+        ELF_C_FDREAD =             7
+        ELF_C_READ_MMAP =          8
+        ELF_C_RDWR_MMAP =          9
+        ELF_C_WRITE_MMAP =        10
+        ELF_C_READ_MMAP_PRIVATE = 11
+        ELF_C_EMPTY =             12
+        ELF_C_NUM =               13
+
+    class Elf_Kind(CtypesEnum):
+        """ Binding for Elf_Kind enumeration in libelf library """
+        __qualname__ = "Elf_Kind"
+        ELF_K_NONE = 0
+        ELF_K_AR   = 1
+        ELF_K_COFF = 2
+        ELF_K_ELF  = 3
+        ELF_K_NUM  = 4
+
+    return {"CtypesEnum": CtypesEnum, "Elf_Type": Elf_Type, "Elf_Cmd": Elf_Cmd,
+            "Elf_Kind": Elf_Kind}
+
+def _enumeration(name):
+    with _enumerations_lock:
+        if (name not in globals()):
+            globals().update(_define_enumerations())
+    return globals()[name]
+
+def __getattr__(name):
+    if (name not in _ENUMERATIONS):
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    return _enumeration(name)
 
 
 class ElfError(Exception):
@@ -92,14 +240,15 @@ class ElfError(Exception):
     def __init__(self, *args):
         super().__init__(args)
         self.errno = _libelf.elf_errno()
-        self.errmsg = _libelf.elf_errmsg(errno)
+        errmsg = _libelf.elf_errmsg(self.errno)
+        self.errmsg = errmsg.decode("utf-8") if errmsg is not None else ""
 
     def __str__(self):
         return self.errmsg
 
 def _not_null_or_error(res):
-    """ Validate returned pointer from libelf library """
-    if (res is None):
+    """ Validate returned pointer from libelf library, ctypes NULL pointers are falsy """
+    if (not res):
         raise ElfError()
     return res
 
@@ -109,6 +258,12 @@ def _true_or_error(res):
         raise ElfError()
     return res
 
+def _not_negative_or_error(res):
+    """ Validate returned size from libelf library, -1 on failure """
+    if (res < 0):
+        raise ElfError()
+    return res
+
 
 class Elf_Data(ctypes.Structure):
     """ Binding for Elf_Data structure in libelf """
@@ -121,16 +276,71 @@ class Elf_Data(ctypes.Structure):
         ("d_align",   ctypes.c_size_t) ]
 
 
+class _Py_buffer(ctypes.Structure):
+    """ Python's own Py_buffer, filled by PyObject_GetBuffer """
+    _fields_ = [
+        ("buf",        ctypes.c_void_p),
+        ("obj",        ctypes.c_void_p),
+        ("len",        ctypes.c_ssize_t),
+        ("itemsize",   ctypes.c_ssize_t),
+        ("readonly",   ctypes.c_int),
+        ("ndim",       ctypes.c_int),
+        ("format",     ctypes.c_char_p),
+        ("shape",      ctypes.c_void_p),
+        ("strides",    ctypes.c_void_p),
+        ("suboffsets", ctypes.c_void_p),
+        ("internal",   ctypes.c_void_p) ]
+
+class _PinnedBuffer:
+    """
+    Buffer export of any object supporting the buffer protocol, e.g. bytes,
+    bytearray, mmap or memoryview. The object stays alive and, if resizable,
+    cannot be resized until release() so its address can be handed to C.
+    """
+    # PyBUF_SIMPLE, a contiguous block of bytes which may be read only
+    _FLAGS = 0
+
+    def __init__(self, obj):
+        self._view = _Py_buffer()
+        getbuffer = ctypes.pythonapi.PyObject_GetBuffer
+        getbuffer.restype = ctypes.c_int
+        getbuffer.argtypes = [ctypes.py_object, ctypes.POINTER(_Py_buffer), ctypes.c_int]
+        # Raises BufferError for objects which are not contiguous
+        getbuffer(obj, ctypes.byref(self._view), self._FLAGS)
+        self.address = self._view.buf
+        self.size = self._view.len
+
+    def release(self):
+        if (self._view is not None):
+            release = ctypes.pythonapi.PyBuffer_Release
+            release.restype = None
+            release.argtypes = [ctypes.POINTER(_Py_buffer)]
+            release(ctypes.byref(self._view))
+            self._view = None
+
+    def __del__(self):
+        self.release()
+
 class Elf_ScnDescriptor:
-    """ Binding for Elf_Scn descriptor in libelf """
-    def __init__(self, scn):
+    """ Binding for Elf_Scn descriptor in libelf, owner is the ElfDescriptor it belongs to """
+    def __init__(self, scn, owner = None):
         self.scn = scn
+        self.owner = owner
 
     def elf32_getshdr(self):
         return _not_null_or_error(_libelf.elf32_getshdr(self.scn))
 
+    def gelf_getshdr(self):
+        shdr = pylibelf.elf.Elf64_Shdr()
+        _not_null_or_error(_libelf.gelf_getshdr(self.scn, ctypes.byref(shdr)))
+        return shdr
+
     def elf_getdata(self):
-        return _not_null_or_error(_libelf.elf_getdata(self.scn, None))
+        data = _not_null_or_error(_libelf.elf_getdata(self.scn, None))
+        if (self.owner is not None and data.contents.d_buf):
+            # pylint: disable=protected-access
+            self.owner._read_in(("scn", self.elf_ndxscn()), data.contents.d_size)
+        return data
 
     def elf_newdata(self):
         return _not_null_or_error(_libelf.elf_newdata(self.scn))
@@ -140,138 +350,480 @@ class Elf_ScnDescriptor:
 
 
 class ElfDescriptor:
-    """ Binding for Elf descriptor in libelf """
+    """
+    Binding for Elf descriptor in libelf. The memory held on behalf of the
+    descriptor is accounted as MemoryUsage: mapped is the file image libelf
+    maps, or with ELF_C_READ and ELF_C_RDWR the section contents and ranges
+    it has read in so far, and pinned the buffers handed to libelf for
+    writing and kept alive with pin(). copied counts the bytes copied out with string_at()
+    so far, those copies are not held by the descriptor. All of it is
+    released from the accounting when the descriptor is closed.
+    """
+    _MAPPED, _COPIED, _PINNED = range(3)
+
     def _cleanup(self):
         if (self.elfnative is not None):
             _libelf.elf_end(self.elfnative)
+            self.elfnative = None
+        if (self._image is not None):
+            # Only once libelf is done with the memory
+            self._image.release()
+            self._image = None
         if (self.filehandle is not None):
             self.filehandle.close()
-
-    def __init__(self, elfnative, filehandle = None):
+            self.filehandle = None
+        for kind, size in enumerate(self._usage):
+            if (size):
+                _memory.add(kind, -size)
+        self._usage = [0, 0, 0]
+        self._pinned = []
+
+    def __init__(self, elfnative, filehandle = None, mapped = 0, image = None, mmap = True,
+                 lazy = False):
         self.filehandle = filehandle
+        # Whether libelf has the whole image in memory, mapped or handed in
+        self._mmap = mmap
+        # Whether libelf reads in the file contents only as they are asked for,
+        # the keys of what it has read in so far
+        self._lazy = lazy
+        self._loaded = set()
         self.elfnative = elfnative
+        self._image = image
+        self._usage = [0, 0, 0]
+        self._pinned = []
+        self._account(self._MAPPED, mapped)
 
     def __del__(self):
         self._cleanup()
 
+    def _account(self, kind, size):
+        if (size):
+            self._usage[kind] += size
+            _memory.add(kind, size)
+
+    def memory_usage(self):
+        """ MemoryUsage of this descriptor """
+        return MemoryUsage(*self._usage)
+
+    def pin(self, buffer):
+        """
+        Keep a buffer whose address was handed to libelf, e.g. as d_buf of an
+        Elf_Data, alive for the lifetime of the descriptor. Returns the buffer.
+        """
+        self._pinned.append(buffer)
+        self._account(self._PINNED, memoryview(buffer).nbytes)
+        return buffer
+
+    def _read_in(self, key, size):
+        """ Account size bytes libelf reads in from the file once per key """
+        if (self._lazy and key not in self._loaded):
+            self._loaded.add(key)
+            self._account(self._MAPPED, size)
+
+    def string_at(self, address, size):
+        """ ctypes.string_at() of memory owned by the descriptor, counted as copied """
+        self._account(self._COPIED, size)
+        return ctypes.string_at(address, size)
+
     @classmethod
     def fromfile(cls, filename, cmd):
+        commands = _enumeration("Elf_Cmd")
         mode = None
-        if (cmd == Elf_Cmd.ELF_C_READ):
+        if (cmd == commands.ELF_C_READ):
             mode = "r"
-        elif (cmd == Elf_Cmd.ELF_C_WRITE):
+        elif (cmd == commands.ELF_C_READ_MMAP):
+            mode = "rb"
+        elif (cmd == commands.ELF_C_WRITE):
             mode = "wb"
-        elif (cmd == Elf_Cmd.ELF_C_RDWR):
+        elif (cmd == commands.ELF_C_RDWR):
             mode = "r+b"
         else:
             assert False, f"Command {cmd} not supported"
 
         filehandle = open(filename, mode)
         elfnative = _libelf.elf_begin(filehandle.fileno(), cmd, None)
-        return cls(_not_null_or_error(elfnative), filehandle)
+        # libelf maps the whole file up front, otherwise it reads in the
+        # section contents and raw chunks as they are asked for
+        mmap = cmd == commands.ELF_C_READ_MMAP
+        mapped = os.fstat(filehandle.fileno()).st_size if mmap else 0
+        return cls(_not_null_or_error(elfnative), filehandle, mapped, mmap = mmap,
+                   lazy = cmd in (commands.ELF_C_READ, commands.ELF_C_RDWR))
 
     @classmethod
-    def frommemory(cls, image, size):
-        elfnative = _libelf.elf_memory(image, size)
-        return cls(_not_null_or_error(elfnative))
+    def frommemory(cls, image, size = None):
+        """
+        Descriptor reading the ELF image held by any contiguous buffer protocol
+        object, e.g. bytes, bytearray, mmap or memoryview, in place. The first
+        size bytes are used, all of them by default. The buffer is kept alive
+        and locked against resizing until the descriptor is closed, it must not
+        be modified meanwhile.
+        """
+        pinned = _PinnedBuffer(image)
+        if (size is None):
+            size = pinned.size
+        if (size < 0 or size > pinned.size):
+            pinned.release()
+            raise ValueError(f"Size {size} is outside of the {pinned.size} byte buffer")
+        elfnative = _libelf.elf_memory(pinned.address, size)
+        if (not elfnative):
+            pinned.release()
+            raise ElfError()
+        return cls(elfnative, None, size, pinned)
 
     def elf_kind(self):
         return _libelf.elf_kind(self.elfnative)
 
+    def gelf_getclass(self):
+        return _libelf.gelf_getclass(self.elfnative)
+
     def elf32_getehdr(self):
         return _not_null_or_error(_libelf.elf32_getehdr(self.elfnative))
 
+    def gelf_getehdr(self):
+        ehdr = pylibelf.elf.Elf64_Ehdr()
+        _not_null_or_error(_libelf.gelf_getehdr(self.elfnative, ctypes.byref(ehdr)))
+        return ehdr
+
     def elf32_newehdr(self):
         return _not_null_or_error(_libelf.elf32_newehdr(self.elfnative))
 
     def elf32_getphdr(self):
-        return _not_null_or_error(_libelf.elf32_newphdr(self.elfnative))
+        return _not_null_or_error(_libelf.elf32_getphdr(self.elfnative))
+
+    def elf_getphdrnum(self):
+        count = ctypes.c_size_t()
+        if (_libelf.elf_getphdrnum(self.elfnative, ctypes.byref(count)) != 0):
+            raise ElfError()
+        return count.value
+
+    def gelf_getphdr(self, index):
+        phdr = pylibelf.elf.Elf64_Phdr()
+        _not_null_or_error(_libelf.gelf_getphdr(self.elfnative, index, ctypes.byref(phdr)))
+        return phdr
 
     def elf32_newphdr(self, count):
         return _not_null_or_error(_libelf.elf32_newphdr(self.elfnative, count))
 
     def elf_flagphdr(self, cmd, flags):
-        return _not_null_or_error(_libelf.elf_flagphdr(self.elfnative, cmd, flags))
+        # The new flags, 0 is also what clearing the last flag gives
+        return _libelf.elf_flagphdr(self.elfnative, cmd, flags)
+
+    def elf_getshdrnum(self):
+        """ Number of sections, e_shnum or the sh_size of section 0 when it overflows """
+        count = ctypes.c_size_t()
+        if (_libelf.elf_getshdrnum(self.elfnative, ctypes.byref(count)) != 0):
+            raise ElfError()
+        return count.value
+
+    def elf_getshdrstrndx(self):
+        """ Index of the section name string table, e_shstrndx or the sh_link of section 0 """
+        index = ctypes.c_size_t()
+        if (_libelf.elf_getshdrstrndx(self.elfnative, ctypes.byref(index)) != 0):
+            raise ElfError()
+        return index.value
+
+    def elf_setshstrndx(self, index):
+        """
+        Set e_shstrndx of a file being written, indexes from SHN_LORESERVE on are
+        stored in the sh_link of section 0 with e_shstrndx set to SHN_XINDEX.
+        elf_update() takes care of e_shnum the same way.
+        """
+        ehdr = self.gelf_getehdr()
+        extended = index >= pylibelf.elf.SHN_LORESERVE
+        ehdr.e_shstrndx = pylibelf.elf.SHN_XINDEX if extended else index
+        _true_or_error(_libelf.gelf_update_ehdr(self.elfnative, ctypes.byref(ehdr)) != 0)
+        zero = self.elf_getscn(0)
+        if (zero is None):
+            return
+        shdr = zero.gelf_getshdr()
+        shdr.sh_link = index if extended else 0
+        _true_or_error(_libelf.gelf_update_shdr(zero.scn, ctypes.byref(shdr)) != 0)
 
     def elf_update(self, cmd):
-        return _not_null_or_error(_libelf.elf_update(self.elfnative, cmd))
+        return _not_negative_or_error(_libelf.elf_update(self.elfnative, cmd))
 
     def elf_getscn(self, index):
         scn = _libelf.elf_getscn(self.elfnative, index)
-        return Elf_ScnDescriptor(scn) if scn is not None else scn
+        return Elf_ScnDescriptor(scn, self) if scn is not None else scn
 
     def elf_nextscn(self, scn):
         if (scn is not None):
             scn = scn.scn
         nscn = _libelf.elf_nextscn(self.elfnative, scn)
-        return Elf_ScnDescriptor(nscn) if nscn is not None else nscn
+        return Elf_ScnDescriptor(nscn, self) if nscn is not None else nscn
 
     def elf_newscn(self):
         scn = _libelf.elf_newscn(self.elfnative)
-        return Elf_ScnDescriptor(_not_null_or_error(scn))
+        return Elf_ScnDescriptor(_not_null_or_error(scn), self)
+
+    def elf_strptr(self, index, offset):
+        name = _libelf.elf_strptr(self.elfnative, index, offset)
+        return _not_null_or_error(name).decode("utf-8")
+
+    def elf_rawfile(self):
+        """ Zero-copy memoryview of the file image, valid while the descriptor is alive """
+        size = ctypes.c_size_t()
+        image = _not_null_or_error(_libelf.elf_rawfile(self.elfnative, ctypes.byref(size)))
+        self._read_in("file", size.value)
+        return memoryview((ctypes.c_char * size.value).from_address(image)).cast("B")
+
+    def gelf_fsize(self, typ, count = 1):
+        """ Size in the file of count entries of the Elf_Type for the class of the file """
+        return _libelf.gelf_fsize(self.elfnative, typ, count, pylibelf.elf.EV_CURRENT)
+
+    def elf_getdata_rawchunk(self, offset, size, typ = _ELF_T_BYTE):
+        """
+        Elf_Data of any range of the file translated to memory as typ entries,
+        e.g. the PT_DYNAMIC segment of a file without section headers. The data
+        belongs to the descriptor and lives as long as it does.
+        """
+        data = _not_null_or_error(_libelf.elf_getdata_rawchunk(self.elfnative, offset, size, typ))
+        self._read_in(("chunk", offset, size, typ), size)
+        return data
+
+    def read_range(self, offset, size, typ = _ELF_T_BYTE):
+        """ Bytes of a range of the file in memory representation, see elf_getdata_rawchunk() """
+        data = self.elf_getdata_rawchunk(offset, size, typ)
+        return self.string_at(data.contents.d_buf, data.contents.d_size)
+
+    def iter_range(self, offset, size, typ = _ELF_T_BYTE, chunk_size = 1 << 20):
+        """
+        Lazy scan over a range of the file, e.g. a huge section or segment, in
+        chunks of about chunk_size bytes holding whole typ entries. Yields the
+        file offset and a memoryview of each chunk in memory representation.
+        Chunks are views of the mapped file image unless the entries need
+        swapping or the descriptor was not opened with ELF_C_READ_MMAP, then
+        each chunk is read with pread() into one buffer reused for every chunk,
+        so a chunk is only valid until the next one is produced and memory use
+        does not grow with the size of the range. Raises ValueError if the
+        range is outside of the file or does not hold whole entries.
+        """
+        # elf_rawfile() would read in the whole file unless libelf mapped it
+        image = self.elf_rawfile() if self._mmap else None
+        filesize = len(image) if image is not None else os.fstat(self.filehandle.fileno()).st_size
+        if (offset < 0 or size < 0 or offset + size > filesize):
+            raise ValueError(f"Range {offset}+{size} is outside of the {filesize} byte file")
+        entsize = max(self.gelf_fsize(typ), 1)
+        if (size % entsize):
+            raise ValueError(f"Range size {size} is not a multiple of the {entsize} byte entries")
+        step = max(chunk_size - chunk_size % entsize, entsize)
+        end = offset + size
+        ehdr = self.gelf_getehdr()
+        encode = ehdr.e_ident[pylibelf.elf.EI_DATA]
+        elfclass = ehdr.e_ident[pylibelf.elf.EI_CLASS]
+        native = pylibelf.elf.ELFDATA2LSB if sys.byteorder == "little" else pylibelf.elf.ELFDATA2MSB
+        # Bytes and entries already in the byte order of the machine are handed out in place
+        translate = typ != _ELF_T_BYTE and encode != native
+        buffer = bytearray(min(step, size)) if translate or image is None else None
+        for start in range(offset, end, step):
+            count = min(step, end - start)
+            if (image is None):
+                chunk = memoryview(buffer)[:count]
+                if (os.preadv(self.filehandle.fileno(), [chunk], start) != count):
+                    raise ValueError(f"File truncated while reading {count} bytes at {start}")
+            else:
+                chunk = image[start:start + count]
+            if (translate):
+                out = memoryview(buffer)[:count]
+                # In place when the chunk was read into the buffer
+                xlatetom(chunk, typ, encode, elfclass, out)
+                chunk = out
+            yield start, chunk
+
+    def fingerprint(self, algorithm = "sha256", volatile = False, ignore = (),
+                    max_workers = None):
+        """ Content hashes of the sections and segments, see pylibelf.fingerprint """
+        # Imported here as pylibelf.fingerprint builds on this module
+        import pylibelf.fingerprint # pylint: disable=import-outside-toplevel
+        return pylibelf.fingerprint.fingerprint(self, algorithm, volatile, ignore, max_workers)
 
 
 def elf32_fsize(typ, count, version):
     return _libelf.elf32_fsize(typ, count, version)
 
 
-def _setup():
-    _libelf.elf_begin.restype = ctypes.c_void_p
-    _libelf.elf_begin.argtypes = [ctypes.c_int, ctypes.c_int, ctypes.c_void_p]
+def elf32_xlatetom(dst, src, encode):
+    return _not_null_or_error(_libelf.elf32_xlatetom(dst, src, encode))
+
+
+def elf32_xlatetof(dst, src, encode):
+    return _not_null_or_error(_libelf.elf32_xlatetof(dst, src, encode))
 
-    _libelf.elf_end.restype = ctypes.c_int
-    _libelf.elf_end.argtypes = [ctypes.c_void_p]
 
-    _libelf.elf_version.restype = ctypes.c_uint
-    _libelf.elf_version.argtypes = [ctypes.c_uint]
+def elf64_xlatetom(dst, src, encode):
+    return _not_null_or_error(_libelf.elf64_xlatetom(dst, src, encode))
 
-    _libelf.elf_kind.restype = ctypes.c_uint
-    _libelf.elf_kind.argtypes = [ctypes.c_void_p]
 
-    _libelf.elf32_getehdr.restype = ctypes.POINTER(pylibelf.elf.Elf32_Ehdr)
-    _libelf.elf32_getehdr.argtypes = [ctypes.c_void_p]
+def elf64_xlatetof(dst, src, encode):
+    return _not_null_or_error(_libelf.elf64_xlatetof(dst, src, encode))
 
-    _libelf.elf32_newehdr.restype = ctypes.POINTER(pylibelf.elf.Elf32_Ehdr)
-    _libelf.elf32_newehdr.argtypes = [ctypes.c_void_p]
 
-    _libelf.elf32_getphdr.restype = ctypes.POINTER(pylibelf.elf.Elf32_Phdr)
-    _libelf.elf32_getphdr.argtypes = [ctypes.c_void_p]
+_XLATE = {
+    (pylibelf.elf.ELFCLASS32, True): "elf32_xlatetom",
+    (pylibelf.elf.ELFCLASS32, False): "elf32_xlatetof",
+    (pylibelf.elf.ELFCLASS64, True): "elf64_xlatetom",
+    (pylibelf.elf.ELFCLASS64, False): "elf64_xlatetof"
+}
 
-    _libelf.elf32_newphdr.restype = ctypes.POINTER(pylibelf.elf.Elf32_Phdr)
-    _libelf.elf32_newphdr.argtypes = [ctypes.c_void_p, ctypes.c_size_t]
+def _xlate(data, d_type, encode, elfclass, out, tomemory):
+    source = _PinnedBuffer(data)
+    try:
+        size = source.size
+        if (out is None):
+            out = bytearray(size)
+        target = _PinnedBuffer(out)
+        try:
+            if (target.size < size or memoryview(out).readonly):
+                raise ValueError(f"Output needs {size} writable bytes")
+            src = Elf_Data(source.address, d_type, pylibelf.elf.EV_CURRENT, size, 0, 1)
+            dst = Elf_Data(target.address, d_type, pylibelf.elf.EV_CURRENT, target.size, 0, 1)
+            func = getattr(_libelf, _XLATE[(elfclass, tomemory)])
+            _not_null_or_error(func(ctypes.byref(dst), ctypes.byref(src), encode))
+        finally:
+            target.release()
+    finally:
+        source.release()
+    return out
 
-    _libelf.elf_flagphdr.restype = ctypes.c_uint
-    _libelf.elf_flagphdr.argtypes = [ctypes.c_void_p, ctypes.c_int, ctypes.c_uint]
+def xlatetom(data, d_type, encode, elfclass = pylibelf.elf.ELFCLASS32, out = None):
+    """
+    Translate a whole table of d_type entries, e.g. Elf_Type.ELF_T_SYM, from
+    its file representation in the encode byte order (ELFDATA2LSB or
+    ELFDATA2MSB) to memory in a single libelf call. data is any buffer
+    protocol object. The result goes to out, a new bytearray by default;
+    out may be data itself if it is writable to translate in place.
+    """
+    return _xlate(data, d_type, encode, elfclass, out, True)
+
+def xlatetof(data, d_type, encode, elfclass = pylibelf.elf.ELFCLASS32, out = None):
+    """ Reverse of xlatetom(), memory representation to the file one in the encode byte order """
+    return _xlate(data, d_type, encode, elfclass, out, False)
 
-    _libelf.elf_update.restype = ctypes.c_int
-    _libelf.elf_update.argtypes = [ctypes.c_void_p, ctypes.c_int]
 
-    _libelf.elf32_fsize.restype = ctypes.c_size_t
-    _libelf.elf32_fsize.argtypes = [ctypes.c_int, ctypes.c_size_t, ctypes.c_uint]
+def gelf_getdyn(data, index):
+    dyn = pylibelf.elf.Elf64_Dyn()
+    _not_null_or_error(_libelf.gelf_getdyn(data, index, ctypes.byref(dyn)))
+    return dyn
 
-    _libelf.elf_getscn.restype = ctypes.c_void_p
-    _libelf.elf_getscn.argtypes = [ctypes.c_void_p, ctypes.c_int]
 
-    _libelf.elf_nextscn.restype = ctypes.c_void_p
-    _libelf.elf_nextscn.argtypes = [ctypes.c_void_p, ctypes.c_void_p]
+def gelf_getsym(data, index):
+    sym = pylibelf.elf.Elf64_Sym()
+    _not_null_or_error(_libelf.gelf_getsym(data, index, ctypes.byref(sym)))
+    return sym
 
-    _libelf.elf_newscn.restype = ctypes.c_void_p
-    _libelf.elf_newscn.argtypes = [ctypes.c_void_p]
 
-    _libelf.elf32_getshdr.restype = ctypes.POINTER(pylibelf.elf.Elf32_Shdr)
-    _libelf.elf32_getshdr.argtypes = [ctypes.c_void_p]
+def gelf_getsymshndx(symdata, shndxdata, index):
+    """
+    Symbol at index of a symbol table and its SHT_SYMTAB_SHNDX word, shndxdata
+    is the Elf_Data of that section or None. Returns a tuple of (sym, xshndx)
+    """
+    sym = pylibelf.elf.Elf64_Sym()
+    xshndx = pylibelf.elf.Elf32_Word()
+    _not_null_or_error(_libelf.gelf_getsymshndx(symdata, shndxdata, index, ctypes.byref(sym),
+                                                ctypes.byref(xshndx)))
+    return (sym, xshndx.value)
 
-    _libelf.elf_getdata.restype = ctypes.POINTER(Elf_Data)
-    _libelf.elf_getdata.argtypes = [ctypes.c_void_p, ctypes.c_void_p]
 
-    _libelf.elf_newdata.restype = ctypes.POINTER(Elf_Data)
-    _libelf.elf_newdata.argtypes = [ctypes.c_void_p]
+def gelf_getrela(data, index):
+    rela = pylibelf.elf.Elf64_Rela()
+    _not_null_or_error(_libelf.gelf_getrela(data, index, ctypes.byref(rela)))
+    return rela
 
-    _libelf.elf_ndxscn.restype = ctypes.c_size_t
-    _libelf.elf_ndxscn.argtypes = [ctypes.c_void_p]
 
-    _true_or_error(_libelf.elf_version(1) != pylibelf.elf.EV_NONE)
+def gelf_getrel(data, index):
+    rel = pylibelf.elf.Elf64_Rel()
+    _not_null_or_error(_libelf.gelf_getrel(data, index, ctypes.byref(rel)))
+    return rel
 
 
-if __name__ == "pylibelf.libelf":
-    _setup()
+def gelf_getnote(data, offset):
+    """
+    Decode the note at offset in the Elf_Data returned by elf_getdata of a
+    SHT_NOTE section. Returns a tuple of (nhdr, name_offset, desc_offset,
+    next_offset); next_offset is 0 once past the last note
+    """
+    nhdr = pylibelf.elf.Elf64_Nhdr()
+    name_offset = ctypes.c_size_t()
+    desc_offset = ctypes.c_size_t()
+    next_offset = _libelf.gelf_getnote(data, offset, ctypes.byref(nhdr),
+                                       ctypes.byref(name_offset), ctypes.byref(desc_offset))
+    return (nhdr, name_offset.value, desc_offset.value, next_offset)
+
+
+def _prototypes():
+    """
+    restype and argtypes of every libelf function used, built when the library
+    is loaded as creating the POINTER types has a cost of its own
+    """
+    return {
+        "elf_begin": (ctypes.c_void_p, [ctypes.c_int, ctypes.c_int, ctypes.c_void_p]),
+        "elf_end": (ctypes.c_int, [ctypes.c_void_p]),
+        "elf_errno": (ctypes.c_int, []),
+        "elf_errmsg": (ctypes.c_char_p, [ctypes.c_int]),
+        "elf_version": (ctypes.c_uint, [ctypes.c_uint]),
+        "elf_memory": (ctypes.c_void_p, [ctypes.c_void_p, ctypes.c_size_t]),
+        "elf_kind": (ctypes.c_uint, [ctypes.c_void_p]),
+        "elf32_getehdr": (ctypes.POINTER(pylibelf.elf.Elf32_Ehdr), [ctypes.c_void_p]),
+        "elf32_newehdr": (ctypes.POINTER(pylibelf.elf.Elf32_Ehdr), [ctypes.c_void_p]),
+        "elf32_getphdr": (ctypes.POINTER(pylibelf.elf.Elf32_Phdr), [ctypes.c_void_p]),
+        "elf32_newphdr": (ctypes.POINTER(pylibelf.elf.Elf32_Phdr),
+                          [ctypes.c_void_p, ctypes.c_size_t]),
+        "elf_getphdrnum": (ctypes.c_int, [ctypes.c_void_p, ctypes.POINTER(ctypes.c_size_t)]),
+        "gelf_getphdr": (ctypes.POINTER(pylibelf.elf.Elf64_Phdr),
+                         [ctypes.c_void_p, ctypes.c_int, ctypes.POINTER(pylibelf.elf.Elf64_Phdr)]),
+        "elf_getshdrnum": (ctypes.c_int, [ctypes.c_void_p, ctypes.POINTER(ctypes.c_size_t)]),
+        "elf_getshdrstrndx": (ctypes.c_int, [ctypes.c_void_p, ctypes.POINTER(ctypes.c_size_t)]),
+        "elf_flagphdr": (ctypes.c_uint, [ctypes.c_void_p, ctypes.c_int, ctypes.c_uint]),
+        "elf_update": (ctypes.c_int64, [ctypes.c_void_p, ctypes.c_int]),
+        "elf32_fsize": (ctypes.c_size_t, [ctypes.c_int, ctypes.c_size_t, ctypes.c_uint]),
+        "elf32_xlatetom": (ctypes.POINTER(Elf_Data),
+                           [ctypes.POINTER(Elf_Data), ctypes.POINTER(Elf_Data), ctypes.c_uint]),
+        "elf32_xlatetof": (ctypes.POINTER(Elf_Data),
+                           [ctypes.POINTER(Elf_Data), ctypes.POINTER(Elf_Data), ctypes.c_uint]),
+        "elf64_xlatetom": (ctypes.POINTER(Elf_Data),
+                           [ctypes.POINTER(Elf_Data), ctypes.POINTER(Elf_Data), ctypes.c_uint]),
+        "elf64_xlatetof": (ctypes.POINTER(Elf_Data),
+                           [ctypes.POINTER(Elf_Data), ctypes.POINTER(Elf_Data), ctypes.c_uint]),
+        "elf_getdata_rawchunk": (ctypes.POINTER(Elf_Data), [ctypes.c_void_p, ctypes.c_int64,
+                                                            ctypes.c_size_t, ctypes.c_int]),
+        "gelf_fsize": (ctypes.c_size_t,
+                       [ctypes.c_void_p, ctypes.c_int, ctypes.c_size_t, ctypes.c_uint]),
+        "elf_getscn": (ctypes.c_void_p, [ctypes.c_void_p, ctypes.c_int]),
+        "elf_nextscn": (ctypes.c_void_p, [ctypes.c_void_p, ctypes.c_void_p]),
+        "elf_newscn": (ctypes.c_void_p, [ctypes.c_void_p]),
+        "elf32_getshdr": (ctypes.POINTER(pylibelf.elf.Elf32_Shdr), [ctypes.c_void_p]),
+        "elf_getdata": (ctypes.POINTER(Elf_Data), [ctypes.c_void_p, ctypes.c_void_p]),
+        "elf_newdata": (ctypes.POINTER(Elf_Data), [ctypes.c_void_p]),
+        "elf_ndxscn": (ctypes.c_size_t, [ctypes.c_void_p]),
+        "elf_strptr": (ctypes.c_char_p, [ctypes.c_void_p, ctypes.c_size_t, ctypes.c_size_t]),
+        "elf_rawfile": (ctypes.c_void_p, [ctypes.c_void_p, ctypes.POINTER(ctypes.c_size_t)]),
+        "gelf_getclass": (ctypes.c_int, [ctypes.c_void_p]),
+        "gelf_getehdr": (ctypes.POINTER(pylibelf.elf.Elf64_Ehdr),
+                         [ctypes.c_void_p, ctypes.POINTER(pylibelf.elf.Elf64_Ehdr)]),
+        "gelf_getshdr": (ctypes.POINTER(pylibelf.elf.Elf64_Shdr),
+                         [ctypes.c_void_p, ctypes.POINTER(pylibelf.elf.Elf64_Shdr)]),
+        "gelf_update_ehdr": (ctypes.c_int,
+                             [ctypes.c_void_p, ctypes.POINTER(pylibelf.elf.Elf64_Ehdr)]),
+        "gelf_update_shdr": (ctypes.c_int,
+                             [ctypes.c_void_p, ctypes.POINTER(pylibelf.elf.Elf64_Shdr)]),
+        "gelf_getdyn": (ctypes.POINTER(pylibelf.elf.Elf64_Dyn),
+                        [ctypes.POINTER(Elf_Data), ctypes.c_int,
+                         ctypes.POINTER(pylibelf.elf.Elf64_Dyn)]),
+        "gelf_getsym": (ctypes.POINTER(pylibelf.elf.Elf64_Sym),
+                        [ctypes.POINTER(Elf_Data), ctypes.c_int,
+                         ctypes.POINTER(pylibelf.elf.Elf64_Sym)]),
+        "gelf_getsymshndx": (ctypes.POINTER(pylibelf.elf.Elf64_Sym),
+                             [ctypes.POINTER(Elf_Data), ctypes.POINTER(Elf_Data), ctypes.c_int,
+                              ctypes.POINTER(pylibelf.elf.Elf64_Sym),
+                              ctypes.POINTER(pylibelf.elf.Elf32_Word)]),
+        "gelf_getrela": (ctypes.POINTER(pylibelf.elf.Elf64_Rela),
+                         [ctypes.POINTER(Elf_Data), ctypes.c_int,
+                          ctypes.POINTER(pylibelf.elf.Elf64_Rela)]),
+        "gelf_getrel": (ctypes.POINTER(pylibelf.elf.Elf64_Rel),
+                        [ctypes.POINTER(Elf_Data), ctypes.c_int,
+                         ctypes.POINTER(pylibelf.elf.Elf64_Rel)]),
+        "gelf_getnote": (ctypes.c_size_t,
+                         [ctypes.POINTER(Elf_Data), ctypes.c_size_t,
+                          ctypes.POINTER(pylibelf.elf.Elf64_Nhdr), ctypes.POINTER(ctypes.c_size_t),
+                          ctypes.POINTER(ctypes.c_size_t)])
+    }
@@ -0,0 +1,159 @@
+"""
+ SPDX-License-Identifier: MIT
+
+ Copyright (C) 2023 Advanced Micro Devices, Inc.
+
+ Value to name lookups for the constants of pylibelf.elf. Every group of
+ constants, e.g. SHT_*, is available as an IntEnum (IntFlag for SHF_* and
+ PF_*) and as a NameTable which maps values to names through a dense array,
+ so a whole column of values is rendered with a single gather. Both are
+ built on first access to keep the import cheap.
+"""
+
+import enum
+
+import pylibelf.elf
+
+# Group name -> (constant prefix, enum class)
+GROUPS = {
+    "ELFOSABI": ("ELFOSABI_", enum.IntEnum),
+    "ET":       ("ET_", enum.IntEnum),
+    "EM":       ("EM_", enum.IntEnum),
+    "PT":       ("PT_", enum.IntEnum),
+    "PF":       ("PF_", enum.IntFlag),
+    "SHN":      ("SHN_", enum.IntEnum),
+    "SHT":      ("SHT_", enum.IntEnum),
+    "SHF":      ("SHF_", enum.IntFlag),
+    "STB":      ("STB_", enum.IntEnum),
+    "STT":      ("STT_", enum.IntEnum),
+    "STV":      ("STV_", enum.IntEnum),
+    "DT":       ("DT_", enum.IntEnum),
+    "NT":       ("NT_", enum.IntEnum),
+    "NT_GNU":   ("NT_GNU_", enum.IntEnum),
+    "R_386":    ("R_386_", enum.IntEnum),
+    "R_M32R":   ("R_M32R_", enum.IntEnum)
+}
+
+# Range bounds and counts which share their value with a real constant
+_MARKERS = frozenset(["NUM", "LOOS", "HIOS", "LOPROC", "HIPROC", "LOUSER", "HIUSER", "LOSUNW",
+                      "HISUNW", "LORESERVE", "HIRESERVE", "MASKOS", "MASKPROC"])
+
+# Values below this are kept in the dense array, the OS and processor specific ranges
+# go to a dict
+DENSE_LIMIT = 4096
+
+def _constants(prefix):
+    """ (name, value) of the constants with the prefix, range markers last """
+    items = [(name, value) for name, value in vars(pylibelf.elf).items()
+             if name.startswith(prefix) and isinstance(value, int)]
+    return ([item for item in items if item[0][len(prefix):] not in _MARKERS] +
+            [item for item in items if item[0][len(prefix):] in _MARKERS])
+
+def _is_numpy(values):
+    return type(values).__module__ == "numpy"
+
+class NameTable:
+    """
+    Map of the values of one group of constants to their names without the
+    prefix, e.g. SHT_PROGBITS renders as PROGBITS. Where several constants
+    share a value the first one defined wins. Unknown values render as
+    <unknown: 0x...>.
+    """
+    def __init__(self, prefix, constants):
+        self.prefix = prefix
+        known = {}
+        for name, value in constants:
+            if (name[len(prefix):] in _MARKERS):
+                continue
+            known.setdefault(value, name[len(prefix):])
+        dense = [value for value in known if 0 <= value < DENSE_LIMIT]
+        size = max(dense) + 1 if dense else 0
+        self.names = tuple(known.get(value, self.unknown(value)) for value in range(size))
+        self._sparse = {value: name for value, name in known.items() if not 0 <= value < size}
+        self._array = None
+
+    @staticmethod
+    def unknown(value):
+        return f"<unknown: {value:#x}>"
+
+    def get(self, value, default = None):
+        name = self[value]
+        return default if name == self.unknown(value) else name
+
+    def __getitem__(self, value):
+        if (0 <= value < len(self.names)):
+            return self.names[value]
+        return self._sparse.get(value) or self.unknown(value)
+
+    def __len__(self):
+        return len(self.values())
+
+    def values(self):
+        """ All the known values in increasing order """
+        return [value for value, name in enumerate(self.names) if name != self.unknown(value)] + \
+            sorted(self._sparse)
+
+    def gather(self, values):
+        """
+        Names of all the values. A NumPy integer array gives back a NumPy object
+        array gathered in one indexing operation, anything else a list.
+        """
+        if (not _is_numpy(values)):
+            if (not isinstance(values, (list, tuple))):
+                values = list(values)
+            if (not values or (min(values) >= 0 and max(values) < len(self.names))):
+                # Everything is in the dense array, gather at C speed
+                return list(map(self.names.__getitem__, values))
+            return [self[value] for value in values]
+
+        import numpy # pylint: disable=import-outside-toplevel
+        if (self._array is None):
+            # The extra last slot catches every value outside of the dense range
+            self._array = numpy.array(self.names + ("",), dtype = object)
+        size = len(self.names)
+        index = numpy.where((values >= 0) & (values < size), values, size)
+        result = self._array[index]
+        outside = index == size
+        if (outside.any()):
+            for value in numpy.unique(values[outside]):
+                result[outside & (values == value)] = self[int(value)]
+        return result
+
+_cache = {}
+
+def _build(name):
+    if (name.endswith("_NAMES") and name[:-len("_NAMES")] in GROUPS):
+        prefix = GROUPS[name[:-len("_NAMES")]][0]
+        return NameTable(prefix, _constants(prefix))
+    prefix, kind = GROUPS[name]
+    return kind(name, _constants(prefix))
+
+def __getattr__(name):
+    """ SHT, SHF, ... are the enums and SHT_NAMES, SHF_NAMES, ... the name tables """
+    if (name not in _cache):
+        if (name not in GROUPS and not (name.endswith("_NAMES") and
+                                        name[:-len("_NAMES")] in GROUPS)):
+            raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+        _cache[name] = _build(name)
+    return _cache[name]
+
+def _st_info_table(name, decode):
+    """ NameTable indexed directly by the st_info byte so no per-row shift or mask is needed """
+    key = "st_info:" + name
+    if (key not in _cache):
+        table = __getattr__(name)
+        _cache[key] = NameTable("", [(table[decode(info)], info) for info in range(256)])
+    return _cache[key]
+
+def st_bind_names(infos):
+    """ STB_* names of a column of st_info values """
+    return _st_info_table("STB_NAMES", lambda info: info >> 4).gather(infos)
+
+def st_type_names(infos):
+    """ STT_* names of a column of st_info values """
+    return _st_info_table("STT_NAMES", lambda info: info & 0xf).gather(infos)
+
+def flag_names(group, value):
+    """ Names of the flags of an IntFlag group set in value, e.g. flag_names("SHF", sh_flags) """
+    table = __getattr__(group + "_NAMES")
+    return [table[bit] for bit in table.values() if bit and value & bit == bit]
@@ -0,0 +1,54 @@
+"""
+ SPDX-License-Identifier: MIT
+
+ Copyright (C) 2023 Advanced Micro Devices, Inc.
+
+ Parsing of SHT_NOTE sections, in particular the GNU build ID note
+"""
+
+import ctypes
+import collections
+
+import pylibelf.elf
+import pylibelf.libelf
+
+ElfNote = collections.namedtuple("ElfNote", ["name", "type", "desc"])
+
+def iter_notes(scn):
+    """
+    Generator over all the notes stored in the given SHT_NOTE section, yields
+    ElfNote tuples with the owner name decoded and the descriptor as bytes
+    """
+    data = scn.elf_getdata()
+    base = data.contents.d_buf
+    string_at = scn.owner.string_at if scn.owner is not None else ctypes.string_at
+    offset = 0
+    while (offset < data.contents.d_size):
+        nhdr, name_offset, desc_offset, offset = pylibelf.libelf.gelf_getnote(data, offset)
+        if (offset == 0):
+            break
+        name = string_at(base + name_offset, nhdr.n_namesz)
+        desc = string_at(base + desc_offset, nhdr.n_descsz)
+        yield ElfNote(name.rstrip(b'\0').decode("utf-8", "replace"), nhdr.n_type, desc)
+
+def elf_build_id(melf):
+    """
+    Return the NT_GNU_BUILD_ID descriptor of an open ElfDescriptor as bytes
+    or None if the file does not carry a build ID
+    """
+    scn = melf.elf_nextscn(None)
+    while (scn is not None):
+        if (scn.gelf_getshdr().sh_type == pylibelf.elf.SHT_NOTE):
+            for note in iter_notes(scn):
+                if (note.type == pylibelf.elf.NT_GNU_BUILD_ID and
+                    note.name == pylibelf.elf.ELF_NOTE_GNU):
+                    return note.desc
+        scn = melf.elf_nextscn(scn)
+    return None
+
+def file_build_id(filename):
+    """ Convenience wrapper around elf_build_id() for a file on disk """
+    melf = pylibelf.libelf.ElfDescriptor.fromfile(filename, pylibelf.libelf.Elf_Cmd.ELF_C_READ_MMAP)
+    if (melf.elf_kind() != pylibelf.libelf.Elf_Kind.ELF_K_ELF):
+        return None
+    return elf_build_id(melf)
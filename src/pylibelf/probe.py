@@ -0,0 +1,74 @@
+"""
+ SPDX-License-Identifier: MIT
+
+ Copyright (C) 2023 Advanced Micro Devices, Inc.
+
+ Header only identification of ELF files. A single pread of the first 64
+ bytes is decoded in Python without going through elf_begin, which makes
+ this a cheap filter before committing to a full parse.
+"""
+
+import os
+import struct
+import collections
+import concurrent.futures
+
+import pylibelf.elf
+
+ElfProbe = collections.namedtuple("ElfProbe", ["elfclass", "data", "version", "osabi", "abiversion",
+                                               "type", "machine", "entry", "phoff", "shoff",
+                                               "flags", "ehsize", "phentsize", "phnum",
+                                               "shentsize", "shnum", "shstrndx"])
+
+# Size of Elf64_Ehdr, the larger of the two headers
+PROBE_SIZE = 64
+
+_MAGIC = pylibelf.elf.ELFMAG.encode("latin-1")
+
+# Elf32_Ehdr and Elf64_Ehdr layouts after e_ident, indexed by (class, data)
+_EHDR_FORMATS = {
+    (pylibelf.elf.ELFCLASS32, pylibelf.elf.ELFDATA2LSB): struct.Struct("<HHIIIIIHHHHHH"),
+    (pylibelf.elf.ELFCLASS32, pylibelf.elf.ELFDATA2MSB): struct.Struct(">HHIIIIIHHHHHH"),
+    (pylibelf.elf.ELFCLASS64, pylibelf.elf.ELFDATA2LSB): struct.Struct("<HHIQQQIHHHHHH"),
+    (pylibelf.elf.ELFCLASS64, pylibelf.elf.ELFDATA2MSB): struct.Struct(">HHIQQQIHHHHHH")
+}
+
+def decode(header):
+    """ Decode an ELF header from bytes, returns an ElfProbe or None if header is not ELF """
+    if (len(header) < pylibelf.elf.EI_NIDENT or header[:pylibelf.elf.SELFMAG] != _MAGIC):
+        return None
+    elfclass = header[pylibelf.elf.EI_CLASS]
+    data = header[pylibelf.elf.EI_DATA]
+    layout = _EHDR_FORMATS.get((elfclass, data))
+    if (layout is None or len(header) < pylibelf.elf.EI_NIDENT + layout.size):
+        return None
+    (e_type, e_machine, _, e_entry, e_phoff, e_shoff, e_flags, e_ehsize, e_phentsize,
+     e_phnum, e_shentsize, e_shnum, e_shstrndx) = layout.unpack_from(header, pylibelf.elf.EI_NIDENT)
+    return ElfProbe(elfclass, data, header[pylibelf.elf.EI_VERSION], header[pylibelf.elf.EI_OSABI],
+                    header[pylibelf.elf.EI_ABIVERSION], e_type, e_machine, e_entry, e_phoff,
+                    e_shoff, e_flags, e_ehsize, e_phentsize, e_phnum, e_shentsize, e_shnum,
+                    e_shstrndx)
+
+def probe(filename):
+    """
+    Identify the file with a single pread of its header. Returns an ElfProbe
+    or None if the file is not ELF, is truncated or cannot be read.
+    """
+    try:
+        fd = os.open(filename, os.O_RDONLY)
+    except OSError:
+        return None
+    try:
+        return decode(os.pread(fd, PROBE_SIZE, 0))
+    except OSError:
+        return None
+    finally:
+        os.close(fd)
+
+def probe_many(filenames, max_workers = None):
+    """
+    Batched probe() over a list of files, the preads are issued from a thread
+    pool. Returns a list of ElfProbe or None in the order of filenames.
+    """
+    with concurrent.futures.ThreadPoolExecutor(max_workers = max_workers) as executor:
+        return list(executor.map(probe, filenames))
@@ -0,0 +1,414 @@
+"""
+ SPDX-License-Identifier: MIT
+
+ Copyright (C) 2023 Advanced Micro Devices, Inc.
+
+ readelf like command line tool, run as "python -m pylibelf" or through the
+ installed pylibelf script. Tables are decoded in fixed size batches straight
+ from a read only mapping of the file and the output is written in large
+ buffered chunks, so memory use does not grow with the size of the file.
+ Output is text or, with --json, one JSON object per line.
+"""
+
+import os
+import sys
+import mmap
+import json
+import struct
+import argparse
+
+import pylibelf.elf
+import pylibelf.libelf
+import pylibelf.names
+import pylibelf.notes
+import pylibelf.instrument
+import pylibelf.dynamic
+import pylibelf.sections
+import pylibelf.segments
+
+# Bytes of output collected before they are written out
+BUFFER_SIZE = 1 << 16
+
+# Table entries decoded per batch
+BATCH_ENTRIES = 4096
+
+# Bytes rendered per batch by the hexdump, a multiple of 16
+HEXDUMP_CHUNK = 1 << 16
+
+# (class, data) -> struct format of Elf*_Sym and the positions of name, value, size, info,
+# other and shndx in it
+_SYM_FORMATS = {
+    (pylibelf.elf.ELFCLASS32, pylibelf.elf.ELFDATA2LSB): ("<IIIBBH", (0, 1, 2, 3, 4, 5)),
+    (pylibelf.elf.ELFCLASS32, pylibelf.elf.ELFDATA2MSB): (">IIIBBH", (0, 1, 2, 3, 4, 5)),
+    (pylibelf.elf.ELFCLASS64, pylibelf.elf.ELFDATA2LSB): ("<IBBHQQ", (0, 4, 5, 1, 2, 3)),
+    (pylibelf.elf.ELFCLASS64, pylibelf.elf.ELFDATA2MSB): (">IBBHQQ", (0, 4, 5, 1, 2, 3))
+}
+
+# (class, data, sh_type) -> struct format of Elf*_Rel and Elf*_Rela
+_REL_FORMATS = {
+    (pylibelf.elf.ELFCLASS32, pylibelf.elf.ELFDATA2LSB, pylibelf.elf.SHT_REL): "<II",
+    (pylibelf.elf.ELFCLASS32, pylibelf.elf.ELFDATA2MSB, pylibelf.elf.SHT_REL): ">II",
+    (pylibelf.elf.ELFCLASS32, pylibelf.elf.ELFDATA2LSB, pylibelf.elf.SHT_RELA): "<IIi",
+    (pylibelf.elf.ELFCLASS32, pylibelf.elf.ELFDATA2MSB, pylibelf.elf.SHT_RELA): ">IIi",
+    (pylibelf.elf.ELFCLASS64, pylibelf.elf.ELFDATA2LSB, pylibelf.elf.SHT_REL): "<QQ",
+    (pylibelf.elf.ELFCLASS64, pylibelf.elf.ELFDATA2MSB, pylibelf.elf.SHT_REL): ">QQ",
+    (pylibelf.elf.ELFCLASS64, pylibelf.elf.ELFDATA2LSB, pylibelf.elf.SHT_RELA): "<QQq",
+    (pylibelf.elf.ELFCLASS64, pylibelf.elf.ELFDATA2MSB, pylibelf.elf.SHT_RELA): ">QQq"
+}
+
+# Relocation type names by machine
+_RELOC_GROUPS = {
+    pylibelf.elf.EM_386: "R_386_NAMES",
+    pylibelf.elf.EM_M32R: "R_M32R_NAMES"
+}
+
+_SHF_LETTERS = [(pylibelf.elf.SHF_WRITE, "W"), (pylibelf.elf.SHF_ALLOC, "A"),
+                (pylibelf.elf.SHF_EXECINSTR, "X"), (pylibelf.elf.SHF_MERGE, "M"),
+                (pylibelf.elf.SHF_STRINGS, "S"), (pylibelf.elf.SHF_INFO_LINK, "I"),
+                (pylibelf.elf.SHF_LINK_ORDER, "L"), (pylibelf.elf.SHF_OS_NONCONFORMING, "O"),
+                (pylibelf.elf.SHF_GROUP, "G"), (pylibelf.elf.SHF_TLS, "T"),
+                (pylibelf.elf.SHF_COMPRESSED, "C")]
+
+_PF_LETTERS = [(pylibelf.elf.PF_R, "R"), (pylibelf.elf.PF_W, "W"), (pylibelf.elf.PF_X, "E")]
+
+_SHN_SPECIAL = {pylibelf.elf.SHN_UNDEF: "UND", pylibelf.elf.SHN_ABS: "ABS",
+                pylibelf.elf.SHN_COMMON: "COM", pylibelf.elf.SHN_XINDEX: "XINDEX"}
+
+# Printable ASCII maps to itself, everything else to "."
+_PRINTABLE = bytes(value if 0x20 <= value < 0x7f else 0x2e for value in range(256))
+
+def _letters(table, value):
+    return "".join(letter for bit, letter in table if value & bit)
+
+def hexdump(data, address = 0):
+    """
+    readelf -x style lines of 16 bytes each for a bytes like object. The hex
+    and ASCII columns of the whole buffer are rendered with one call each and
+    then sliced into lines.
+    """
+    data = bytes(data)
+    words = data.hex(" ", -4)
+    text = data.translate(_PRINTABLE).decode("ascii")
+    # Each full line takes four 8 digit words separated by spaces
+    return [f"  {address + pos:#010x} {words[pos * 9 // 4:pos * 9 // 4 + 35]:<35} "
+            f"{text[pos:pos + 16]}" for pos in range(0, len(data), 16)]
+
+class _Output:
+    """ Buffered writer of text lines or JSON Lines records """
+    def __init__(self, stream, jsonl):
+        self._stream = stream
+        self.jsonl = jsonl
+        self._lines = []
+        self._size = 0
+        self.filename = None
+
+    def _append(self, line):
+        self._lines.append(line)
+        self._size += len(line) + 1
+        if (self._size >= BUFFER_SIZE):
+            self.flush()
+
+    def flush(self):
+        if (self._lines):
+            self._lines.append("")
+            self._stream.write("\n".join(self._lines))
+            self._lines = []
+            self._size = 0
+
+    def text(self, line):
+        """ Line shown in text mode only, e.g. a table heading """
+        if (not self.jsonl):
+            self._append(line)
+
+    def lines(self, lines):
+        """ Text lines written as they are """
+        for line in lines:
+            self._append(line)
+
+    def record(self, kind, record, render):
+        """ Record rendered as text by render(record) or written as a JSON object """
+        if (self.jsonl):
+            self._append(json.dumps({"file": self.filename, "kind": kind, **record}))
+        else:
+            self._append(render(record))
+
+class _ElfFile:
+    """ libelf descriptor for the headers and a read only mapping for the table contents """
+    def __init__(self, filename):
+        self.melf = pylibelf.libelf.ElfDescriptor.fromfile(filename,
+                                                           pylibelf.libelf.Elf_Cmd.ELF_C_READ_MMAP)
+        if (self.melf.elf_kind() != pylibelf.libelf.Elf_Kind.ELF_K_ELF):
+            raise ValueError(f"{filename} is not an ELF file")
+        self.ehdr = self.melf.gelf_getehdr()
+        self.layout = (self.ehdr.e_ident[pylibelf.elf.EI_CLASS],
+                       self.ehdr.e_ident[pylibelf.elf.EI_DATA])
+        if (self.layout not in _SYM_FORMATS):
+            raise ValueError(f"{filename} has an unsupported class or data encoding")
+        self.sections = pylibelf.sections.SectionIndex(self.melf)
+        self._filehandle = open(filename, "rb")
+        self._map = mmap.mmap(self._filehandle.fileno(), 0, access = mmap.ACCESS_READ)
+        self.view = memoryview(self._map)
+
+    def close(self):
+        self.view.release()
+        self._map.close()
+        self._filehandle.close()
+
+    def payload(self, section):
+        size = self.sections.file_size(section)
+        return self.view[section.offset:section.offset + size]
+
+    def string(self, section, offset):
+        """ NUL terminated string at offset in the string table section """
+        start = section.offset + offset
+        end = section.offset + section.size
+        if (offset >= section.size):
+            return ""
+        stop = self._map.find(b"\0", start, end)
+        return self._map[start:stop if stop >= 0 else end].decode("utf-8", "replace")
+
+    def iter_entries(self, section, layout):
+        """ Batches of the fixed size entries of a table section decoded with struct """
+        entsize = struct.calcsize(layout)
+        if (section.entsize and section.entsize != entsize):
+            raise ValueError(f"Section {section.name} has unexpected entry size {section.entsize}")
+        count = self.sections.file_size(section) // entsize
+        for start in range(0, count, BATCH_ENTRIES):
+            stop = min(start + BATCH_ENTRIES, count)
+            chunk = self.view[section.offset + start * entsize:section.offset + stop * entsize]
+            yield start, list(struct.iter_unpack(layout, chunk))
+            chunk.release()
+
+def _render_header(record):
+    lines = ["ELF Header:"]
+    lines += [f"  {name.replace('_', ' ').capitalize() + ':':<34} {value}"
+              for name, value in record.items()]
+    return "\n".join(lines)
+
+def _headers(elf, out):
+    ehdr = elf.ehdr
+    names = pylibelf.names
+    ident = ehdr.e_ident
+    record = {
+        "class": "ELF64" if ident[pylibelf.elf.EI_CLASS] == pylibelf.elf.ELFCLASS64 else "ELF32",
+        "data": ("little endian" if ident[pylibelf.elf.EI_DATA] == pylibelf.elf.ELFDATA2LSB
+                 else "big endian"),
+        "osabi": names.ELFOSABI_NAMES[ident[pylibelf.elf.EI_OSABI]],
+        "abi_version": ident[pylibelf.elf.EI_ABIVERSION],
+        "type": names.ET_NAMES[ehdr.e_type],
+        "machine": names.EM_NAMES[ehdr.e_machine],
+        "version": ehdr.e_version,
+        "entry": ehdr.e_entry,
+        "phoff": ehdr.e_phoff,
+        "shoff": ehdr.e_shoff,
+        "flags": ehdr.e_flags,
+        "ehsize": ehdr.e_ehsize,
+        "phentsize": ehdr.e_phentsize,
+        "phnum": ehdr.e_phnum,
+        "shentsize": ehdr.e_shentsize,
+        "shnum": ehdr.e_shnum,
+        "shstrndx": ehdr.e_shstrndx
+    }
+    out.record("header", record, _render_header)
+
+    out.text("\nProgram Headers:")
+    out.text("  Type           Offset   VirtAddr   PhysAddr   FileSiz MemSiz  Flg Align")
+    for item in pylibelf.segments.iter_phdrs(elf.melf):
+        record = item._asdict()
+        record["type"] = names.PT_NAMES[item.type]
+        record["flags"] = _letters(_PF_LETTERS, item.flags)
+        out.record("segment", record, lambda rec: (
+            f"  {rec['type']:<14} {rec['offset']:#08x} {rec['vaddr']:#010x} {rec['paddr']:#010x} "
+            f"{rec['filesz']:#07x} {rec['memsz']:#07x} {rec['flags']:<3} {rec['align']:#x}"))
+
+def _sections(elf, out):
+    out.text("Section Headers:")
+    out.text("  [Nr] Name              Type            Addr     Off    Size   ES Flg Lk Inf Al")
+    table = pylibelf.names.SHT_NAMES
+    for item in elf.sections:
+        record = item._asdict()
+        record["type"] = table[item.type]
+        record["flags"] = _letters(_SHF_LETTERS, item.flags)
+        out.record("section", record, lambda rec: (
+            f"  [{rec['index']:>2}] {rec['name']:<17} {rec['type']:<15} {rec['addr']:08x} "
+            f"{rec['offset']:06x} {rec['size']:06x} {rec['entsize']:02x} {rec['flags']:>3} "
+            f"{rec['link']:>2} {rec['info']:>3} {rec['addralign']:>2}"))
+
+def _render_symbol(rec):
+    shndx = _SHN_SPECIAL.get(rec["shndx"], rec["shndx"])
+    return (f"{rec['index']:>6}: {rec['value']:08x} {rec['size']:>5} {rec['type']:<7} "
+            f"{rec['bind']:<6} {rec['visibility']:<8} {shndx:>3} {rec['name']}")
+
+def _symbols(elf, out):
+    layout, (name_at, value_at, size_at, info_at, other_at, shndx_at) = _SYM_FORMATS[elf.layout]
+    visibility = pylibelf.names.STV_NAMES
+    for section in elf.sections:
+        if (section.type not in (pylibelf.elf.SHT_SYMTAB, pylibelf.elf.SHT_DYNSYM)):
+            continue
+        strtab = elf.sections[section.link]
+        out.text(f"\nSymbol table '{section.name}':")
+        out.text("   Num:    Value  Size Type    Bind   Vis      Ndx Name")
+        xsection = elf.sections.shndx_section(section.index)
+        for start, rows in elf.iter_entries(section, layout):
+            shndxs = [row[shndx_at] for row in rows]
+            if (xsection is not None):
+                # SHN_XINDEX symbols take their section index from the SHT_SYMTAB_SHNDX word
+                end = xsection.offset + min((start + len(rows)) * 4, xsection.size)
+                words = pylibelf.sections.xindex_words(elf.view[xsection.offset + start * 4:end],
+                                                       elf.layout[1] == pylibelf.elf.ELFDATA2MSB)
+                shndxs = pylibelf.sections.resolve_shndx(shndxs, words)
+            infos = [row[info_at] for row in rows]
+            binds = pylibelf.names.st_bind_names(infos)
+            types = pylibelf.names.st_type_names(infos)
+            for pos, row in enumerate(rows):
+                record = {"section": section.name, "index": start + pos,
+                          "name": elf.string(strtab, row[name_at]), "value": row[value_at],
+                          "size": row[size_at], "type": types[pos], "bind": binds[pos],
+                          "visibility": visibility[pylibelf.elf.ELF32_ST_VISIBILITY(row[other_at])],
+                          "shndx": shndxs[pos]}
+                out.record("symbol", record, _render_symbol)
+
+def _render_reloc(rec):
+    addend = f" + {rec['addend']:x}" if rec["addend"] is not None else ""
+    return (f"{rec['offset']:08x}  {rec['info']:08x} {rec['type']:<16} {rec['symbol_value']:08x} "
+            f"{rec['symbol']}{addend}")
+
+def _relocs(elf, out):
+    names = pylibelf.names
+    group = _RELOC_GROUPS.get(elf.ehdr.e_machine)
+    table = getattr(names, group) if group else None
+    elf64 = elf.layout[0] == pylibelf.elf.ELFCLASS64
+    split = ((pylibelf.elf.ELF64_R_SYM, pylibelf.elf.ELF64_R_TYPE) if elf64 else
+             (pylibelf.elf.ELF32_R_SYM, pylibelf.elf.ELF32_R_TYPE))
+    symlayout, symfields = _SYM_FORMATS[elf.layout]
+    symsize = struct.calcsize(symlayout)
+    for section in elf.sections:
+        if (section.type not in (pylibelf.elf.SHT_REL, pylibelf.elf.SHT_RELA)):
+            continue
+        symtab = elf.sections[section.link] if section.link else None
+        strtab = elf.sections[symtab.link] if symtab is not None else None
+        out.text(f"\nRelocation section '{section.name}':")
+        out.text(" Offset     Info    Type             Sym.Value  Sym. Name + Addend")
+        for _, rows in elf.iter_entries(section, _REL_FORMATS[elf.layout + (section.type,)]):
+            for row in rows:
+                symindex = split[0](row[1])
+                rtype = split[1](row[1])
+                name = ""
+                value = 0
+                if (symtab is not None and symindex and (symindex + 1) * symsize <= symtab.size):
+                    sym = struct.unpack_from(symlayout, elf.view,
+                                             symtab.offset + symindex * symsize)
+                    name = elf.string(strtab, sym[symfields[0]])
+                    value = sym[symfields[1]]
+                record = {"section": section.name, "offset": row[0], "info": row[1],
+                          "type": table[rtype] if table is not None else str(rtype),
+                          "symbol": name, "symbol_value": value,
+                          "addend": row[2] if len(row) > 2 else None}
+                out.record("reloc", record, _render_reloc)
+
+def _notes(elf, out):
+    for section in elf.sections:
+        if (section.type != pylibelf.elf.SHT_NOTE):
+            continue
+        out.text(f"\nDisplaying notes found in: {section.name}")
+        out.text("  Owner                Data size\tDescription")
+        for note in pylibelf.notes.iter_notes(elf.melf.elf_getscn(section.index)):
+            table = (pylibelf.names.NT_GNU_NAMES if note.name == pylibelf.elf.ELF_NOTE_GNU
+                     else pylibelf.names.NT_NAMES)
+            record = {"section": section.name, "owner": note.name, "type": table[note.type],
+                      "size": len(note.desc), "desc": note.desc.hex()}
+            out.record("note", record, lambda rec: (
+                f"  {rec['owner']:<20} {rec['size']:#010x}\t{rec['type']}\n    {rec['desc']}"))
+
+def _dynamic(elf, out):
+    out.text("\nDynamic section:")
+    out.text("  Tag        Type                 Name/Value")
+    table = pylibelf.names.DT_NAMES
+    for entry in pylibelf.dynamic.iter_dynamic(elf.melf):
+        record = {"tag": entry.tag, "type": table[entry.tag], "value": entry.value,
+                  "string": entry.string}
+        out.record("dynamic", record, lambda rec: (
+            f" {rec['tag']:#012x} {rec['type']:<20} "
+            f"{rec['string'] if rec['string'] is not None else hex(rec['value'])}"))
+
+def _hexdump(elf, out, selector):
+    section = (elf.sections[int(selector)] if selector.isdigit() and
+               int(selector) < len(elf.sections) else elf.sections.by_name(selector))
+    if (section is None):
+        raise ValueError(f"No section {selector}")
+    out.text(f"\nHex dump of section '{section.name}':")
+    payload = elf.payload(section)
+    for start in range(0, len(payload), HEXDUMP_CHUNK):
+        lines = hexdump(payload[start:start + HEXDUMP_CHUNK], section.addr + start)
+        if (not out.jsonl):
+            out.lines(lines)
+            continue
+        for line in lines:
+            out.record("hexdump", {"section": section.name, "line": line.strip()}, None)
+    payload.release()
+
+COMMANDS = {
+    "headers": _headers,
+    "sections": _sections,
+    "symbols": _symbols,
+    "relocs": _relocs,
+    "notes": _notes,
+    "dynamic": _dynamic
+}
+
+def parse_command_line(args):
+    parser = argparse.ArgumentParser(prog = "pylibelf",
+                                     description = "Display information about ELF files")
+    parser.add_argument("-j", "--json", action = "store_true",
+                        help = "Write JSON Lines instead of text")
+    parser.add_argument("-p", "--profile", action = "store_true",
+                        help = "Print libelf call statistics to stderr when done")
+    commands = parser.add_subparsers(dest = "command", required = True)
+    for name in COMMANDS:
+        command = commands.add_parser(name, help = f"Display the {name}")
+        command.add_argument("files", nargs = "+")
+    hexcmd = commands.add_parser("hexdump", help = "Display the contents of a section in hex")
+    hexcmd.add_argument("-s", "--section", required = True, help = "Section name or number")
+    hexcmd.add_argument("files", nargs = "+")
+    return parser.parse_args(args[1:])
+
+def main(args, stream = None):
+    """ Run the command line in args, argv[0] included, returns the exit status """
+    argtab = parse_command_line(args)
+    if (argtab.profile):
+        with pylibelf.instrument.profiled() as profile:
+            status = _run(argtab, stream)
+        print(profile, file = sys.stderr)
+        return status
+    return _run(argtab, stream)
+
+def _run(argtab, stream):
+    out = _Output(stream if stream is not None else sys.stdout, argtab.json)
+    status = 0
+    try:
+        for filename in argtab.files:
+            out.filename = filename
+            if (len(argtab.files) > 1):
+                out.text(f"\nFile: {filename}")
+            try:
+                elf = _ElfFile(filename)
+                try:
+                    if (argtab.command == "hexdump"):
+                        _hexdump(elf, out, argtab.section)
+                    else:
+                        COMMANDS[argtab.command](elf, out)
+                finally:
+                    elf.close()
+            except (OSError, ValueError, pylibelf.libelf.ElfError) as error:
+                out.flush()
+                print(f"pylibelf: {filename}: {error}", file = sys.stderr)
+                status = 1
+        out.flush()
+        (stream or sys.stdout).flush()
+    except BrokenPipeError:
+        # The reader went away, e.g. piped into head, keep the interpreter from complaining
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+    return status
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -0,0 +1,396 @@
+"""
+ SPDX-License-Identifier: MIT
+
+ Copyright (C) 2023 Advanced Micro Devices, Inc.
+
+ Apply the SHT_REL, SHT_RELA and SHT_RELR sections of an ELF file to the
+ contents of the sections they patch. Relocation types are handled by per machine
+ tables of RelocationHandler objects, entries are grouped by type and every
+ handler patches its whole group in one batch.
+"""
+
+import sys
+import array
+import bisect
+import struct
+import operator
+import itertools
+import collections
+
+import pylibelf.elf
+import pylibelf.tables
+import pylibelf.sections
+
+_FIELDS = {1: "B", 2: "H", 4: "I", 8: "Q"}
+
+_NATIVE = "<" if sys.byteorder == "little" else ">"
+
+_UNDEFINED = frozenset([pylibelf.elf.SHN_UNDEF, pylibelf.elf.SHN_COMMON])
+
+# Layout of the entries as (entsize, [(byte position, array typecode) of every column])
+_RELOCATIONS = {
+    (pylibelf.elf.ELFCLASS32, pylibelf.elf.SHT_REL):  (8, [(0, "I"), (4, "I")]),
+    (pylibelf.elf.ELFCLASS32, pylibelf.elf.SHT_RELA): (12, [(0, "I"), (4, "I"), (8, "i")]),
+    (pylibelf.elf.ELFCLASS64, pylibelf.elf.SHT_REL):  (16, [(0, "Q"), (8, "Q")]),
+    (pylibelf.elf.ELFCLASS64, pylibelf.elf.SHT_RELA): (24, [(0, "Q"), (8, "Q"), (16, "q")])
+}
+
+_SECTION_TYPES = frozenset([pylibelf.elf.SHT_REL, pylibelf.elf.SHT_RELA, pylibelf.elf.SHT_RELR])
+
+# st_name, st_value, st_info and st_shndx of Elf32_Sym and Elf64_Sym
+_SYMBOLS = {
+    pylibelf.elf.ELFCLASS32: (16, [(0, "I"), (4, "I"), (12, "B"), (14, "H")]),
+    pylibelf.elf.ELFCLASS64: (24, [(0, "I"), (8, "Q"), (4, "B"), (6, "H")])
+}
+
+def _columns(raw, byteorder, layout):
+    """ Fields of a table of fixed size entries as arrays, one per column of the layout """
+    entsize, fields = layout
+    raw = raw[:len(raw) - len(raw) % entsize]
+    columns = []
+    for position, code in fields:
+        values = array.array(code)
+        values.frombytes(raw)
+        if (byteorder != _NATIVE):
+            values.byteswap()
+        columns.append(values[position // values.itemsize::entsize // values.itemsize])
+    return columns
+
+class RelocationHandler:
+    """
+    One relocation type. compute(symbols, addends, places, base) gives the
+    values of a whole group of entries from the lists of symbol values S,
+    addends A and addresses of the places P and the load base B. Each value
+    shifted right by shift replaces the mask bits of the size bytes field at
+    its place. low lists the relocation types whose 16 bit field holds the
+    sign extended low half of the SHT_REL addend of a high half type, the
+    entry paired with is the next one of such a type against the same symbol.
+    Subclass and override apply() and addends() for types which do not fit
+    this scheme.
+    """
+    def __init__(self, name, size, compute, mask = None, shift = 0, signed = False, low = ()):
+        self.name = name
+        self.size = size
+        self.compute = compute
+        self.full = (1 << (8 * size)) - 1
+        self.mask = self.full if mask is None else mask
+        self.shift = shift
+        self.signed = signed
+        self.low = frozenset(low)
+
+    def __repr__(self):
+        return f"RelocationHandler({self.name})"
+
+    def addends(self, buffer, byteorder, offsets):
+        """ Implicit addends of SHT_REL entries read back from the fields """
+        field = struct.Struct(byteorder + _FIELDS[self.size])
+        values = [item[0] & self.mask for item in map(field.unpack_from,
+                                                      itertools.repeat(buffer), offsets)]
+        if (self.signed):
+            sign = (self.mask + 1) >> 1
+            values = [(value ^ sign) - sign for value in values]
+        return [value << self.shift for value in values]
+
+    def apply(self, buffer, byteorder, offsets, symbols, addends, places, base):
+        """ Patch the fields at offsets of buffer, one entry per offset """
+        field = struct.Struct(byteorder + _FIELDS[self.size])
+        shift = self.shift
+        mask = self.mask
+        values = self.compute(symbols, addends, places, base)
+        if (mask == self.full and not shift):
+            # Whole field, no need to read the place first
+            collections.deque(map(field.pack_into, itertools.repeat(buffer), offsets,
+                                  map(mask.__and__, values)), 0)
+            return
+        keep = self.full & ~mask
+        unpack = field.unpack_from
+        pack = field.pack_into
+        for offset, value in zip(offsets, values):
+            pack(buffer, offset, (unpack(buffer, offset)[0] & keep) | ((value >> shift) & mask))
+
+
+# Computations of whole groups, columns of S, A and P in, iterable of values out
+
+def _absolute(symbols, addends, _places, _base):
+    return map(operator.add, symbols, addends)
+
+def _pcrel(symbols, addends, places, _base):
+    return map(operator.sub, map(operator.add, symbols, addends), places)
+
+def _pcrel_word(symbols, addends, places, _base):
+    return map(operator.sub, map(operator.add, symbols, addends), map((~3).__and__, places))
+
+def _high_adjusted(symbols, addends, _places, _base):
+    # The low half is sign extended by the instruction using it
+    return map((0x8000).__add__, map(operator.add, symbols, addends))
+
+def _symbol(symbols, _addends, _places, _base):
+    return symbols
+
+def _relative(_symbols, addends, _places, base):
+    return map(base.__add__, addends)
+
+# machine -> relocation type -> RelocationHandler, None for types with nothing to patch
+HANDLERS = {}
+
+# Pseudo relocation type of the SHT_RELR entries, relative relocations with the addend in place
+RELR = "RELR"
+
+def register(machine, rtype, handler):
+    """ Install the handler of relocation type rtype of the EM_* machine for all new engines """
+    HANDLERS.setdefault(machine, {})[rtype] = handler
+
+def _register_all(machine, table):
+    for rtype, handler in table.items():
+        register(machine, rtype, handler)
+
+_register_all(pylibelf.elf.EM_386, {
+    pylibelf.elf.R_386_NONE:      None,
+    pylibelf.elf.R_386_COPY:      None,
+    pylibelf.elf.R_386_32:        RelocationHandler("R_386_32", 4, _absolute),
+    pylibelf.elf.R_386_PC32:      RelocationHandler("R_386_PC32", 4, _pcrel),
+    pylibelf.elf.R_386_GLOB_DAT:  RelocationHandler("R_386_GLOB_DAT", 4, _symbol),
+    pylibelf.elf.R_386_JUMP_SLOT: RelocationHandler("R_386_JUMP_SLOT", 4, _symbol),
+    pylibelf.elf.R_386_RELATIVE:  RelocationHandler("R_386_RELATIVE", 4, _relative)
+})
+
+def _m32r(name, *args, low = (), **kwargs):
+    # The REL and RELA flavours of a type only differ in where the addend is, except
+    # for the high halves whose REL addend is split with the paired LO16 field
+    handler = RelocationHandler(name, *args, **kwargs)
+    rel = RelocationHandler(name, *args, low = low, **kwargs) if low else handler
+    return {getattr(pylibelf.elf, name): rel, getattr(pylibelf.elf, name + "_RELA"): handler}
+
+_M32R = {
+    pylibelf.elf.R_M32R_NONE:               None,
+    pylibelf.elf.R_M32R_GNU_VTINHERIT:      None,
+    pylibelf.elf.R_M32R_GNU_VTENTRY:        None,
+    pylibelf.elf.R_M32R_RELA_GNU_VTINHERIT: None,
+    pylibelf.elf.R_M32R_RELA_GNU_VTENTRY:   None,
+    pylibelf.elf.R_M32R_COPY:               None,
+    pylibelf.elf.R_M32R_REL32:    RelocationHandler("R_M32R_REL32", 4, _pcrel),
+    pylibelf.elf.R_M32R_GLOB_DAT: RelocationHandler("R_M32R_GLOB_DAT", 4, _symbol),
+    pylibelf.elf.R_M32R_JMP_SLOT: RelocationHandler("R_M32R_JMP_SLOT", 4, _symbol),
+    pylibelf.elf.R_M32R_RELATIVE: RelocationHandler("R_M32R_RELATIVE", 4, _relative),
+    **_m32r("R_M32R_16", 2, _absolute),
+    **_m32r("R_M32R_32", 4, _absolute),
+    **_m32r("R_M32R_24", 4, _absolute, 0xffffff),
+    **_m32r("R_M32R_10_PCREL", 2, _pcrel_word, 0xff, 2, True),
+    **_m32r("R_M32R_18_PCREL", 4, _pcrel_word, 0xffff, 2, True),
+    **_m32r("R_M32R_26_PCREL", 4, _pcrel_word, 0xffffff, 2, True),
+    **_m32r("R_M32R_HI16_ULO", 4, _absolute, 0xffff, 16, low = [pylibelf.elf.R_M32R_LO16]),
+    **_m32r("R_M32R_HI16_SLO", 4, _high_adjusted, 0xffff, 16, low = [pylibelf.elf.R_M32R_LO16]),
+    **_m32r("R_M32R_LO16", 4, _absolute, 0xffff)
+}
+
+# EM_M32 is repurposed by our own target which uses the M32R relocations
+_register_all(pylibelf.elf.EM_M32R, _M32R)
+_register_all(pylibelf.elf.EM_M32, _M32R)
+
+
+def _gather(column, numbers):
+    """ Entries of a column picked by a group, the column itself for a group of all of them """
+    if (len(numbers) == len(column)):
+        return column
+    return list(map(column.__getitem__, numbers))
+
+class RelocationEngine:
+    """
+    Applies the relocation sections of a relocatable or executable descriptor.
+    The descriptor is only read, apply() returns relocated copies of the
+    patched sections. handlers extends or overrides the registered handlers of
+    the machine for this engine only.
+    """
+    def __init__(self, melf, handlers = None):
+        self._melf = melf
+        self._image = melf.elf_rawfile()
+        ehdr = melf.gelf_getehdr()
+        self.machine = ehdr.e_machine
+        self.relocatable = ehdr.e_type == pylibelf.elf.ET_REL
+        self.elfclass = melf.gelf_getclass()
+        msb = ehdr.e_ident[pylibelf.elf.EI_DATA] == pylibelf.elf.ELFDATA2MSB
+        self.byteorder = ">" if msb else "<"
+        self.sections = pylibelf.sections.SectionIndex(melf)
+        self.handlers = dict(HANDLERS.get(self.machine, {}))
+        self.wordsize = 8 if self.elfclass == pylibelf.elf.ELFCLASS64 else 4
+        self.handlers[RELR] = RelocationHandler(RELR, self.wordsize, _relative)
+        self.handlers.update(handlers or {})
+        self._loaded = None
+
+    def relocation_sections(self):
+        """ SectionInfo of all the SHT_REL, SHT_RELA and SHT_RELR sections """
+        return [item for item in self.sections if item.type in _SECTION_TYPES]
+
+    def _raw(self, item):
+        return self._image[item.offset:item.offset + self.sections.file_size(item)]
+
+    def _entries(self, item):
+        """ Columns offsets, symbols, types and addends of a relocation section, None for REL """
+        if (item.type == pylibelf.elf.SHT_RELR):
+            words = _columns(self._raw(item), self.byteorder,
+                             (self.wordsize, [(0, _FIELDS[self.wordsize])]))[0]
+            offsets = pylibelf.tables.relr_decode(words, self.wordsize)
+            return offsets, [0] * len(offsets), [RELR] * len(offsets), None
+        layout = _RELOCATIONS[(self.elfclass, item.type)]
+        columns = _columns(self._raw(item), self.byteorder, layout)
+        infos = columns[1]
+        bits = 32 if self.elfclass == pylibelf.elf.ELFCLASS64 else 8
+        symbols = list(map(bits.__rrshift__, infos))
+        types = list(map(((1 << bits) - 1).__and__, infos))
+        return columns[0], symbols, types, columns[2] if len(columns) > 2 else None
+
+    def _locate(self, vaddr):
+        """ Index of the allocated section with contents holding vaddr """
+        if (self._loaded is None):
+            self._loaded = sorted((item.addr, item.addr + item.size, item.index)
+                                  for item in self.sections
+                                  if (item.flags & pylibelf.elf.SHF_ALLOC and item.size and
+                                      item.type != pylibelf.elf.SHT_NOBITS))
+        pos = bisect.bisect_right(self._loaded, (vaddr, float("inf"))) - 1
+        if (pos < 0 or vaddr >= self._loaded[pos][1]):
+            raise ValueError(f"Relocation at {hex(vaddr)} is outside of all loaded sections")
+        return self._loaded[pos][2]
+
+    def _symbol_values(self, index, resolve, addresses, base):
+        """ Value of every symbol of the table, None for undefined symbols resolve does not know """
+        if (not index):
+            return [0]
+        item = self.sections[index]
+        names, values, infos, shndxs = _columns(self._raw(item), self.byteorder,
+                                                _SYMBOLS[self.elfclass])
+        # What every section adds to the st_value of its symbols
+        placed = [0] * len(self.sections)
+        for section in self.sections:
+            if (section.index):
+                placed[section.index] = (addresses.get(section.index, section.addr)
+                                         if self.relocatable else base)
+        # Same by st_shndx, reserved indexes add nothing
+        shift = (placed[:pylibelf.elf.SHN_LORESERVE] + [0] * (1 << 16))[:1 << 16]
+        values = list(map(int.__add__, values, map(shift.__getitem__, shndxs)))
+        xsection = self.sections.shndx_section(index)
+        if (xsection is not None):
+            # SHN_XINDEX symbols are in the section given by the SHT_SYMTAB_SHNDX word
+            xindexes = pylibelf.sections.xindex_words(self._raw(xsection), self.byteorder == ">")
+            for number in itertools.compress(range(len(shndxs)),
+                                             map(pylibelf.elf.SHN_XINDEX.__eq__, shndxs)):
+                if (number < len(xindexes) and xindexes[number] < len(placed)):
+                    values[number] += placed[xindexes[number]]
+        values[0] = 0
+        for number in itertools.compress(range(len(shndxs)), map(_UNDEFINED.__contains__, shndxs)):
+            if (not number):
+                continue
+            value = resolve(self._melf.elf_strptr(item.link, names[number])) if resolve else None
+            if (value is None and infos[number] >> 4 == pylibelf.elf.STB_WEAK):
+                value = 0
+            values[number] = value
+        return values
+
+    def _group(self, item, types, offsets):
+        """ Entries of one relocation section as (target, type) -> list of entry numbers """
+        if (self.relocatable or item.info):
+            keys = types
+            target = item.info
+        else:
+            keys = list(zip(map(self._locate, offsets), types))
+            target = None
+        order = sorted(range(len(keys)), key = keys.__getitem__)
+        groups = {}
+        for key, numbers in itertools.groupby(order, key = keys.__getitem__):
+            groups[(target, key) if target is not None else key] = list(numbers)
+        return groups
+
+    def _pair_low(self, implicit, types, symbols):
+        """ Add the low half of the paired entry to the implicit addends of high half types """
+        lows = set().union(*(item.low for item in self.handlers.values() if item is not None))
+        if (not lows):
+            return
+        # (symbol, low half type) -> number of the next such entry
+        following = {}
+        for number in reversed(range(len(types))):
+            rtype = types[number]
+            handler = self.handlers.get(rtype)
+            if (handler is not None and handler.low):
+                pairs = [following[(symbols[number], low)] for low in handler.low
+                         if (symbols[number], low) in following]
+                if (not pairs):
+                    raise ValueError(f"Relocation {handler.name} without its low half")
+                implicit[number] += ((implicit[min(pairs)] & 0xffff) ^ 0x8000) - 0x8000
+            if (rtype in lows):
+                following[(symbols[number], rtype)] = number
+
+    def _handler(self, rtype):
+        if (rtype not in self.handlers):
+            raise ValueError(f"No handler for relocation type {rtype} of machine {self.machine}")
+        return self.handlers[rtype]
+
+    def apply(self, resolve = None, addresses = None, base = 0):
+        """
+        Relocated copies of the contents of all the sections patched by
+        relocations as section index -> bytearray. resolve maps the names of
+        undefined symbols to values, either a dict or a callable returning None
+        for unknown names; unresolved weak symbols are 0. For relocatable
+        files addresses maps section indexes to the addresses the sections are
+        placed at, sh_addr by default; other files are placed at load base.
+        Raises ValueError for unknown relocation types, unresolved symbols and
+        places outside of their section.
+        """
+        if (isinstance(resolve, dict)):
+            resolve = resolve.get
+        addresses = addresses or {}
+        contents = {}
+        symtabs = {}
+        for item in self.relocation_sections():
+            offsets, symbols, types, addends = self._entries(item)
+            if (not offsets):
+                continue
+            if (item.link not in symtabs):
+                symtabs[item.link] = self._symbol_values(item.link, resolve, addresses, base)
+            values = symtabs[item.link]
+            jobs = []
+            for (target, rtype), numbers in self._group(item, types, offsets).items():
+                handler = self._handler(rtype)
+                if (handler is None):
+                    continue
+                section = self.sections[target]
+                if (section.type == pylibelf.elf.SHT_NOBITS):
+                    raise ValueError(f"Relocation {handler.name} patches SHT_NOBITS section "
+                                     f"{section.name}")
+                if (target not in contents):
+                    contents[target] = bytearray(self._raw(section))
+                buffer = contents[target]
+                places = _gather(offsets, numbers)
+                if (self.relocatable):
+                    where = places
+                    places = list(map(addresses.get(target, section.addr).__add__, where))
+                else:
+                    where = list(map((-section.addr).__add__, places))
+                    places = list(map(base.__add__, places))
+                if (min(where) < 0 or max(where) + handler.size > len(buffer)):
+                    raise ValueError(f"Relocation {handler.name} outside of section {section.name}")
+                resolved = list(map(values.__getitem__, _gather(symbols, numbers)))
+                if (None in resolved):
+                    name = self._symbol_name(item.link, symbols[numbers[resolved.index(None)]])
+                    raise ValueError(f"Relocation {handler.name} against undefined symbol {name}")
+                jobs.append((handler, buffer, numbers, where, resolved, places))
+            if (addends is None):
+                # Implicit addends are all read before any field is patched, a high
+                # half takes the low half from the field of its paired entry
+                addends = [0] * len(offsets)
+                for handler, buffer, numbers, where, _, _ in jobs:
+                    for number, addend in zip(numbers, handler.addends(buffer, self.byteorder,
+                                                                        where)):
+                        addends[number] = addend
+                self._pair_low(addends, types, symbols)
+            for handler, buffer, numbers, where, resolved, places in jobs:
+                handler.apply(buffer, self.byteorder, where, resolved, _gather(addends, numbers),
+                              places, base)
+        return contents
+
+    def _symbol_name(self, index, number):
+        item = self.sections[index]
+        names = _columns(self._raw(item), self.byteorder, _SYMBOLS[self.elfclass])[0]
+        return self._melf.elf_strptr(item.link, names[number])
+
+def apply_relocations(melf, resolve = None, addresses = None, base = 0):
+    """ RelocationEngine(melf).apply(), see there """
+    return RelocationEngine(melf).apply(resolve, addresses, base)
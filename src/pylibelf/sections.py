@@ -0,0 +1,100 @@
+"""
+ SPDX-License-Identifier: MIT
+
+ Copyright (C) 2023 Advanced Micro Devices, Inc.
+
+ Class independent index of the section headers of an ELF file
+"""
+
+import sys
+import array
+import itertools
+import collections
+
+import pylibelf.elf
+import pylibelf.libelf
+
+SectionInfo = collections.namedtuple("SectionInfo", ["index", "name", "type", "flags", "addr",
+                                                     "offset", "size", "link", "info",
+                                                     "addralign", "entsize"])
+
+class SectionIndex:
+    """
+    Snapshot of all the section headers of an ElfDescriptor decoded once
+    through gelf_getshdr with names resolved through .shstrtab. Supports
+    len(), iteration, indexing by section number and lookup by name.
+    """
+    def __init__(self, melf):
+        # Resolves SHN_XINDEX, files with more sections than SHN_LORESERVE keep it in section 0
+        strndx = melf.elf_getshdrstrndx()
+        self._sections = []
+        self._byname = {}
+        scn = melf.elf_getscn(0)
+        while (scn is not None):
+            shdr = scn.gelf_getshdr()
+            index = scn.elf_ndxscn()
+            name = melf.elf_strptr(strndx, shdr.sh_name) if (index and strndx) else ""
+            info = SectionInfo(index, name, shdr.sh_type, shdr.sh_flags, shdr.sh_addr,
+                               shdr.sh_offset, shdr.sh_size, shdr.sh_link, shdr.sh_info,
+                               shdr.sh_addralign, shdr.sh_entsize)
+            self._sections.append(info)
+            self._byname.setdefault(name, info)
+            scn = melf.elf_nextscn(scn)
+
+    @classmethod
+    def from_sections(cls, sections):
+        """ Index over SectionInfo tuples decoded elsewhere, e.g. by pylibelf.cache """
+        index = cls.__new__(cls)
+        index._sections = list(sections)
+        index._byname = {}
+        for info in index._sections:
+            index._byname.setdefault(info.name, info)
+        return index
+
+    def __len__(self):
+        return len(self._sections)
+
+    def __iter__(self):
+        return iter(self._sections)
+
+    def __getitem__(self, index):
+        return self._sections[index]
+
+    def by_name(self, name):
+        """ First section with the given name or None """
+        return self._byname.get(name)
+
+    def by_type(self, sh_type):
+        """ List of all the sections of the given SHT_* type """
+        return [item for item in self._sections if item.type == sh_type]
+
+    def shndx_section(self, index):
+        """ SHT_SYMTAB_SHNDX section of the symbol table with the given index or None """
+        for item in self._sections:
+            if (item.type == pylibelf.elf.SHT_SYMTAB_SHNDX and item.link == index):
+                return item
+        return None
+
+    def file_size(self, item):
+        """ Number of bytes the section occupies in the file, SHT_NOBITS occupy none """
+        return 0 if item.type == pylibelf.elf.SHT_NOBITS else item.size
+
+def xindex_words(raw, msb = False):
+    """ Words of a SHT_SYMTAB_SHNDX section from its bytes in file byte order """
+    words = array.array("I")
+    words.frombytes(bytes(raw[:len(raw) - len(raw) % 4]))
+    if (msb != (sys.byteorder == "big")):
+        words.byteswap()
+    return words
+
+def resolve_shndx(shndxs, xindexes):
+    """
+    Section index of every symbol from the st_shndx column of a symbol table
+    and the words of its SHT_SYMTAB_SHNDX section, None if it has none.
+    SHN_XINDEX is replaced by the word of the symbol, other reserved indexes,
+    e.g. SHN_ABS, are kept.
+    """
+    if (xindexes is None):
+        return list(shndxs)
+    return [xindex if shndx == pylibelf.elf.SHN_XINDEX else shndx
+            for shndx, xindex in zip(shndxs, itertools.chain(xindexes, itertools.repeat(0)))]
@@ -0,0 +1,121 @@
+"""
+ SPDX-License-Identifier: MIT
+
+ Copyright (C) 2023 Advanced Micro Devices, Inc.
+
+ Program header iteration and a segment index translating between virtual
+ addresses and file offsets
+"""
+
+import bisect
+import collections
+
+import pylibelf.elf
+import pylibelf.libelf
+import pylibelf.sections
+
+SegmentInfo = collections.namedtuple("SegmentInfo", ["index", "type", "flags", "offset", "vaddr",
+                                                     "paddr", "filesz", "memsz", "align"])
+
+def iter_phdrs(melf):
+    """ Generator over the program headers of an ElfDescriptor as class independent SegmentInfo """
+    for index in range(melf.elf_getphdrnum()):
+        phdr = melf.gelf_getphdr(index)
+        yield SegmentInfo(index, phdr.p_type, phdr.p_flags, phdr.p_offset, phdr.p_vaddr,
+                          phdr.p_paddr, phdr.p_filesz, phdr.p_memsz, phdr.p_align)
+
+def section_in_segment(section, segment):
+    """
+    True if the section is part of the segment, same rules as binutils
+    ELF_SECTION_IN_SEGMENT: allocated sections have to fit within the memory
+    image and sections with file contents within the file image. .tbss only
+    belongs to PT_TLS, it takes no space in the other segments.
+    """
+    if (section.index == 0 or section.type == pylibelf.elf.SHT_NULL):
+        return False
+    nobits = (section.type == pylibelf.elf.SHT_NOBITS)
+    if (nobits and section.flags & pylibelf.elf.SHF_TLS and segment.type != pylibelf.elf.PT_TLS):
+        return False
+    if (not nobits):
+        if (section.offset < segment.offset or
+            section.offset + section.size > segment.offset + segment.filesz):
+            return False
+        if (section.size == 0 and segment.filesz and section.offset == segment.offset + segment.filesz):
+            return False
+    if (section.flags & pylibelf.elf.SHF_ALLOC):
+        if (section.addr < segment.vaddr or
+            section.addr + section.size > segment.vaddr + segment.memsz):
+            return False
+        if (nobits and section.size == 0 and section.addr == segment.vaddr + segment.memsz
+            and segment.memsz):
+            return False
+    elif (nobits or segment.type == pylibelf.elf.PT_LOAD):
+        # Non allocated sections are never part of a loaded image
+        return False
+    return True
+
+
+class SegmentIndex:
+    """
+    Index over the PT_LOAD segments of an ElfDescriptor. Address and offset
+    lookups are binary searches over the segment start addresses, the
+    section <-> segment mapping is computed once for all program headers.
+    """
+    def __init__(self, melf, sections = None):
+        self.segments = list(iter_phdrs(melf))
+        self.sections = sections if sections is not None else pylibelf.sections.SectionIndex(melf)
+
+        loads = [item for item in self.segments if item.type == pylibelf.elf.PT_LOAD]
+        self._byvaddr = sorted(loads, key = lambda item: item.vaddr)
+        self._vaddrs = [item.vaddr for item in self._byvaddr]
+        self._byoffset = sorted((item for item in loads if item.filesz),
+                                key = lambda item: item.offset)
+        self._offsets = [item.offset for item in self._byoffset]
+
+        self._segment_sections = [[] for _ in self.segments]
+        self._section_segments = [[] for _ in self.sections]
+        for segment in self.segments:
+            for section in self.sections:
+                if (section_in_segment(section, segment)):
+                    self._segment_sections[segment.index].append(section.index)
+                    self._section_segments[section.index].append(segment.index)
+
+    def segment_for_vaddr(self, addr):
+        """ PT_LOAD segment whose memory image contains addr or None """
+        pos = bisect.bisect_right(self._vaddrs, addr) - 1
+        # PT_LOAD segments do not overlap in memory so only the closest one can match
+        if (pos >= 0 and addr < self._byvaddr[pos].vaddr + self._byvaddr[pos].memsz):
+            return self._byvaddr[pos]
+        return None
+
+    def segment_for_offset(self, offset):
+        """ PT_LOAD segment whose file image contains offset or None """
+        pos = bisect.bisect_right(self._offsets, offset) - 1
+        if (pos >= 0 and offset < self._byoffset[pos].offset + self._byoffset[pos].filesz):
+            return self._byoffset[pos]
+        return None
+
+    def vaddr_to_offset(self, addr):
+        """
+        File offset backing the virtual address, None when the address is not
+        mapped or falls in the zero filled (p_memsz > p_filesz) tail of a segment
+        """
+        segment = self.segment_for_vaddr(addr)
+        if (segment is None or addr - segment.vaddr >= segment.filesz):
+            return None
+        return segment.offset + (addr - segment.vaddr)
+
+    def offset_to_vaddr(self, offset):
+        """ Virtual address the file offset is loaded at or None """
+        segment = self.segment_for_offset(offset)
+        if (segment is None):
+            return None
+        return segment.vaddr + (offset - segment.offset)
+
+    def sections_in_segment(self, index):
+        """ Section indices contained in the program header with the given index """
+        return self._segment_sections[index]
+
+    def segments_of_section(self, index):
+        """ Program header indices containing the section with the given index """
+        return self._section_segments[index]
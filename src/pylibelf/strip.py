@@ -0,0 +1,434 @@
+"""
+ SPDX-License-Identifier: MIT
+
+ Copyright (C) 2023 Advanced Micro Devices, Inc.
+
+ Remove sections, e.g. the debug information, from an ELF file without a
+ libelf read-modify-write. The new layout is computed from the headers, the
+ unchanged byte ranges are copied by the kernel with copy_file_range() or
+ sendfile() and only the section headers, .shstrtab and the tables holding
+ section or symbol indexes are regenerated.
+"""
+
+import os
+import sys
+import array
+import errno
+import bisect
+import struct
+import argparse
+import tempfile
+import collections
+
+import pylibelf.elf
+import pylibelf.libelf
+import pylibelf.sections
+import pylibelf.segments
+
+StripResult = collections.namedtuple("StripResult", ["removed", "size"])
+
+# Sections removed by strip(debug = True)
+DEBUG_PREFIXES = (".debug", ".zdebug", ".gnu.debuglto_", ".stab", ".line")
+
+# Section header and the e_shoff, e_shnum and e_shstrndx offsets in the ELF header per class
+_SHDR = {pylibelf.elf.ELFCLASS32: "10I", pylibelf.elf.ELFCLASS64: "IIQQQQIIQQ"}
+_EHDR_FIELDS = {pylibelf.elf.ELFCLASS32: ((32, "I"), (48, "H"), (50, "H")),
+                pylibelf.elf.ELFCLASS64: ((40, "Q"), (60, "H"), (62, "H"))}
+# Position of st_shndx and size of Elf32_Sym and Elf64_Sym in halfwords
+_SYM_SHNDX = {pylibelf.elf.ELFCLASS32: (7, 8), pylibelf.elf.ELFCLASS64: (3, 12)}
+
+# Kernel side copies first, read and write as the last resort
+COPY_METHODS = ("copy_file_range", "sendfile", "pread")
+_FALLBACK_ERRORS = frozenset([errno.ENOSYS, errno.EXDEV, errno.EINVAL, errno.EOPNOTSUPP,
+                              errno.EBADF, errno.EPERM])
+_CHUNK = 1 << 20
+
+def copy_range(source, destination, offset, target, count, methods = None):
+    """
+    Copy count bytes at offset of the file descriptor source to target of
+    destination, in the kernel where the system and file systems allow it.
+    methods is a list out of COPY_METHODS in the order to try them, methods
+    which fail for this pair of files are dropped from it so the caller can
+    pass the same list for every range of one copy.
+    """
+    if (methods is None):
+        methods = list(COPY_METHODS)
+    while (count > 0):
+        method = methods[0]
+        try:
+            if (method == "copy_file_range"):
+                done = os.copy_file_range(source, destination, count, offset, target)
+            elif (method == "sendfile"):
+                os.lseek(destination, target, os.SEEK_SET)
+                done = os.sendfile(destination, source, offset, count)
+            else:
+                done = os.pwrite(destination, os.pread(source, min(count, _CHUNK), offset), target)
+        except (OSError, AttributeError) as error:
+            if (method == "pread" or getattr(error, "errno", errno.ENOSYS) not in _FALLBACK_ERRORS):
+                raise
+            methods.pop(0)
+            continue
+        if (done == 0):
+            raise ValueError(f"File ends before offset {offset + count}")
+        offset += done
+        target += done
+        count -= done
+
+def _align(offset, alignment):
+    return offset if alignment <= 1 else (offset + alignment - 1) // alignment * alignment
+
+def _links_index(item):
+    """ True if sh_info of the section is a section index rather than a count """
+    return (item.type in (pylibelf.elf.SHT_REL, pylibelf.elf.SHT_RELA) or
+            bool(item.flags & pylibelf.elf.SHF_INFO_LINK))
+
+def _select(sections, shstrndx, names, debug, symbols):
+    """ Indexes of the sections to remove including the ones depending on them """
+    removed = {item.index for item in sections
+               if item.index and (item.name in names or
+                                  (debug and item.name.startswith(DEBUG_PREFIXES)))}
+    # Symbol tables and their string tables only go if nothing kept refers to them
+    optional = set()
+    if (symbols):
+        for item in sections.by_type(pylibelf.elf.SHT_SYMTAB):
+            optional.update((item.index, item.link))
+        optional -= removed
+        removed |= optional
+    removed.discard(0)
+    optional.discard(0)
+    if (shstrndx in removed):
+        # Names are only dropped from the section header string table, never the table itself
+        removed.discard(shstrndx)
+    extended = pylibelf.elf.SHT_SYMTAB_SHNDX
+    changed = True
+    while (changed):
+        changed = False
+        for item in sections:
+            if (item.index in removed or not item.index or item.type == extended):
+                continue
+            target = item.info if _links_index(item) else 0
+            if (target in removed):
+                if (item.type not in (pylibelf.elf.SHT_REL, pylibelf.elf.SHT_RELA)):
+                    raise ValueError(f"Section {item.name} refers to a removed section")
+                # Relocations of a removed section go with it
+                removed.add(item.index)
+                changed = True
+            elif (item.link in removed):
+                if (item.link not in optional):
+                    raise ValueError(f"Section {item.name} refers to a removed section")
+                # A symbol or string table still used by a kept section stays
+                removed.discard(item.link)
+                optional.discard(item.link)
+                changed = True
+    # Extended section indexes follow their symbol table
+    for item in sections.by_type(extended):
+        if (item.link in removed):
+            removed.add(item.index)
+        elif (item.index in removed):
+            raise ValueError(f"Section {item.name} is needed by a kept symbol table")
+    for index in removed:
+        if (sections[index].flags & pylibelf.elf.SHF_ALLOC):
+            raise ValueError(f"Allocated section {sections[index].name} cannot be removed")
+    return removed
+
+def _fixed_end(melf, ehdr):
+    """ End of the part of the file which stays in place: ELF and program headers and segments """
+    end = ehdr.e_ehsize
+    segments = list(pylibelf.segments.iter_phdrs(melf))
+    if (segments):
+        end = max(end, ehdr.e_phoff + len(segments) * ehdr.e_phentsize)
+    for segment in segments:
+        if (segment.filesz):
+            end = max(end, segment.offset + segment.filesz)
+    return end
+
+class _Rewriter:
+    """ Layout and regenerated contents of one stripped file """
+    def __init__(self, melf, sections, removed, shstrndx, byteorder):
+        self.sections = sections
+        self.removed = removed
+        self.byteorder = byteorder
+        self.elfclass = melf.gelf_getclass()
+        self.kept = [item for item in sections if item.index not in removed]
+        # Old section index -> new one, removed sections map to SHN_UNDEF
+        self.remap = [0] * len(sections)
+        for number, item in enumerate(self.kept):
+            self.remap[item.index] = number
+        self.identity = all(self.remap[item.index] == item.index for item in self.kept)
+        self.shstrndx = shstrndx
+        self.offsets = {}
+        self.sizes = {}
+        self.infos = {}
+        # Old -> new symbol index of the symbol tables losing symbols, -1 for dropped ones
+        self.symbols = {}
+        self.runs = []
+        self.patches = []
+
+    def layout(self, fixed_end):
+        """ New offsets of the kept sections and the byte ranges to copy, returns the end """
+        # Ranges of the removed sections and the regenerated .shstrtab, closing their gaps
+        gone = sorted((item.offset, item.offset + item.size) for item in self.sections
+                      if item.index and (item.index in self.removed or item.index == self.shstrndx)
+                      and item.type != pylibelf.elf.SHT_NOBITS)
+        starts = [start for start, _ in gone]
+        self.runs = [[0, fixed_end, 0]]
+        cursor = fixed_end
+        previous = fixed_end
+        shift = 0
+        withbytes = sorted((item for item in self.kept
+                            if item.index and item.index != self.shstrndx and
+                            item.type != pylibelf.elf.SHT_NOBITS and item.size),
+                           key = lambda item: item.offset)
+        for item in withbytes:
+            end = item.offset + item.size
+            if (item.offset < self.runs[0][1]):
+                # Inside the part that stays in place
+                self.offsets[item.index] = item.offset
+                self.runs[0][1] = max(self.runs[0][1], end)
+                cursor = previous = max(cursor, end)
+                continue
+            between = bisect.bisect_left(starts, item.offset) > bisect.bisect_left(starts, previous)
+            run = self.runs[-1]
+            if (between or item.offset - shift < cursor):
+                shift = item.offset - _align(cursor, item.addralign)
+                run = [item.offset, end, shift]
+                self.runs.append(run)
+            run[1] = max(run[1], end)
+            self.offsets[item.index] = item.offset - shift
+            cursor = max(cursor, end - shift)
+            previous = end
+        for item in self.kept:
+            if (item.index not in self.offsets):
+                self.offsets[item.index] = min(item.offset, cursor) if item.index else 0
+        return cursor
+
+    def names(self):
+        """ The new .shstrtab and the offset of the name of every kept section in it """
+        table = bytearray(b"\0")
+        positions = {"": 0}
+        for item in self.kept:
+            if (item.name not in positions):
+                positions[item.name] = len(table)
+                table += item.name.encode("utf-8") + b"\0"
+        return bytes(table), positions
+
+    def _values(self, raw, typecode):
+        """ array of the raw words in the byte order of the machine """
+        values = array.array(typecode)
+        values.frombytes(raw[:len(raw) - len(raw) % values.itemsize])
+        if (self.byteorder != ("<" if sys.byteorder == "little" else ">")):
+            values.byteswap()
+        return values
+
+    def _remap_column(self, raw, typecode, start, step, limit = pylibelf.elf.SHN_LORESERVE):
+        """ Rewrite a column of section indexes in place, indexes from limit on are kept """
+        values = self._values(raw, typecode)
+        swap = self.byteorder != ("<" if sys.byteorder == "little" else ">")
+        remap = self.remap
+        column = values[start::step]
+        limit = min(limit, len(remap))
+        values[start::step] = array.array(typecode, [remap[value] if value < limit else value
+                                                     for value in column])
+        if (swap):
+            values.byteswap()
+        return values.tobytes()
+
+    def _drop_symbols(self, image):
+        """ Map the symbols of the kept symbol tables, the ones of removed sections are dropped """
+        start, step = _SYM_SHNDX[self.elfclass]
+        for item in self.kept:
+            if (item.type != pylibelf.elf.SHT_SYMTAB):
+                continue
+            shndx = self._values(image[item.offset:item.offset + item.size], "H")[start::step]
+            xindex = next((self._values(image[other.offset:other.offset + other.size], "I")
+                           for other in self.kept if other.type == pylibelf.elf.SHT_SYMTAB_SHNDX
+                           and other.link == item.index), [])
+            mapping = []
+            count = 0
+            for number, value in enumerate(shndx):
+                if (value == pylibelf.elf.SHN_XINDEX and number < len(xindex)):
+                    value = xindex[number]
+                elif (value >= pylibelf.elf.SHN_LORESERVE):
+                    value = 0
+                if (value in self.removed):
+                    mapping.append(-1)
+                else:
+                    mapping.append(count)
+                    count += 1
+            if (count < len(mapping)):
+                self.symbols[item.index] = mapping
+
+    def _kept_entries(self, raw, size, mapping):
+        """ Entries of size bytes whose symbol is not dropped """
+        return b"".join(raw[number * size:(number + 1) * size]
+                        for number, new in enumerate(mapping) if new >= 0)
+
+    def _relocations(self, item, raw, mapping):
+        """ REL/RELA entries with their symbol indexes renumbered """
+        wide = self.elfclass == pylibelf.elf.ELFCLASS64
+        layout = ("QQ" if wide else "II") + (("q" if wide else "i")
+                                             if item.type == pylibelf.elf.SHT_RELA else "")
+        entry = struct.Struct(self.byteorder + layout)
+        shift = 32 if wide else 8
+        result = bytearray()
+        for fields in entry.iter_unpack(raw[:len(raw) - len(raw) % entry.size]):
+            symbol = fields[1] >> shift
+            info = fields[1]
+            if (symbol < len(mapping)):
+                if (mapping[symbol] < 0):
+                    raise ValueError(f"Section {item.name} refers to a symbol of a removed section")
+                info = mapping[symbol] << shift | info & ((1 << shift) - 1)
+            result += entry.pack(fields[0], info, *fields[2:])
+        return bytes(result)
+
+    def tables(self, image):
+        """ Contents of the kept sections which hold section or symbol indexes, regenerated """
+        self._drop_symbols(image)
+        for item in self.kept:
+            if (item.type == pylibelf.elf.SHT_NOBITS or not item.index):
+                continue
+            raw = bytes(image[item.offset:item.offset + item.size])
+            mapping = self.symbols.get(item.link)
+            if (item.type in (pylibelf.elf.SHT_SYMTAB, pylibelf.elf.SHT_DYNSYM)):
+                mapping = self.symbols.get(item.index)
+                if (self.identity and mapping is None):
+                    continue
+                start, step = _SYM_SHNDX[self.elfclass]
+                if (mapping is not None):
+                    raw = self._kept_entries(raw, 2 * step, mapping)
+                    self.sizes[item.index] = len(raw)
+                    # sh_info is one past the last local symbol
+                    self.infos[item.index] = sum(1 for new in mapping[:item.info] if new >= 0)
+                raw = self._remap_column(raw[:len(raw) - len(raw) % (2 * step)], "H", start, step)
+            elif (item.type == pylibelf.elf.SHT_SYMTAB_SHNDX):
+                if (self.identity and mapping is None):
+                    continue
+                if (mapping is not None):
+                    raw = self._kept_entries(raw, 4, mapping)
+                    self.sizes[item.index] = len(raw)
+                raw = self._remap_column(raw[:len(raw) - len(raw) % 4], "I", 0, 1, len(self.remap))
+            elif (item.type in (pylibelf.elf.SHT_REL, pylibelf.elf.SHT_RELA)):
+                if (mapping is None):
+                    continue
+                raw = self._relocations(item, raw, mapping)
+            elif (item.type == pylibelf.elf.SHT_GROUP):
+                if (mapping is not None and item.info < len(mapping)):
+                    if (mapping[item.info] < 0):
+                        raise ValueError(f"Signature of {item.name} is in a removed section")
+                    self.infos[item.index] = mapping[item.info]
+                words = struct.unpack(f"{self.byteorder}{len(raw) // 4}I", raw[:len(raw) // 4 * 4])
+                members = [self.remap[index] for index in words[1:]
+                           if index < len(self.remap) and self.remap[index]]
+                if (self.identity and len(members) == len(words) - 1):
+                    continue
+                raw = struct.pack(f"{self.byteorder}{len(members) + 1}I", words[0], *members)
+                self.sizes[item.index] = len(raw)
+            else:
+                continue
+            # Tables which shrank leave zeros rather than stale entries behind
+            self.patches.append((self.offsets[item.index], raw.ljust(item.size, b"\0")))
+
+    def headers(self, positions, shstrtab_offset, shstrtab_size):
+        layout = struct.Struct(self.byteorder + _SHDR[self.elfclass])
+        result = bytearray()
+        for item in self.kept:
+            offset = self.offsets[item.index]
+            size = self.sizes.get(item.index, item.size)
+            link = self.remap[item.link] if item.link < len(self.remap) else item.link
+            info = self.infos.get(item.index, item.info)
+            if (item.index and _links_index(item) and info < len(self.remap)):
+                info = self.remap[info]
+            if (item.index == self.shstrndx):
+                offset, size = shstrtab_offset, shstrtab_size
+            elif (not item.index):
+                # Section 0 carries the counts which do not fit the ELF header
+                size = len(self.kept) if len(self.kept) >= pylibelf.elf.SHN_LORESERVE else 0
+                link = (self.remap[self.shstrndx]
+                        if self.remap[self.shstrndx] >= pylibelf.elf.SHN_LORESERVE else 0)
+            result += layout.pack(positions[item.name] if item.index else 0, item.type,
+                                  item.flags, item.addr, offset, size, link, info,
+                                  item.addralign, item.entsize)
+        return bytes(result)
+
+def strip(source, destination, names = (), debug = True, symbols = False):
+    """
+    Write source to destination without the sections named in names, the
+    debug sections (DEBUG_PREFIXES) unless debug is False and the symbol
+    table with its string table if symbols is True. Sections which only make
+    sense with a removed one, e.g. its relocations, go as well, and so do the
+    symbols defined in removed sections; ValueError is raised if a kept
+    relocation refers to one. Allocated sections cannot be removed. Returns StripResult with the names of the
+    removed sections and the size of the new file.
+    """
+    melf = pylibelf.libelf.ElfDescriptor.fromfile(source, pylibelf.libelf.Elf_Cmd.ELF_C_READ_MMAP)
+    ehdr = melf.gelf_getehdr()
+    sections = pylibelf.sections.SectionIndex(melf)
+    shstrndx = melf.elf_getshdrstrndx()
+    msb = ehdr.e_ident[pylibelf.elf.EI_DATA] == pylibelf.elf.ELFDATA2MSB
+    byteorder = ">" if msb else "<"
+    elfclass = melf.gelf_getclass()
+
+    removed = _select(sections, shstrndx, set(names), debug, symbols)
+    rewriter = _Rewriter(melf, sections, removed, shstrndx, byteorder)
+    cursor = rewriter.layout(_fixed_end(melf, ehdr))
+    rewriter.tables(melf.elf_rawfile())
+    shstrtab, positions = rewriter.names()
+    shstrtab_offset = cursor
+    shoff = _align(shstrtab_offset + len(shstrtab), 8 if elfclass == pylibelf.elf.ELFCLASS64 else 4)
+    headers = rewriter.headers(positions, shstrtab_offset, len(shstrtab))
+
+    shnum = len(rewriter.kept)
+    newstrndx = rewriter.remap[shstrndx]
+    fields = _EHDR_FIELDS[elfclass]
+    ehdr_patches = [
+        (fields[0], shoff),
+        (fields[1], shnum if shnum < pylibelf.elf.SHN_LORESERVE else 0),
+        (fields[2],
+         newstrndx if newstrndx < pylibelf.elf.SHN_LORESERVE else pylibelf.elf.SHN_XINDEX)
+    ]
+
+    mode = os.stat(source).st_mode & 0o777
+    # Written next to the destination and renamed over it, so stripping in place
+    # reads an intact source and a failure never leaves a partial file
+    outfd, tmpname = tempfile.mkstemp(dir = os.path.dirname(os.path.abspath(destination)))
+    with open(source, "rb") as infile:
+        try:
+            os.fchmod(outfd, mode)
+            # The fallback is picked for this pair of files only
+            methods = list(COPY_METHODS)
+            for start, end, shift in rewriter.runs:
+                copy_range(infile.fileno(), outfd, start, start - shift, end - start, methods)
+            for offset, raw in rewriter.patches:
+                os.pwrite(outfd, raw, offset)
+            os.pwrite(outfd, shstrtab, shstrtab_offset)
+            os.pwrite(outfd, headers, shoff)
+            for (position, code), value in ehdr_patches:
+                os.pwrite(outfd, struct.pack(byteorder + code, value), position)
+            size = shoff + len(headers)
+            os.ftruncate(outfd, size)
+            os.close(outfd)
+            outfd = None
+            os.replace(tmpname, destination)
+        finally:
+            if (outfd is not None):
+                os.close(outfd)
+            if (os.path.exists(tmpname)):
+                os.remove(tmpname)
+    return StripResult(sorted(sections[index].name for index in removed), size)
+
+def main(args):
+    parser = argparse.ArgumentParser(prog = "python -m pylibelf.strip",
+                                     description = "Remove sections from an ELF file")
+    parser.add_argument("-o", "--output", dest = "output", required = True)
+    parser.add_argument("-R", "--remove-section", dest = "names", action = "append", default = [])
+    parser.add_argument("-s", "--strip-all", dest = "symbols", action = "store_true",
+                        help = "Also remove the symbol table")
+    parser.add_argument("--keep-debug", dest = "debug", action = "store_false")
+    parser.add_argument("input")
+    argtab = parser.parse_args(args[1:])
+    result = strip(argtab.input, argtab.output, argtab.names, argtab.debug, argtab.symbols)
+    print(f"Removed {len(result.removed)} sections, {result.size} bytes written")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -0,0 +1,447 @@
+"""
+ SPDX-License-Identifier: MIT
+
+ Copyright (C) 2023 Advanced Micro Devices, Inc.
+
+ Tables used to build and read back string, symbol and relocation sections.
+ Symbol and relocation tables keep their entries packed back to back in one
+ bytearray, the entries handed out are small views into it with the field
+ names of the ctypes structure, e.g. st_name, so a table costs little more
+ than the size of the section itself. Relative relocations can also be kept
+ as the offsets they patch and packed in the SHT_RELR format.
+"""
+
+import array
+import bisect
+import ctypes
+import struct
+import itertools
+
+import pylibelf.elf
+import pylibelf.libelf
+
+class ElfStringTable:
+    """
+    Helper data structure to store and pack strings for ELF which is later
+    used to build ELF .shstrtab section
+    """
+    def __init__(self, data = None, size = 0):
+        self._size = size
+        self._syms = []
+        self._data = None
+        if (data is None):
+            return
+        self._data = ctypes.string_at(data, size)
+        self._populate()
+
+    def _populate(self):
+        # Populate our syms list
+        pos = 0
+        while (pos < self._size):
+            item = self.get(pos)
+            self._syms.append(item)
+            pos += len(item)
+            # Go past the null char
+            pos += 1
+
+    def __len__(self):
+        return len(self._syms)
+
+    def __getitem__(self, index):
+        return self._syms[index]
+
+    def add(self, item):
+        pos = self._size
+        self._syms.append(item)
+        self._size += (len(item.encode("utf-8")) + 1)
+        return pos
+
+    def packsyms(self):
+        # One join and one copy into the ctypes buffer whatever the number of strings
+        packed = b"".join(bytes(item, "utf-8") + b"\0" for item in self._syms)
+        self._data = ctypes.create_string_buffer(packed, self._size)
+        return self._data
+
+    def get(self, pos):
+        assert(pos < self._size), "Illegal offset into table storage"
+        item = ctypes.string_at(self._data[pos:])
+        return item.decode("utf-8")
+
+    def space(self):
+        return self._size
+
+    def __str__(self):
+        return f"{self._syms}\n{self._data}"
+
+
+class ElfRecord:
+    """
+    View of one entry of an ElfRecordTable. Reading or assigning a field goes
+    straight to the shared buffer, bytes() gives the packed entry.
+    """
+    __slots__ = ("_buffer", "_offset")
+    _structure = None
+
+    def __init__(self, buffer, offset):
+        self._buffer = buffer
+        self._offset = offset
+
+    def __bytes__(self):
+        size = ctypes.sizeof(self._structure)
+        return bytes(self._buffer[self._offset:self._offset + size])
+
+    def __eq__(self, other):
+        return isinstance(other, ElfRecord) and bytes(self) == bytes(other)
+
+    def __hash__(self):
+        return hash(bytes(self))
+
+    def __repr__(self):
+        fields = ", ".join(f"{name}={getattr(self, name)}" for name, _ in self._structure._fields_)
+        return f"{self._structure.__name__}({fields})"
+
+    def to_structure(self):
+        """ Copy of the entry as the ctypes structure """
+        return self._structure.from_buffer_copy(self._buffer, self._offset)
+
+def _field(ctype, offset):
+    # Entries are in memory byte order as libelf hands them out and takes them
+    layout = struct.Struct("@" + ctype._type_)
+    def getter(self):
+        return layout.unpack_from(self._buffer, self._offset + offset)[0]
+    def setter(self, value):
+        layout.pack_into(self._buffer, self._offset + offset, value)
+    return property(getter, setter)
+
+_RECORD_TYPES = {}
+
+def record_type(structure):
+    """ ElfRecord subclass with a property for every field of the ctypes structure """
+    if (structure not in _RECORD_TYPES):
+        namespace = {"__slots__": (), "_structure": structure}
+        for name, ctype in structure._fields_:
+            namespace[name] = _field(ctype, getattr(structure, name).offset)
+        _RECORD_TYPES[structure] = type(structure.__name__ + "Record", (ElfRecord,), namespace)
+    return _RECORD_TYPES[structure]
+
+def _numpy_format(ctype, order):
+    if (hasattr(ctype, "_length_")):
+        return (_numpy_format(ctype._type_, order), ctype._length_)
+    # ctypes codes of signed integers are lower case, e.g. "i" for c_int and "I" for c_uint
+    kind = "i" if ctype._type_.islower() else "u"
+    return f"{order}{kind}{ctypes.sizeof(ctype)}"
+
+def numpy_view(data, structure, encode = pylibelf.elf.ELFDATA2LSB):
+    """
+    Read only NumPy structured array over a table of ctypes structures in
+    file representation, e.g. the bytes of .symtab in a big endian image.
+    The dtype carries the byte order of the file, so nothing is swapped or
+    copied up front and NumPy converts whole columns as they are used, e.g.
+    view["st_value"]. Needs NumPy, see also pylibelf.libelf.xlatetom().
+    """
+    import numpy # pylint: disable=import-outside-toplevel
+    order = ">" if encode == pylibelf.elf.ELFDATA2MSB else "<"
+    dtype = numpy.dtype({
+        "names": [name for name, _ in structure._fields_],
+        "formats": [_numpy_format(ctype, order) for _, ctype in structure._fields_],
+        "offsets": [getattr(structure, name).offset for name, _ in structure._fields_],
+        "itemsize": ctypes.sizeof(structure)
+    })
+    view = numpy.frombuffer(data, dtype, memoryview(data).nbytes // dtype.itemsize)
+    view.flags.writeable = False
+    return view
+
+class ElfRecordTable:
+    """
+    Table of fixed size ELF structures packed back to back in one bytearray.
+    Entries are added as ctypes structures or records and read back as
+    records, views which copy nothing until a field is read. The storage
+    grows geometrically and packsyms() hands it out as is, so d_buf can
+    point straight at it.
+    """
+    _structure = None
+    # libelf type of the entries, used to translate them from the file representation
+    _d_type = None
+
+    def __init__(self, data = None, size = 0, structure = None):
+        if (structure is not None):
+            self._structure = structure
+        self._record = record_type(self._structure)
+        self._entsize = ctypes.sizeof(self._structure)
+        self._buffer = bytearray(ctypes.string_at(data, size)) if data is not None else bytearray()
+        # Bytes in use, the rest of the buffer is spare capacity
+        self._size = len(self._buffer)
+        self._data = None
+
+    @classmethod
+    def from_file(cls, raw, encode):
+        """
+        Table over entries in file representation, e.g. a section of a big
+        endian image read from elf_rawfile(), translated by libelf in one call
+        """
+        if (cls._d_type is None):
+            raise ValueError(f"{cls.__name__} has no libelf type to translate")
+        table = cls()
+        table._buffer = pylibelf.libelf.xlatetom(raw, cls._d_type, encode)
+        table._size = len(table._buffer) - len(table._buffer) % table._entsize
+        return table
+
+    def __len__(self):
+        return self._size // self._entsize
+
+    def __getitem__(self, index):
+        if (isinstance(index, slice)):
+            return [self[pos] for pos in range(*index.indices(len(self)))]
+        if (index < 0):
+            index += len(self)
+        if (not 0 <= index < len(self)):
+            raise IndexError("table index out of range")
+        return self._record(self._buffer, index * self._entsize)
+
+    def __iter__(self):
+        record = self._record
+        buffer = self._buffer
+        for offset in range(0, len(self) * self._entsize, self._entsize):
+            yield record(buffer, offset)
+
+    def reserve(self, count):
+        """ Make room for count more entries up front """
+        self._grow(count * self._entsize, 0)
+
+    def _grow(self, size, minimum = 64):
+        spare = len(self._buffer) - self._size
+        if (size <= spare):
+            return
+        extra = max(size - spare, len(self._buffer), minimum * self._entsize)
+        try:
+            self._buffer += bytes(extra)
+        except BufferError:
+            # The storage is pinned by a packsyms() view which libelf may still be
+            # using, carry on in a copy. Records handed out so far keep the old one.
+            self._buffer = self._buffer + bytes(extra)
+
+    def _append(self, raw):
+        pos = self._size
+        size = len(raw)
+        if (size % self._entsize):
+            raise ValueError(f"{size} bytes is not a whole number of "
+                             f"{self._structure.__name__} entries")
+        self._grow(size)
+        self._buffer[pos:pos + size] = raw
+        self._size += size
+        return pos
+
+    def add(self, item):
+        """ Append a ctypes structure or record, returns its byte offset """
+        return self._append(bytes(item))
+
+    def extend(self, items):
+        """
+        Append many entries at once, returns the byte offset of the first one.
+        items is either an object exporting the packed entries through the buffer
+        protocol, e.g. a ctypes array of the structure or a NumPy structured array
+        with the same layout, or an iterable of ctypes structures or records.
+        """
+        try:
+            view = memoryview(items)
+        except TypeError:
+            return self._append(b"".join(bytes(item) for item in items))
+        if (not view.c_contiguous):
+            view = memoryview(view.tobytes())
+        return self._append(view.cast("B"))
+
+    def packsyms(self):
+        """ ctypes view of the entries to hand to libelf, kept alive by the table """
+        self._data = (ctypes.c_char * self._size).from_buffer(self._buffer)
+        return self._data
+
+    def get(self, pos):
+        assert(pos < self._size), "Illegal offset into table storage"
+        return self._record(self._buffer, pos)
+
+    def space(self):
+        return self._size
+
+    def __str__(self):
+        return f"{list(self)}\n{self._data}"
+
+class ElfSymbolTable(ElfRecordTable):
+    """
+    Helper data structure to store and pack Elf32_Sym which is later
+    used to build ELF .dynsym section. Section indexes from SHN_LORESERVE
+    on do not fit st_shndx, symbols added with such a shndx get SHN_XINDEX
+    and the index goes to the words of the SHT_SYMTAB_SHNDX section which
+    packshndx() returns.
+    """
+    _structure = pylibelf.elf.Elf32_Sym
+    _d_type = pylibelf.libelf.Elf_Type.ELF_T_SYM
+
+    def __init__(self, data = None, size = 0, structure = None):
+        super().__init__(data, size, structure)
+        self._xindex = None
+        self._xdata = None
+
+    def add(self, item, shndx = None):
+        """ Append a symbol, shndx overrides its st_shndx, returns its byte offset """
+        pos = super().add(item)
+        if (shndx is not None):
+            self.set_shndx(len(self) - 1, shndx)
+        return pos
+
+    def _xwords(self):
+        # Grown to one word per symbol, the storage may be pinned by a packshndx() view
+        missing = len(self) - len(self._xindex)
+        if (missing > 0):
+            try:
+                self._xindex.extend([0] * missing)
+            except BufferError:
+                self._xindex = self._xindex + array.array("I", [0] * missing)
+        return self._xindex
+
+    def set_shndx(self, index, shndx):
+        """ Section index of the symbol at index, through SHT_SYMTAB_SHNDX if needed """
+        record = self[index]
+        index %= len(self)
+        if (shndx < pylibelf.elf.SHN_LORESERVE):
+            record.st_shndx = shndx
+            if (self._xindex is not None and index < len(self._xindex)):
+                self._xindex[index] = 0
+            return
+        record.st_shndx = pylibelf.elf.SHN_XINDEX
+        if (self._xindex is None):
+            self._xindex = array.array("I")
+        self._xwords()[index] = shndx
+
+    def shndx(self, index):
+        """ Section index of the symbol at index with SHN_XINDEX resolved """
+        shndx = self[index].st_shndx
+        if (shndx == pylibelf.elf.SHN_XINDEX and self._xindex is not None):
+            index %= len(self)
+            return self._xindex[index] if index < len(self._xindex) else pylibelf.elf.SHN_UNDEF
+        return shndx
+
+    def load_shndx(self, data, size):
+        """ Words of the SHT_SYMTAB_SHNDX section of the table as read by libelf """
+        self._xindex = array.array("I")
+        self._xindex.frombytes(ctypes.string_at(data, size - size % 4))
+
+    def packshndx(self):
+        """
+        ctypes view of the SHT_SYMTAB_SHNDX words kept alive by the table, None
+        if no symbol needs them
+        """
+        if (self._xindex is None):
+            return None
+        words = self._xwords()
+        self._xdata = (ctypes.c_char * (len(self) * 4)).from_buffer(words)
+        return self._xdata
+
+class ElfRelaTable(ElfRecordTable):
+    """
+    Helper data structure to store and pack Elf32_Rela which is later
+    used to build ELF .rela.dyn section
+    """
+    _structure = pylibelf.elf.Elf32_Rela
+    _d_type = pylibelf.libelf.Elf_Type.ELF_T_RELA
+
+
+def relr_encode(offsets, wordsize = 4):
+    """
+    SHT_RELR words for a set of relative relocation offsets: an even word is
+    an offset to relocate, an odd word a bitmap of the following 8 * wordsize
+    - 1 words. Offsets must be even, duplicates are dropped.
+    """
+    offsets = sorted(set(offsets))
+    if (any(map((1).__and__, offsets))):
+        raise ValueError("SHT_RELR cannot encode odd offsets")
+    scale = wordsize.bit_length() - 1
+    span = (8 * wordsize - 1) * wordsize
+    words = []
+    pos = 0
+    count = len(offsets)
+    while (pos < count):
+        words.append(offsets[pos])
+        where = offsets[pos] + wordsize
+        pos += 1
+        while (pos < count):
+            # All the offsets the next bitmap can reach, up to the first one off the word grid
+            end = bisect.bisect_left(offsets, where + span, pos)
+            deltas = list(map((-where).__add__, offsets[pos:end]))
+            misaligned = list(map(bool, map((wordsize - 1).__and__, deltas)))
+            if (True in misaligned):
+                deltas = deltas[:misaligned.index(True)]
+            if (not deltas):
+                break
+            words.append((sum(map((1).__lshift__, map(scale.__rrshift__, deltas))) << 1) | 1)
+            pos += len(deltas)
+            where += span
+    return words
+
+def relr_decode(words, wordsize = 4):
+    """ Offsets encoded by SHT_RELR words in increasing order """
+    span = (8 * wordsize - 1) * wordsize
+    offsets = []
+    where = 0
+    for word in words:
+        if (not word & 1):
+            offsets.append(word)
+            where = word + wordsize
+            continue
+        # Bit n + 1 of the bitmap stands for the word n words after where
+        offsets.extend(itertools.compress(range(where, where + span, wordsize),
+                                          map("1".__eq__, reversed(bin(word)[2:-1]))))
+        where += span
+    return offsets
+
+class ElfRelrTable:
+    """
+    Helper data structure to store the offsets of relative relocations which
+    are later packed as a SHT_RELR section, e.g. .relr.dyn. wordsize is 4 for
+    ELFCLASS32 and 8 for ELFCLASS64 files.
+    """
+    def __init__(self, data = None, size = 0, wordsize = 4):
+        self._wordsize = wordsize
+        self._offsets = []
+        self._words = None
+        self._data = None
+        if (data is None):
+            return
+        words = array.array(self._typecode())
+        words.frombytes(ctypes.string_at(data, size - size % wordsize))
+        self._offsets = relr_decode(words, wordsize)
+
+    def _typecode(self):
+        return "Q" if self._wordsize == 8 else "I"
+
+    def __len__(self):
+        return len(self._offsets)
+
+    def __getitem__(self, index):
+        return self._offsets[index]
+
+    def __iter__(self):
+        return iter(self._offsets)
+
+    def add(self, offset):
+        """ Add the offset of one relative relocation, returns its index """
+        self._offsets.append(offset)
+        return len(self._offsets) - 1
+
+    def extend(self, offsets):
+        self._offsets.extend(offsets)
+
+    def words(self):
+        """ The SHT_RELR encoding of the offsets """
+        return relr_encode(self._offsets, self._wordsize)
+
+    def packsyms(self):
+        """ ctypes view of the encoded words in memory byte order, kept alive by the table """
+        self._words = array.array(self._typecode(), self.words())
+        self._data = (ctypes.c_char * (len(self._words) * self._wordsize)).from_buffer(self._words)
+        return self._data
+
+    def space(self):
+        return len(self.words()) * self._wordsize
+
+    def __str__(self):
+        return f"{self._offsets}\n{self._data}"
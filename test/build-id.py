@@ -0,0 +1,220 @@
+#!/usr/bin/env python3
+
+"""
+ SPDX-License-Identifier: MIT
+
+ Copyright (C) 2023 Advanced Micro Devices, Inc.
+
+ GNU build ID note and local build ID store
+"""
+
+import os
+import sys
+import ctypes
+import shutil
+import hashlib
+import tempfile
+
+import pylibelf.elf
+import pylibelf.cache
+import pylibelf.libelf
+import pylibelf.notes
+import pylibelf.atomic
+import pylibelf.buildid
+import pylibelf.sections
+
+import testhelper
+
+BUILD_ID = bytes(range(0x10, 0x24))
+
+def populate_build_id_note(strtab, melf):
+    scn = melf.elf_newscn()
+    data = scn.elf_newdata()
+
+    name = pylibelf.elf.ELF_NOTE_GNU.encode("utf-8") + b'\0'
+    nhdr = pylibelf.elf.Elf32_Nhdr(len(name), len(BUILD_ID), pylibelf.elf.NT_GNU_BUILD_ID)
+    note = (ctypes.c_char * (ctypes.sizeof(nhdr) + len(name) + len(BUILD_ID))).from_buffer_copy(
+        bytes(nhdr) + name + BUILD_ID)
+    data.contents.d_align = 4
+    data.contents.d_off = 0
+    data.contents.d_buf = ctypes.cast(note, ctypes.c_void_p)
+    data.contents.d_type = pylibelf.libelf.Elf_Type.ELF_T_BYTE
+    data.contents.d_size = ctypes.sizeof(note)
+    data.contents.d_version = pylibelf.elf.EV_CURRENT
+
+    shdr = scn.elf32_getshdr()
+    shdr.contents.sh_name = strtab.add(".note")
+    shdr.contents.sh_type = pylibelf.elf.SHT_NOTE
+    shdr.contents.sh_flags = pylibelf.elf.SHF_ALLOC
+    shdr.contents.sh_addralign = 4
+    shdr.contents.sh_entsize = 0
+    return note
+
+def write_ELF(filename):
+    strtab = testhelper.ElfStringTable()
+    melf = pylibelf.libelf.ElfDescriptor.fromfile(filename, pylibelf.libelf.Elf_Cmd.ELF_C_WRITE)
+    ehdr = melf.elf32_newehdr()
+
+    ehdr.contents.e_ident[pylibelf.elf.EI_DATA] = pylibelf.elf.ELFDATA2LSB
+    ehdr.contents.e_ident[pylibelf.elf.EI_VERSION] = pylibelf.elf.EV_CURRENT
+    # Our own ABI version
+    ehdr.contents.e_ident[pylibelf.elf.EI_OSABI] = 0x40
+    ehdr.contents.e_ident[pylibelf.elf.EI_ABIVERSION] = 0x1
+    # Repurpose obsolete EM_M32 for our machine type
+    ehdr.contents.e_machine = pylibelf.elf.EM_M32
+    ehdr.contents.e_type = pylibelf.elf.ET_EXEC
+    ehdr.contents.e_flags = 0x0
+
+    strtab.add("")
+
+    note = melf.pin(populate_build_id_note(strtab, melf))
+
+    scn = melf.elf_newscn()
+    data = scn.elf_newdata()
+    data.contents.d_align = 1
+    data.contents.d_off = 0
+    data.contents.d_type = pylibelf.libelf.Elf_Type.ELF_T_BYTE
+    data.contents.d_version = pylibelf.elf.EV_CURRENT
+
+    shdr = scn.elf32_getshdr()
+    shdr.contents.sh_name = strtab.add(".shstrtab")
+    shdr.contents.sh_type = pylibelf.elf.SHT_STRTAB
+    shdr.contents.sh_flags = pylibelf.elf.SHF_STRINGS | pylibelf.elf.SHF_ALLOC
+    shdr.contents.sh_entsize = 0
+
+    symsdata = melf.pin(strtab.packsyms())
+    data.contents.d_size = ctypes.sizeof(symsdata)
+    data.contents.d_buf = ctypes.cast(symsdata, ctypes.c_void_p)
+    ehdr.contents.e_shstrndx = scn.elf_ndxscn()
+
+    assert(melf.memory_usage() == (0, 0, ctypes.sizeof(note) + ctypes.sizeof(symsdata)))
+    melf.elf_update(pylibelf.libelf.Elf_Cmd.ELF_C_WRITE)
+
+def check_store(elfname):
+    """ Index a scratch tree holding the ELF file and look it up by build ID """
+    tmpdir = tempfile.mkdtemp()
+    try:
+        tree = os.path.join(tmpdir, "tree")
+        os.makedirs(os.path.join(tree, "sub"))
+        shutil.copy(elfname, os.path.join(tree, "sub", "a.elf"))
+        with open(os.path.join(tree, "notelf.txt"), "w", encoding = "utf-8") as handle:
+            handle.write("not an ELF file")
+
+        storename = os.path.join(tmpdir, "store.json")
+        store = pylibelf.buildid.BuildIdStore(storename)
+        assert(store.add_root(tree) == 2)
+        assert(store.find_by_build_id(BUILD_ID) == os.path.join(tree, "sub", "a.elf"))
+        assert(store.find_by_build_id(BUILD_ID, debuginfo = True) is None)
+        # Written through a temporary file which gets the permissions open() would give
+        assert(os.stat(storename).st_mode & 0o777 == 0o666 & ~pylibelf.atomic.umask())
+        assert(sorted(os.listdir(tmpdir)) == ["store.json", "tree"])
+
+        # A reopened store answers from disk and rescans nothing
+        store = pylibelf.buildid.BuildIdStore(storename)
+        assert(store.find_by_build_id(BUILD_ID.hex()) is not None)
+        assert(store.refresh() == 0)
+
+        cache = pylibelf.cache.MetadataCache(os.path.join(tmpdir, "cache"))
+        assert(cache.lookup_build_id(BUILD_ID) is None)
+        cache.add(os.path.join(tree, "sub", "a.elf")).close()
+        with cache.lookup_build_id(BUILD_ID.hex()) as cached:
+            assert(cached.build_id == BUILD_ID and cached.sections.by_name(".note").index == 1)
+
+        os.remove(os.path.join(tree, "sub", "a.elf"))
+        assert(store.refresh() == 0)
+        assert(store.find_by_build_id(BUILD_ID) is None)
+    finally:
+        shutil.rmtree(tmpdir)
+
+def check_fingerprint(elfname):
+    """ Only the build ID differs between the file and its copy """
+    mode = pylibelf.libelf.Elf_Cmd.ELF_C_READ_MMAP
+    melf = pylibelf.libelf.ElfDescriptor.fromfile(elfname, mode)
+    result = melf.fingerprint(max_workers = 2)
+    with open(elfname, "rb") as handle:
+        contents = handle.read()
+    note = pylibelf.sections.SectionIndex(melf).by_name(".note")
+    expected = hashlib.sha256(contents[note.offset:note.offset + note.size]).hexdigest()
+    assert(result.sections[note.index] == expected)
+    # Reading through libelf's own copy of the file gives the same result
+    copy = pylibelf.libelf.ElfDescriptor.fromfile(elfname, pylibelf.libelf.Elf_Cmd.ELF_C_READ)
+    assert(copy.fingerprint() == result)
+
+    tmpdir = tempfile.mkdtemp()
+    try:
+        rebuilt = os.path.join(tmpdir, "rebuilt.elf")
+        with open(rebuilt, "wb") as handle:
+            handle.write(contents.replace(BUILD_ID, bytes(reversed(BUILD_ID))))
+        other = pylibelf.libelf.ElfDescriptor.fromfile(rebuilt, mode)
+        assert(other.fingerprint().digest != result.digest)
+        assert(other.fingerprint().sections[note.index] != result.sections[note.index])
+        stable = melf.fingerprint(volatile = True).digest
+        assert(other.fingerprint(volatile = True).digest == stable)
+        assert(stable != result.digest)
+        assert(other.fingerprint(ignore = [".note"]).digest ==
+               melf.fingerprint(ignore = [".note"]).digest)
+    finally:
+        shutil.rmtree(tmpdir)
+
+def check_memory(elfname):
+    """ Accounting of the file image and note copies with the high-water alarm """
+    baseline = pylibelf.libelf.memory_usage()
+    held = baseline.mapped + baseline.pinned
+    size = os.path.getsize(elfname)
+    alarms = []
+    pylibelf.libelf.set_memory_alarm(held + size, alarms.append)
+    try:
+        melf = pylibelf.libelf.ElfDescriptor.fromfile(elfname,
+                                                      pylibelf.libelf.Elf_Cmd.ELF_C_READ_MMAP)
+        assert(melf.memory_usage() == (size, 0, 0))
+        assert(len(alarms) == 1 and alarms[0].mapped == baseline.mapped + size)
+        # The note name "GNU" with its NUL and the build ID are copied out
+        assert(pylibelf.notes.elf_build_id(melf) == BUILD_ID)
+        assert(pylibelf.notes.elf_build_id(melf) == BUILD_ID)
+        assert(melf.memory_usage().copied == 2 * (4 + len(BUILD_ID)))
+        # Copies are counted but neither hold memory nor fire the alarm
+        assert(len(alarms) == 1)
+        assert(pylibelf.libelf.memory_peak() >= held + size)
+        del melf
+        assert(pylibelf.libelf.memory_usage() == baseline)
+        # Fires once per crossing, dropping below the limit re-arms it
+        melf = pylibelf.libelf.ElfDescriptor.fromfile(elfname,
+                                                      pylibelf.libelf.Elf_Cmd.ELF_C_READ_MMAP)
+        assert(len(alarms) == 2)
+        del melf
+        # Without mmap only what libelf reads in counts, each range once
+        melf = pylibelf.libelf.ElfDescriptor.fromfile(elfname, pylibelf.libelf.Elf_Cmd.ELF_C_READ)
+        assert(melf.memory_usage().mapped == 0)
+        note = pylibelf.sections.SectionIndex(melf).by_name(".note")
+        assert(pylibelf.notes.elf_build_id(melf) == BUILD_ID)
+        assert(pylibelf.notes.elf_build_id(melf) == BUILD_ID)
+        strings = melf.memory_usage().mapped
+        assert(note.size <= strings < size)
+        melf.read_range(note.offset, note.size)
+        melf.read_range(note.offset, note.size)
+        assert(melf.memory_usage().mapped == strings + note.size)
+        melf.elf_rawfile().release()
+        assert(melf.memory_usage().mapped == strings + note.size + size)
+        del melf
+        assert(pylibelf.libelf.memory_usage() == baseline)
+    finally:
+        pylibelf.libelf.set_memory_alarm(None, None)
+
+def read_ELF(elfname):
+    build_id = pylibelf.notes.file_build_id(elfname)
+    print(f"Build ID: {build_id.hex()}")
+    assert(build_id == BUILD_ID)
+    check_store(elfname)
+    check_fingerprint(elfname)
+    check_memory(elfname)
+
+if __name__ == "__main__":
+    argtab = testhelper.parse_command_line(sys.argv)
+
+    if (argtab.filename != None and argtab.filename[0] != None):
+        print(f"Writing ELF file {argtab.filename[0]}")
+        write_ELF(argtab.filename[0])
+        testhelper.validate_ELF(argtab.filename[0], argtab.reference)
+    elif (argtab.decompile != None and argtab.decompile[0] != None):
+        print(f"Reading ELF file {argtab.decompile[0]}")
+        read_ELF(argtab.decompile[0])
@@ -0,0 +1,268 @@
+#!/usr/bin/env python3
+
+"""
+ SPDX-License-Identifier: MIT
+
+ Copyright (C) 2023 Advanced Micro Devices, Inc.
+
+ Populate .dynamic with DT_NEEDED/DT_SONAME/DT_RUNPATH entries and resolve
+ the dependency graph
+"""
+
+import os
+import sys
+import struct
+import ctypes
+import shutil
+import tempfile
+
+import pylibelf.elf
+import pylibelf.cache
+import pylibelf.libelf
+import pylibelf.dynamic
+
+import testhelper
+
+def write_Dynamic(melf, strtab, needed, soname, runpath):
+    dstrtab = testhelper.ElfStringTable()
+    dstrtab.add("")
+    entries = [(pylibelf.elf.DT_NEEDED, dstrtab.add(name)) for name in needed]
+    if (soname is not None):
+        entries.append((pylibelf.elf.DT_SONAME, dstrtab.add(soname)))
+    if (runpath is not None):
+        entries.append((pylibelf.elf.DT_RUNPATH, dstrtab.add(runpath)))
+
+    scn = melf.elf_newscn()
+    data = scn.elf_newdata()
+    data.contents.d_align = 1
+    data.contents.d_off = 0
+    data.contents.d_type = pylibelf.libelf.Elf_Type.ELF_T_BYTE
+    data.contents.d_version = pylibelf.elf.EV_CURRENT
+
+    dsymsdata = dstrtab.packsyms()
+    data.contents.d_size = ctypes.sizeof(dsymsdata)
+    data.contents.d_buf = ctypes.cast(dsymsdata, ctypes.c_void_p)
+
+    shdr = scn.elf32_getshdr()
+    shdr.contents.sh_name = strtab.add(".dynstr")
+    shdr.contents.sh_type = pylibelf.elf.SHT_STRTAB
+    shdr.contents.sh_flags = pylibelf.elf.SHF_STRINGS | pylibelf.elf.SHF_ALLOC
+    shdr.contents.sh_entsize = 0
+
+    entries.append((pylibelf.elf.DT_STRSZ, dstrtab.space()))
+    entries.append((pylibelf.elf.DT_NULL, 0))
+    dyntab = (pylibelf.elf.Elf32_Dyn * len(entries))()
+    for index, (tag, value) in enumerate(entries):
+        dyntab[index].d_tag = tag
+        dyntab[index].d_un.d_val = value
+
+    scn2 = melf.elf_newscn()
+    data2 = scn2.elf_newdata()
+    data2.contents.d_align = 4
+    data2.contents.d_off = 0
+    data2.contents.d_buf = ctypes.cast(dyntab, ctypes.c_void_p)
+    data2.contents.d_type = pylibelf.libelf.Elf_Type.ELF_T_BYTE
+    data2.contents.d_size = ctypes.sizeof(dyntab)
+    data2.contents.d_version = pylibelf.elf.EV_CURRENT
+
+    shdr2 = scn2.elf32_getshdr()
+    shdr2.contents.sh_name = strtab.add(".dynamic")
+    shdr2.contents.sh_type = pylibelf.elf.SHT_DYNAMIC
+    shdr2.contents.sh_flags = pylibelf.elf.SHF_ALLOC | pylibelf.elf.SHF_WRITE
+    shdr2.contents.sh_entsize = ctypes.sizeof(pylibelf.elf.Elf32_Dyn)
+    shdr2.contents.sh_link = scn.elf_ndxscn()
+    return (dsymsdata, dyntab)
+
+def write_ELF(filename, elftype = pylibelf.elf.ET_EXEC, needed = ("libfoo.so.1",),
+              soname = None, runpath = "$ORIGIN/lib"):
+    strtab = testhelper.ElfStringTable()
+    melf = pylibelf.libelf.ElfDescriptor.fromfile(filename, pylibelf.libelf.Elf_Cmd.ELF_C_WRITE)
+    ehdr = melf.elf32_newehdr()
+
+    ehdr.contents.e_ident[pylibelf.elf.EI_DATA] = pylibelf.elf.ELFDATA2LSB
+    ehdr.contents.e_ident[pylibelf.elf.EI_VERSION] = pylibelf.elf.EV_CURRENT
+    # Our own ABI version
+    ehdr.contents.e_ident[pylibelf.elf.EI_OSABI] = 0x40
+    ehdr.contents.e_ident[pylibelf.elf.EI_ABIVERSION] = 0x1
+    # Repurpose obsolete EM_M32 for our machine type
+    ehdr.contents.e_machine = pylibelf.elf.EM_M32
+    ehdr.contents.e_type = elftype
+    ehdr.contents.e_flags = 0x0
+
+    strtab.add("")
+
+    # Keep the packed tables alive until elf_update() has written them out
+    buffers = write_Dynamic(melf, strtab, needed, soname, runpath)
+
+    scn = melf.elf_newscn()
+    data = scn.elf_newdata()
+    data.contents.d_align = 1
+    data.contents.d_off = 0
+    data.contents.d_type = pylibelf.libelf.Elf_Type.ELF_T_BYTE
+    data.contents.d_version = pylibelf.elf.EV_CURRENT
+
+    shdr = scn.elf32_getshdr()
+    shdr.contents.sh_name = strtab.add(".shstrtab")
+    shdr.contents.sh_type = pylibelf.elf.SHT_STRTAB
+    shdr.contents.sh_flags = pylibelf.elf.SHF_STRINGS | pylibelf.elf.SHF_ALLOC
+    shdr.contents.sh_entsize = 0
+
+    symsdata = strtab.packsyms()
+    data.contents.d_size = ctypes.sizeof(symsdata)
+    data.contents.d_buf = ctypes.cast(symsdata, ctypes.c_void_p)
+    ehdr.contents.e_shstrndx = scn.elf_ndxscn()
+
+    melf.elf_update(pylibelf.libelf.Elf_Cmd.ELF_C_WRITE)
+    del buffers
+
+def check_resolver(elfname):
+    """ Resolve main -> libfoo -> libbar through $ORIGIN based DT_RUNPATH """
+    tmpdir = tempfile.mkdtemp()
+    try:
+        os.makedirs(os.path.join(tmpdir, "lib"))
+        main = os.path.join(tmpdir, "main")
+        shutil.copy(elfname, main)
+        libfoo = os.path.join(tmpdir, "lib", "libfoo.so.1")
+        write_ELF(libfoo, pylibelf.elf.ET_DYN, ("libbar.so.1", "libmissing.so.1"), "libfoo.so.1",
+                  "$ORIGIN")
+        libbar = os.path.join(tmpdir, "lib", "libbar.so.1")
+        write_ELF(libbar, pylibelf.elf.ET_DYN, (), "libbar.so.1", None)
+
+        resolver = pylibelf.dynamic.DependencyResolver(search_paths = [], max_workers = 2)
+        graph = resolver.resolve([main, main, libfoo])
+        assert(graph.edges[os.path.realpath(main)] == [os.path.realpath(libfoo)])
+        assert(graph.edges[os.path.realpath(libfoo)] == [os.path.realpath(libbar)])
+        assert(graph.missing == {os.path.realpath(libfoo): ["libmissing.so.1"]})
+        assert(graph.closure(main) == {os.path.realpath(libfoo), os.path.realpath(libbar)})
+    finally:
+        shutil.rmtree(tmpdir)
+
+def check_cache(elfname, melf):
+    """ Dynamic entries served from the metadata cache """
+    tmpdir = tempfile.mkdtemp()
+    try:
+        cache = pylibelf.cache.MetadataCache(tmpdir)
+        cache.add(elfname).close()
+        with cache.lookup(elfname) as cached:
+            assert(cached.dynamic == list(pylibelf.dynamic.iter_dynamic(melf)))
+            assert([entry.string for entry in cached.dynamic
+                    if entry.tag == pylibelf.elf.DT_NEEDED] == ["libfoo.so.1"])
+    finally:
+        shutil.rmtree(tmpdir)
+
+def write_headerless(filename, strtab = None):
+    """
+    Big endian ET_DYN with program headers only, PT_DYNAMIC and DT_STRTAB
+    point at the data unless strtab gives another DT_STRTAB address
+    """
+    strings = b"\0libfoo.so.1\0libbar.so.2\0"
+    phoff = 52
+    stroff = phoff + 2 * 32
+    dynoff = stroff + 28
+    base = 0x10000
+    entries = [(pylibelf.elf.DT_NEEDED, 1), (pylibelf.elf.DT_NEEDED, 13),
+               (pylibelf.elf.DT_STRTAB, base + stroff if strtab is None else strtab),
+               (pylibelf.elf.DT_STRSZ, len(strings)),
+               (pylibelf.elf.DT_NULL, 0)]
+    dynamic = b"".join(struct.pack(">iI", tag, value) for tag, value in entries)
+    size = dynoff + len(dynamic)
+    ident = (pylibelf.elf.ELFMAG.encode("latin-1") +
+             bytes([pylibelf.elf.ELFCLASS32, pylibelf.elf.ELFDATA2MSB, pylibelf.elf.EV_CURRENT]))
+    header = struct.pack(">16sHHIIIIIHHHHHH", ident, pylibelf.elf.ET_DYN, pylibelf.elf.EM_M32,
+                         pylibelf.elf.EV_CURRENT, 0, phoff, 0, 0, 52, 32, 2, 40, 0, 0)
+    phdrs = (struct.pack(">8I", pylibelf.elf.PT_LOAD, 0, base, base, size, size,
+                         pylibelf.elf.PF_R, 0x1000) +
+             struct.pack(">8I", pylibelf.elf.PT_DYNAMIC, dynoff, base + dynoff, base + dynoff,
+                         len(dynamic), len(dynamic), pylibelf.elf.PF_R, 4))
+    with open(filename, "wb") as handle:
+        handle.write(header + phdrs + strings.ljust(28, b"\0") + dynamic)
+    return dynoff, entries
+
+def check_unmapped_strings(tmpdir):
+    """ DT_STRTAB outside of every segment leaves the names unknown without failing the graph """
+    elfname = os.path.join(tmpdir, "unmapped.so")
+    write_headerless(elfname, 0x900000)
+    info = pylibelf.dynamic.read_dynamic(elfname)
+    assert(info.needed == [] and info.runpath == [])
+    graph = pylibelf.dynamic.DependencyResolver([]).resolve([elfname])
+    assert(graph.edges == {os.path.realpath(elfname): []})
+
+def check_ranges(tmpdir):
+    """ Without section headers .dynamic is read through PT_DYNAMIC with libelf translating it """
+    elfname = os.path.join(tmpdir, "headerless.so")
+    dynoff, entries = write_headerless(elfname)
+    melf = pylibelf.libelf.ElfDescriptor.fromfile(elfname, pylibelf.libelf.Elf_Cmd.ELF_C_READ_MMAP)
+    found = list(pylibelf.dynamic.iter_dynamic(melf))
+    assert([(entry.tag, entry.value) for entry in found] == entries[:-1])
+    assert([entry.string for entry in found][:2] == ["libfoo.so.1", "libbar.so.2"])
+
+    size = 8 * len(entries)
+    dyn = pylibelf.libelf.Elf_Type.ELF_T_DYN
+    native = b"".join(struct.pack("=iI", tag, value) for tag, value in entries)
+    assert(melf.read_range(dynoff, size, dyn) == native)
+    assert(melf.read_range(0, 4) == b"\x7fELF")
+    chunks = [(offset, bytes(chunk)) for offset, chunk in melf.iter_range(dynoff, size, dyn, 20)]
+    # Two 8 byte entries a chunk, translated one chunk at a time
+    assert([offset for offset, _ in chunks] == [dynoff, dynoff + 16, dynoff + 32])
+    assert(b"".join(chunk for _, chunk in chunks) == native)
+    raw = b"".join(bytes(chunk) for _, chunk in melf.iter_range(0, dynoff + size, chunk_size = 64))
+    with open(elfname, "rb") as handle:
+        assert(raw == handle.read())
+    try:
+        list(melf.iter_range(dynoff, size + 1))
+        assert(False), "Range past the end of the file accepted"
+    except ValueError:
+        pass
+    try:
+        list(melf.iter_range(dynoff, size - 4, dyn))
+        assert(False), "Trailing partial entry accepted"
+    except ValueError:
+        pass
+    del found, melf
+
+    # Not mapped, the chunks are read from the file instead of the whole image
+    melf = pylibelf.libelf.ElfDescriptor.fromfile(elfname, pylibelf.libelf.Elf_Cmd.ELF_C_READ)
+    assert([(offset, bytes(chunk)) for offset, chunk in
+            melf.iter_range(dynoff, size, dyn, 20)] == chunks)
+    assert(b"".join(bytes(chunk) for _, chunk in melf.iter_range(0, dynoff + size,
+                                                                   chunk_size = 64)) == raw)
+    digest = melf.fingerprint().digest
+    del melf
+
+    # Without sections the segment contents make up the combined digest
+    changed = bytearray(raw)
+    changed[dynoff - 2] ^= 0xff
+    copyname = os.path.join(tmpdir, "changed.so")
+    with open(copyname, "wb") as handle:
+        handle.write(changed)
+    other = pylibelf.libelf.ElfDescriptor.fromfile(copyname,
+                                                   pylibelf.libelf.Elf_Cmd.ELF_C_READ_MMAP)
+    assert(other.fingerprint().digest != digest)
+    del other
+
+def read_ELF(elfname):
+    melf = pylibelf.libelf.ElfDescriptor.fromfile(elfname, pylibelf.libelf.Elf_Cmd.ELF_C_READ)
+    for entry in pylibelf.dynamic.iter_dynamic(melf):
+        print(f"{entry.tag} {hex(entry.value)} {entry.string}")
+    info = pylibelf.dynamic.read_dynamic(elfname)
+    assert(info.needed == ["libfoo.so.1"])
+    assert(info.runpath == ["$ORIGIN/lib"])
+    check_resolver(elfname)
+    check_cache(elfname, melf)
+    tmpdir = tempfile.mkdtemp()
+    try:
+        check_ranges(tmpdir)
+        check_unmapped_strings(tmpdir)
+    finally:
+        shutil.rmtree(tmpdir)
+
+if __name__ == "__main__":
+    argtab = testhelper.parse_command_line(sys.argv)
+
+    if (argtab.filename != None and argtab.filename[0] != None):
+        print(f"Writing ELF file {argtab.filename[0]}")
+        write_ELF(argtab.filename[0])
+        testhelper.validate_ELF(argtab.filename[0], argtab.reference)
+    elif (argtab.decompile != None and argtab.decompile[0] != None):
+        print(f"Reading ELF file {argtab.decompile[0]}")
+        read_ELF(argtab.decompile[0])
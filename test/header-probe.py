@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+
+"""
+ SPDX-License-Identifier: MIT
+
+ Copyright (C) 2023 Advanced Micro Devices, Inc.
+
+ Header only probe of a big endian ELF file checked against libelf
+"""
+
+import os
+import sys
+import ctypes
+import tempfile
+
+import pylibelf.elf
+import pylibelf.libelf
+import pylibelf.probe
+
+import testhelper
+
+def write_ELF(filename):
+    melf = pylibelf.libelf.ElfDescriptor.fromfile(filename, pylibelf.libelf.Elf_Cmd.ELF_C_WRITE)
+    ehdr = melf.elf32_newehdr()
+
+    ehdr.contents.e_ident[pylibelf.elf.EI_DATA] = pylibelf.elf.ELFDATA2MSB
+    ehdr.contents.e_ident[pylibelf.elf.EI_OSABI] = pylibelf.elf.ELFOSABI_STANDALONE
+    ehdr.contents.e_machine = pylibelf.elf.EM_PPC
+    ehdr.contents.e_type = pylibelf.elf.ET_EXEC
+    ehdr.contents.e_entry = 0x10000100
+    ehdr.contents.e_flags = 0x80000000
+
+    scn = melf.elf_newscn()
+    data = scn.elf_newdata()
+
+    string_table = (ctypes.c_char * 11)(b'\0', b'.', b's', b'h', b's', b't', b'r', b't', b'a',
+                                        b'b', b'\0')
+    data.contents.d_align = 1
+    data.contents.d_buf = ctypes.cast(string_table, ctypes.c_void_p)
+    data.contents.d_off = 0
+    data.contents.d_size = ctypes.sizeof(string_table)
+    data.contents.d_type = pylibelf.libelf.Elf_Type.ELF_T_BYTE
+    data.contents.d_version = pylibelf.elf.EV_CURRENT
+
+    shdr = scn.elf32_getshdr()
+    shdr.contents.sh_name = 1
+    shdr.contents.sh_type = pylibelf.elf.SHT_STRTAB
+    shdr.contents.sh_flags = pylibelf.elf.SHF_STRINGS
+    shdr.contents.sh_entsize = 0
+
+    ehdr.contents.e_shstrndx = scn.elf_ndxscn()
+    melf.elf_update(pylibelf.libelf.Elf_Cmd.ELF_C_WRITE)
+
+def read_ELF(elfname):
+    header = pylibelf.probe.probe(elfname)
+    print(header)
+    # Probing never goes through libelf, which is only loaded on first use
+    assert(not pylibelf.libelf.is_loaded())
+    melf = pylibelf.libelf.ElfDescriptor.fromfile(elfname, pylibelf.libelf.Elf_Cmd.ELF_C_READ)
+    ehdr = melf.gelf_getehdr()
+    assert(header.elfclass == pylibelf.elf.ELFCLASS32 == melf.gelf_getclass())
+    assert(header.data == pylibelf.elf.ELFDATA2MSB)
+    assert(header.osabi == pylibelf.elf.ELFOSABI_STANDALONE)
+    for field in ["type", "machine", "entry", "phoff", "shoff", "flags", "ehsize", "phentsize",
+                  "phnum", "shentsize", "shnum", "shstrndx"]:
+        assert(getattr(header, field) == getattr(ehdr, "e_" + field)), field
+
+    tmpdir = tempfile.mkdtemp()
+    try:
+        short = os.path.join(tmpdir, "short")
+        with open(elfname, "rb") as source, open(short, "wb") as handle:
+            handle.write(source.read(20))
+        probes = pylibelf.probe.probe_many([elfname, short, tmpdir, os.path.join(tmpdir, "missing")])
+        assert(probes == [header, None, None, None])
+    finally:
+        os.remove(short)
+        os.rmdir(tmpdir)
+
+if __name__ == "__main__":
+    argtab = testhelper.parse_command_line(sys.argv)
+
+    if (argtab.filename != None and argtab.filename[0] != None):
+        print(f"Writing ELF file {argtab.filename[0]}")
+        write_ELF(argtab.filename[0])
+        testhelper.validate_ELF(argtab.filename[0], argtab.reference)
+    elif (argtab.decompile != None and argtab.decompile[0] != None):
+        print(f"Reading ELF file {argtab.decompile[0]}")
+        read_ELF(argtab.decompile[0])
@@ -9,10 +9,14 @@
 """
 
 import sys
+import mmap
 import ctypes
 
+import pylibelf
 import pylibelf.elf
 import pylibelf.libelf
+import pylibelf.compare
+import pylibelf.instrument
 
 import testhelper
 
@@ -71,7 +75,80 @@ def write_ELF(filename):
     phdr.contents.p_offset = ehdr.contents.e_phoff
     phdr.contents.p_filesz = pylibelf.libelf.elf32_fsize(pylibelf.libelf.Elf_Type.ELF_T_PHDR, 1, pylibelf.elf.EV_CURRENT)
     melf.elf_flagphdr(pylibelf.libelf.Elf_Cmd.ELF_C_SET , pylibelf.libelf.ELF_F_DIRTY)
-    melf.elf_update(pylibelf.libelf.Elf_Cmd.ELF_C_WRITE)
+    assert(melf.elf_update(pylibelf.libelf.Elf_Cmd.ELF_C_WRITE) > 0)
+
+def walk_ELF(elfname):
+    melf = pylibelf.libelf.ElfDescriptor.fromfile(elfname, pylibelf.libelf.Elf_Cmd.ELF_C_READ)
+    scn = melf.elf_nextscn(None)
+    while (scn is not None):
+        scn.elf_getdata()
+        scn = melf.elf_nextscn(scn)
+
+def check_profile(elfname):
+    """ Call statistics of a walk over the two sections """
+    assert(not pylibelf.instrument.enabled())
+    with pylibelf.profiled() as profile:
+        walk_ELF(elfname)
+    result = profile.stats()
+    assert(result["elf_begin"].calls == 1)
+    assert(result["elf_nextscn"].calls == 3)
+    assert(result["elf_getdata"].calls == 2)
+    assert(result["elf_getdata"].bytes == 12 + 16)
+    assert(result["elf_begin"].max <= result["elf_begin"].total)
+    # The plain ctypes functions are back once the block is left
+    assert(not hasattr(pylibelf.libelf._libelf.elf_getdata, "__wrapped__"))
+    assert(not pylibelf.stats())
+
+    pylibelf.instrument.enable()
+    walk_ELF(elfname)
+    with pylibelf.profiled() as profile:
+        walk_ELF(elfname)
+    pylibelf.instrument.disable()
+    walk_ELF(elfname)
+    assert(pylibelf.stats()["elf_getdata"].calls == 4)
+    assert(profile.stats()["elf_getdata"].calls == 2)
+    pylibelf.instrument.reset()
+    assert(not pylibelf.stats())
+
+def check_flags_and_update(elfname):
+    """ elf_update() failing with -1 raises, elf_flagphdr() returning no flags does not """
+    melf = pylibelf.libelf.ElfDescriptor.fromfile(elfname, pylibelf.libelf.Elf_Cmd.ELF_C_READ)
+    assert(melf.elf_flagphdr(pylibelf.libelf.Elf_Cmd.ELF_C_CLR, pylibelf.libelf.ELF_F_DIRTY) == 0)
+    try:
+        melf.elf_update(pylibelf.libelf.Elf_Cmd.ELF_C_WRITE)
+        assert False, "Update of a read only descriptor did not fail"
+    except pylibelf.libelf.ElfError:
+        pass
+
+def check_frommemory(elfname):
+    """ In place reading of the big endian image from bytes, bytearray and mmap """
+    ondisk = pylibelf.libelf.ElfDescriptor.fromfile(elfname, pylibelf.libelf.Elf_Cmd.ELF_C_READ)
+    with open(elfname, "rb") as handle:
+        image = handle.read()
+        mapping = mmap.mmap(handle.fileno(), 0, access = mmap.ACCESS_READ)
+    pristine = bytes(bytearray(image))
+    growable = bytearray(image)
+    for buffer in [image, growable, mapping, memoryview(image)[:len(image)]]:
+        melf = pylibelf.libelf.ElfDescriptor.frommemory(buffer)
+        assert(melf.memory_usage().mapped == len(image))
+        assert(not list(pylibelf.compare.iter_differences(ondisk, melf, contents = True)))
+        if (buffer is growable):
+            try:
+                growable.append(0)
+                assert False, "Pinned buffer was resized"
+            except BufferError:
+                pass
+        del melf
+    # Released along with the descriptor and never written to by libelf
+    growable.append(0)
+    assert(image == pristine)
+    mapping.close()
+
+    try:
+        pylibelf.libelf.ElfDescriptor.frommemory(image, len(image) + 1)
+        assert False, "Oversized image accepted"
+    except ValueError:
+        pass
 
 if __name__ == "__main__":
     argtab = testhelper.parse_command_line(sys.argv)
@@ -83,3 +160,6 @@ if __name__ == "__main__":
     elif (argtab.decompile != None and argtab.decompile[0] != None):
         print(f"Reading ELF file {argtab.decompile[0]}")
         testhelper.read_ELF(argtab.decompile[0])
+        check_profile(argtab.decompile[0])
+        check_frommemory(argtab.decompile[0])
+        check_flags_and_update(argtab.decompile[0])
@@ -8,12 +8,20 @@
  Shows multiple PROGBITS sections
 """
 
+import io
+import os
 import sys
+import json
 import ctypes
 import random
+import shutil
+import tempfile
 
 import pylibelf.elf
 import pylibelf.libelf
+import pylibelf.readelf
+import pylibelf.sections
+import pylibelf.strip
 
 import testhelper
 
@@ -138,6 +146,122 @@ def write_ELF(filename):
 
     melf.elf_update(pylibelf.libelf.Elf_Cmd.ELF_C_WRITE)
 
+def add_section(melf, name, sh_type, flags, buf, d_type = pylibelf.libelf.Elf_Type.ELF_T_BYTE):
+    scn = melf.elf_newscn()
+    data = scn.elf_newdata()
+    data.contents.d_align = 4 if d_type != pylibelf.libelf.Elf_Type.ELF_T_BYTE else 1
+    data.contents.d_off = 0
+    data.contents.d_buf = ctypes.cast(buf, ctypes.c_void_p)
+    data.contents.d_type = d_type
+    data.contents.d_size = ctypes.sizeof(buf)
+    data.contents.d_version = pylibelf.elf.EV_CURRENT
+    shdr = scn.elf32_getshdr()
+    shdr.contents.sh_name = name
+    shdr.contents.sh_type = sh_type
+    shdr.contents.sh_flags = flags
+    return scn
+
+def write_extended_ELF(filename, count):
+    """ ELF file with count .text sections after .debug_info, past SHN_LORESERVE """
+    strtab = testhelper.ElfStringTable()
+    strtab.add("")
+    melf = pylibelf.libelf.ElfDescriptor.fromfile(filename, pylibelf.libelf.Elf_Cmd.ELF_C_WRITE)
+    ehdr = melf.elf32_newehdr()
+    ehdr.contents.e_ident[pylibelf.elf.EI_DATA] = pylibelf.elf.ELFDATA2LSB
+    ehdr.contents.e_machine = pylibelf.elf.EM_386
+    ehdr.contents.e_type = pylibelf.elf.ET_REL
+
+    code = melf.pin(ctypes.create_string_buffer(b"\x90" * 4, 4))
+    add_section(melf, strtab.add(".debug_info"), pylibelf.elf.SHT_PROGBITS, 0, code)
+    name = strtab.add(".text.f")
+    flags = pylibelf.elf.SHF_ALLOC | pylibelf.elf.SHF_EXECINSTR
+    first = add_section(melf, name, pylibelf.elf.SHT_PROGBITS, flags, code).elf_ndxscn()
+    for _ in range(count - 1):
+        last = add_section(melf, name, pylibelf.elf.SHT_PROGBITS, flags, code).elf_ndxscn()
+
+    symstrtab = testhelper.ElfStringTable()
+    symtab = testhelper.ElfSymbolTable()
+    symtab.add(pylibelf.elf.Elf32_Sym(symstrtab.add(""), 0, 0, 0, 0, pylibelf.elf.SHN_UNDEF))
+    funcinfo = pylibelf.elf.ELF32_ST_INFO(pylibelf.elf.STB_GLOBAL, pylibelf.elf.STT_FUNC)
+    symtab.add(pylibelf.elf.Elf32_Sym(symstrtab.add("first"), 0, 4, funcinfo, 0), first)
+    symtab.add(pylibelf.elf.Elf32_Sym(symstrtab.add("last"), 0, 4, funcinfo, 0), last)
+    symtab.add(pylibelf.elf.Elf32_Sym(symstrtab.add("abs"), 0x1234, 0, funcinfo, 0,
+                                      pylibelf.elf.SHN_ABS))
+    symstr = add_section(melf, strtab.add(".strtab"), pylibelf.elf.SHT_STRTAB, 0,
+                         melf.pin(symstrtab.packsyms()))
+    symscn = add_section(melf, strtab.add(".symtab"), pylibelf.elf.SHT_SYMTAB, 0,
+                         melf.pin(symtab.packsyms()), pylibelf.libelf.Elf_Type.ELF_T_SYM)
+    symscn.elf32_getshdr().contents.sh_link = symstr.elf_ndxscn()
+    symscn.elf32_getshdr().contents.sh_info = 1
+    symscn.elf32_getshdr().contents.sh_entsize = ctypes.sizeof(pylibelf.elf.Elf32_Sym)
+    xscn = add_section(melf, strtab.add(".symtab_shndx"), pylibelf.elf.SHT_SYMTAB_SHNDX, 0,
+                       melf.pin(symtab.packshndx()), pylibelf.libelf.Elf_Type.ELF_T_WORD)
+    xscn.elf32_getshdr().contents.sh_link = symscn.elf_ndxscn()
+    xscn.elf32_getshdr().contents.sh_entsize = 4
+    # Relocations against the symbols keep the symbol table when stripping
+    rela = (pylibelf.elf.Elf32_Rela * 1)(pylibelf.elf.Elf32_Rela(0, 0x201, 0))
+    relascn = add_section(melf, strtab.add(".rela.text.f"), pylibelf.elf.SHT_RELA, 0,
+                          melf.pin(rela), pylibelf.libelf.Elf_Type.ELF_T_RELA)
+    relascn.elf32_getshdr().contents.sh_link = symscn.elf_ndxscn()
+    relascn.elf32_getshdr().contents.sh_info = first
+    relascn.elf32_getshdr().contents.sh_entsize = ctypes.sizeof(pylibelf.elf.Elf32_Rela)
+
+    name = strtab.add(".shstrtab")
+    shstrscn = add_section(melf, name, pylibelf.elf.SHT_STRTAB, 0, melf.pin(strtab.packsyms()))
+    melf.elf_setshstrndx(shstrscn.elf_ndxscn())
+    melf.elf_update(pylibelf.libelf.Elf_Cmd.ELF_C_WRITE)
+    return first, last, shstrscn.elf_ndxscn()
+
+def check_extended(elfname, first, last, shstrndx):
+    melf = pylibelf.libelf.ElfDescriptor.fromfile(elfname, pylibelf.libelf.Elf_Cmd.ELF_C_READ)
+    ehdr = melf.gelf_getehdr()
+    assert(ehdr.e_shnum == 0 and ehdr.e_shstrndx == pylibelf.elf.SHN_XINDEX)
+    assert(melf.elf_getshdrnum() == shstrndx + 1)
+    assert(melf.elf_getshdrstrndx() == shstrndx)
+    sections = pylibelf.sections.SectionIndex(melf)
+    assert(len(sections) == shstrndx + 1)
+    assert(sections[last].name == ".text.f" and sections[shstrndx].name == ".shstrtab")
+
+    symscn = sections.by_name(".symtab")
+    xsection = sections.shndx_section(symscn.index)
+    assert(xsection.name == ".symtab_shndx")
+    symdata = melf.elf_getscn(symscn.index).elf_getdata()
+    xdata = melf.elf_getscn(xsection.index).elf_getdata()
+    symtab = testhelper.ElfSymbolTable(symdata.contents.d_buf, symdata.contents.d_size)
+    symtab.load_shndx(xdata.contents.d_buf, xdata.contents.d_size)
+    shndxs = [first if first < pylibelf.elf.SHN_LORESERVE else pylibelf.elf.SHN_XINDEX,
+              pylibelf.elf.SHN_XINDEX, pylibelf.elf.SHN_ABS]
+    assert([item.st_shndx for item in symtab][1:] == shndxs)
+    assert([symtab.shndx(index) for index in range(len(symtab))] ==
+           [pylibelf.elf.SHN_UNDEF, first, last, pylibelf.elf.SHN_ABS])
+    sym, xshndx = pylibelf.libelf.gelf_getsymshndx(symdata, xdata, 2)
+    assert(sym.st_shndx == pylibelf.elf.SHN_XINDEX and xshndx == last)
+    del melf
+
+    stream = io.StringIO()
+    assert(pylibelf.readelf.main(["pylibelf", "--json", "symbols", elfname], stream) == 0)
+    records = [json.loads(line) for line in stream.getvalue().splitlines()]
+    assert([record["shndx"] for record in records if record["name"]] ==
+           [first, last, pylibelf.elf.SHN_ABS])
+
+def check_extended_numbering():
+    """ Write, read and strip a file with more sections than e_shnum can count """
+    tmpdir = tempfile.mkdtemp()
+    try:
+        elfname = os.path.join(tmpdir, "extended.elf")
+        first, last, shstrndx = write_extended_ELF(elfname, pylibelf.elf.SHN_LORESERVE)
+        assert(last > pylibelf.elf.SHN_LORESERVE)
+        check_extended(elfname, first, last, shstrndx)
+        stripped = os.path.join(tmpdir, "stripped.elf")
+        assert(pylibelf.strip.strip(elfname, stripped).removed == [".debug_info"])
+        check_extended(stripped, first - 1, last - 1, shstrndx - 1)
+        # .rela.text.f needs .symtab, which keeps .strtab and .symtab_shndx as well
+        result = pylibelf.strip.strip(elfname, stripped, symbols = True)
+        assert(result.removed == [".debug_info"])
+        check_extended(stripped, first - 1, last - 1, shstrndx - 1)
+    finally:
+        shutil.rmtree(tmpdir)
+
 if __name__ == "__main__":
     argtab = testhelper.parse_command_line(sys.argv)
 
@@ -148,3 +272,4 @@ if __name__ == "__main__":
     elif (argtab.decompile != None and argtab.decompile[0] != None):
         print(f"Reading ELF file {argtab.decompile[0]}")
         testhelper.read_ELF(argtab.decompile[0])
+        check_extended_numbering()
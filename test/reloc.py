@@ -8,11 +8,21 @@
  Dynamically populate the strtab based on section names
 """
 
+import io
+import os
 import sys
+import json
 import ctypes
+import struct
+import shutil
+import tempfile
 
 import pylibelf.elf
 import pylibelf.libelf
+import pylibelf.readelf
+import pylibelf.relocate
+import pylibelf.sections
+import pylibelf.tables
 
 import testhelper
 
@@ -199,6 +209,199 @@ def write_ELF(filename):
     melf.elf_flagphdr(pylibelf.libelf.Elf_Cmd.ELF_C_SET , pylibelf.libelf.ELF_F_DIRTY)
     melf.elf_update(pylibelf.libelf.Elf_Cmd.ELF_C_WRITE)
 
+def check_readelf(elfname):
+    """ Relocations and symbols as seen by the pylibelf command line tool """
+    stream = io.StringIO()
+    assert(pylibelf.readelf.main(["pylibelf", "--json", "relocs", elfname], stream) == 0)
+    relocs = [json.loads(line) for line in stream.getvalue().splitlines()]
+    assert([item["symbol"] for item in relocs] ==
+           ["", "myfunc", "hisfunc", "herfunc", "myvar", "hisvar", "hervar"])
+    assert([item["offset"] for item in relocs] == list(range(8, 8 + 16 * 7, 16)))
+    assert(all(item["addend"] == 0 and item["section"] == ".rela.dyn" for item in relocs))
+
+    stream = io.StringIO()
+    assert(pylibelf.readelf.main(["pylibelf", "symbols", elfname], stream) == 0)
+    lines = stream.getvalue().splitlines()
+    assert("Symbol table '.dynsym':" in lines)
+    assert(lines[-1].split()[1:] == ["00000000", "0", "OBJECT", "GLOBAL", "DEFAULT", "1", "hervar"])
+
+    stream = io.StringIO()
+    assert(pylibelf.readelf.main(["pylibelf", "hexdump", "-s", ".text", elfname], stream) == 0)
+    lines = stream.getvalue().splitlines()
+    assert(len(lines) == 2 + 256 // 16)
+    assert(lines[2] == "  0x00000000 67452301 efcdab89 dec0adde dec0adde gE#.............")
+
+def check_relocate(elfname):
+    """ Apply .rela.dyn to a copy of .text and exercise the relocation handlers """
+    melf = pylibelf.libelf.ElfDescriptor.fromfile(elfname, pylibelf.libelf.Elf_Cmd.ELF_C_READ)
+    engine = pylibelf.relocate.RelocationEngine(melf)
+    contents = engine.apply(base = 0x1000)
+    text = engine.sections.by_name(".text")
+    assert(list(contents) == [text.index])
+    words = list(struct.unpack("<64I", contents[text.index]))
+    # The first entry is against the null symbol, the others against symbols at 0
+    assert(words[2] == 0 and words[6::4][:6] == [0x1000] * 6)
+    assert(words[:2] == [0x01234567, 0x89abcdef] and words[3] == 0xdeadc0de)
+
+    # Handlers can be replaced per engine, unknown types are refused
+    double = pylibelf.relocate.RelocationHandler(
+        "double", 4, lambda symbols, addends, places, base: [2 * value for value in symbols])
+    engine = pylibelf.relocate.RelocationEngine(melf, {pylibelf.elf.R_M32R_32_RELA: double})
+    assert(struct.unpack_from("<I", engine.apply(base = 0x1000)[text.index], 24)[0] == 0x2000)
+    del engine.handlers[pylibelf.elf.R_M32R_32_RELA]
+    try:
+        engine.apply()
+        assert(False), "Unknown relocation type applied"
+    except ValueError:
+        pass
+
+    # Field insertion of the M32R instruction relocations, big endian like the target
+    handlers = pylibelf.relocate.HANDLERS[pylibelf.elf.EM_M32R]
+    buffer = bytearray(struct.pack(">IIIH", 0x10ff0000, 0x20ff0000, 0x7e000000, 0x7e00))
+    for rtype, offset, place in [(pylibelf.elf.R_M32R_HI16_SLO_RELA, 0, 0),
+                                 (pylibelf.elf.R_M32R_LO16_RELA, 4, 0),
+                                 (pylibelf.elf.R_M32R_26_PCREL_RELA, 8, 0x2008),
+                                 (pylibelf.elf.R_M32R_10_PCREL_RELA, 12, 0x2000)]:
+        handlers[rtype].apply(buffer, ">", [offset], [0x12348765], [0x10], [place], 0)
+    assert(struct.unpack(">IIIH", buffer) == (0x10ff1235, 0x20ff8775, 0x7e8d19db, 0x7edd))
+    # SHT_REL entries take their addends from the field, signed where the field is
+    assert(handlers[pylibelf.elf.R_M32R_26_PCREL].addends(buffer, ">", [8]) ==
+           [(0x8d19db - (1 << 24)) << 2])
+    assert(handlers[pylibelf.elf.R_M32R_10_PCREL].addends(buffer, ">", [12]) == [-0x23 << 2])
+    handler = pylibelf.relocate.HANDLERS[pylibelf.elf.EM_386][pylibelf.elf.R_386_PC32]
+    handler.apply(buffer, "<", [0], [0x1000], [-4], [0x800], 0)
+    assert(struct.unpack_from("<I", buffer)[0] == 0x7fc)
+
+def _add_section(melf, name, sh_type, addr, buf, d_type, entsize = 0):
+    scn = melf.elf_newscn()
+    data = scn.elf_newdata()
+    data.contents.d_align = 4
+    data.contents.d_off = 0
+    data.contents.d_buf = ctypes.cast(buf, ctypes.c_void_p)
+    data.contents.d_type = d_type
+    data.contents.d_size = ctypes.sizeof(buf)
+    data.contents.d_version = pylibelf.elf.EV_CURRENT
+    shdr = scn.elf32_getshdr()
+    shdr.contents.sh_name = name
+    shdr.contents.sh_type = sh_type
+    shdr.contents.sh_flags = pylibelf.elf.SHF_ALLOC
+    shdr.contents.sh_addr = addr
+    shdr.contents.sh_entsize = entsize
+    return scn
+
+def check_rel_pairs():
+    """ SHT_REL HI16 addends are completed by the low half of the following LO16 (AHL) """
+    tmpdir = tempfile.mkdtemp()
+    try:
+        elfname = os.path.join(tmpdir, "hi16.elf")
+        strtab = testhelper.ElfStringTable()
+        strtab.add("")
+        melf = pylibelf.libelf.ElfDescriptor.fromfile(elfname, pylibelf.libelf.Elf_Cmd.ELF_C_WRITE)
+        ehdr = melf.elf32_newehdr()
+        ehdr.contents.e_ident[pylibelf.elf.EI_DATA] = pylibelf.elf.ELFDATA2MSB
+        ehdr.contents.e_machine = pylibelf.elf.EM_M32R
+        ehdr.contents.e_type = pylibelf.elf.ET_REL
+        # A is 0x12345 split over the first pair and 0xfff0 over the second
+        words = (ctypes.c_uint * 4)(0x10ff0001, 0x20ff2345, 0x10ff0001, 0x20fffff0)
+        text = _add_section(melf, strtab.add(".text"), pylibelf.elf.SHT_PROGBITS, 0, words,
+                            pylibelf.libelf.Elf_Type.ELF_T_WORD)
+        symstrtab = testhelper.ElfStringTable()
+        symtab = testhelper.ElfSymbolTable()
+        symtab.add(pylibelf.elf.Elf32_Sym(symstrtab.add(""), 0, 0, 0, 0, pylibelf.elf.SHN_UNDEF))
+        for name, value in [("big", 0x6000), ("small", 0x4)]:
+            symtab.add(pylibelf.elf.Elf32_Sym(symstrtab.add(name), value, 0, 0, 0,
+                                              pylibelf.elf.SHN_ABS))
+        symstrdata = symstrtab.packsyms()
+        symdata = symtab.packsyms()
+        symstr = _add_section(melf, strtab.add(".strtab"), pylibelf.elf.SHT_STRTAB, 0, symstrdata,
+                              pylibelf.libelf.Elf_Type.ELF_T_BYTE)
+        symscn = _add_section(melf, strtab.add(".symtab"), pylibelf.elf.SHT_SYMTAB, 0, symdata,
+                              pylibelf.libelf.Elf_Type.ELF_T_SYM,
+                              ctypes.sizeof(pylibelf.elf.Elf32_Sym))
+        symscn.elf32_getshdr().contents.sh_link = symstr.elf_ndxscn()
+        rel = (pylibelf.elf.Elf32_Rel * 4)(
+            pylibelf.elf.Elf32_Rel(0, 1 << 8 | pylibelf.elf.R_M32R_HI16_SLO),
+            pylibelf.elf.Elf32_Rel(4, 1 << 8 | pylibelf.elf.R_M32R_LO16),
+            pylibelf.elf.Elf32_Rel(8, 2 << 8 | pylibelf.elf.R_M32R_HI16_ULO),
+            pylibelf.elf.Elf32_Rel(12, 2 << 8 | pylibelf.elf.R_M32R_LO16))
+        relscn = _add_section(melf, strtab.add(".rel.text"), pylibelf.elf.SHT_REL, 0, rel,
+                              pylibelf.libelf.Elf_Type.ELF_T_REL,
+                              ctypes.sizeof(pylibelf.elf.Elf32_Rel))
+        relscn.elf32_getshdr().contents.sh_link = symscn.elf_ndxscn()
+        relscn.elf32_getshdr().contents.sh_info = text.elf_ndxscn()
+        name = strtab.add(".shstrtab")
+        shstrtab = strtab.packsyms()
+        scn = _add_section(melf, name, pylibelf.elf.SHT_STRTAB, 0, shstrtab,
+                           pylibelf.libelf.Elf_Type.ELF_T_BYTE)
+        ehdr.contents.e_shstrndx = scn.elf_ndxscn()
+        melf.elf_update(pylibelf.libelf.Elf_Cmd.ELF_C_WRITE)
+        del melf
+
+        melf = pylibelf.libelf.ElfDescriptor.fromfile(elfname, pylibelf.libelf.Elf_Cmd.ELF_C_READ)
+        contents = pylibelf.relocate.apply_relocations(melf)
+        # S + A is 0x18345, its high half rounded for the sign extended low half is 2;
+        # 4 + 0xfff0 is 0xfff4 whose unadjusted high half is 0
+        assert(struct.unpack(">4I", contents[text.elf_ndxscn()]) ==
+               (0x10ff0002, 0x20ff8345, 0x10ff0000, 0x20fffff4))
+    finally:
+        shutil.rmtree(tmpdir)
+
+def check_relr():
+    """ Pack relative relocations as SHT_RELR, read them back and apply them """
+    assert(pylibelf.tables.relr_encode([0x10000, 0x10008, 0x10010, 0x10040], 8) == [0x10000, 0x107])
+    offsets = [0x2000, 0x2004, 0x2010, 0x2078] + list(range(0x2100, 0x2200, 4)) + [0x2400]
+    relr = pylibelf.tables.ElfRelrTable()
+    relr.extend(reversed(offsets))
+    relr.add(0x2000)
+    assert(relr.words() == [0x2000, 0x40000013, 0x2100, 0xffffffff, 0xffffffff, 0x3,
+                            0x2400])
+    assert(pylibelf.tables.relr_decode(relr.words()) == offsets)
+    # The 69 offsets take 7 words instead of 2 * 69 as Elf32_Rel
+    assert(relr.space() == 7 * 4)
+    try:
+        pylibelf.tables.relr_encode([0x2001])
+        assert(False), "Odd offset encoded"
+    except ValueError:
+        pass
+
+    tmpdir = tempfile.mkdtemp()
+    try:
+        elfname = os.path.join(tmpdir, "relr.elf")
+        strtab = testhelper.ElfStringTable()
+        strtab.add("")
+        melf = pylibelf.libelf.ElfDescriptor.fromfile(elfname, pylibelf.libelf.Elf_Cmd.ELF_C_WRITE)
+        ehdr = melf.elf32_newehdr()
+        ehdr.contents.e_ident[pylibelf.elf.EI_DATA] = pylibelf.elf.ELFDATA2LSB
+        ehdr.contents.e_machine = pylibelf.elf.EM_386
+        ehdr.contents.e_type = pylibelf.elf.ET_DYN
+        words = (ctypes.c_uint * 0x110)(*range(0x110))
+        _add_section(melf, strtab.add(".data"), pylibelf.elf.SHT_PROGBITS, 0x2000, words,
+                     pylibelf.libelf.Elf_Type.ELF_T_WORD)
+        _add_section(melf, strtab.add(".relr.dyn"), pylibelf.elf.SHT_RELR, 0x3000,
+                     relr.packsyms(), pylibelf.libelf.Elf_Type.ELF_T_WORD, 4)
+        name = strtab.add(".shstrtab")
+        shstrtab = strtab.packsyms()
+        scn = _add_section(melf, name, pylibelf.elf.SHT_STRTAB, 0, shstrtab,
+                           pylibelf.libelf.Elf_Type.ELF_T_BYTE)
+        ehdr.contents.e_shstrndx = scn.elf_ndxscn()
+        melf.elf_update(pylibelf.libelf.Elf_Cmd.ELF_C_WRITE)
+        del melf
+
+        melf = pylibelf.libelf.ElfDescriptor.fromfile(elfname, pylibelf.libelf.Elf_Cmd.ELF_C_READ)
+        section = pylibelf.sections.SectionIndex(melf).by_name(".relr.dyn")
+        assert(section.type == pylibelf.elf.SHT_RELR)
+        data = melf.elf_getscn(section.index).elf_getdata()
+        assert(list(pylibelf.tables.ElfRelrTable(data.contents.d_buf, data.contents.d_size)) ==
+               offsets)
+        engine = pylibelf.relocate.RelocationEngine(melf)
+        contents = engine.apply(base = 0x400000)
+        relocated = struct.unpack("<272I", contents[engine.sections.by_name(".data").index])
+        patched = {(offset - 0x2000) // 4 for offset in offsets}
+        assert(all(value == index + (0x400000 if index in patched else 0)
+                   for index, value in enumerate(relocated)))
+    finally:
+        shutil.rmtree(tmpdir)
+
 if __name__ == "__main__":
     argtab = testhelper.parse_command_line(sys.argv)
 
@@ -209,3 +412,7 @@ if __name__ == "__main__":
     elif (argtab.decompile != None and argtab.decompile[0] != None):
         print(f"Reading ELF file {argtab.decompile[0]}")
         testhelper.read_ELF(argtab.decompile[0])
+        check_readelf(argtab.decompile[0])
+        check_relocate(argtab.decompile[0])
+        check_relr()
+        check_rel_pairs()
@@ -0,0 +1,332 @@
+#!/usr/bin/env python3
+
+"""
+ SPDX-License-Identifier: MIT
+
+ Copyright (C) 2023 Advanced Micro Devices, Inc.
+
+ Section and symbol level diff and deduplicated storage of two releases of the
+ same ELF file
+"""
+
+import os
+import sys
+import struct
+import ctypes
+import shutil
+import tempfile
+
+import pylibelf.elf
+import pylibelf.libelf
+import pylibelf.atomic
+import pylibelf.diff
+import pylibelf.dedup
+import pylibelf.strip
+import pylibelf.sections
+
+import testhelper
+
+def populate_section(strtab, melf, name, sh_type, flags, buf, align = 4, entsize = 0):
+    scn = melf.elf_newscn()
+    data = scn.elf_newdata()
+    data.contents.d_align = align
+    data.contents.d_off = 0
+    data.contents.d_buf = ctypes.cast(buf, ctypes.c_void_p)
+    data.contents.d_type = pylibelf.libelf.Elf_Type.ELF_T_BYTE
+    data.contents.d_size = ctypes.sizeof(buf)
+    data.contents.d_version = pylibelf.elf.EV_CURRENT
+
+    shdr = scn.elf32_getshdr()
+    shdr.contents.sh_name = strtab.add(name)
+    shdr.contents.sh_type = sh_type
+    shdr.contents.sh_flags = flags
+    shdr.contents.sh_addralign = align
+    shdr.contents.sh_entsize = entsize
+    return scn
+
+def write_ELF(filename, release = 1):
+    """ Release 2 patches .data, moves myfunc, grows myvar, drops hisvar and adds .comment """
+    keep = []
+    strtab = testhelper.ElfStringTable()
+    melf = pylibelf.libelf.ElfDescriptor.fromfile(filename, pylibelf.libelf.Elf_Cmd.ELF_C_WRITE)
+    ehdr = melf.elf32_newehdr()
+
+    ehdr.contents.e_ident[pylibelf.elf.EI_DATA] = pylibelf.elf.ELFDATA2LSB
+    ehdr.contents.e_ident[pylibelf.elf.EI_VERSION] = pylibelf.elf.EV_CURRENT
+    ehdr.contents.e_machine = pylibelf.elf.EM_M32
+    ehdr.contents.e_type = pylibelf.elf.ET_REL
+    ehdr.contents.e_flags = 0x0
+
+    strtab.add("")
+
+    text_words = (ctypes.c_uint * 16)(*range(0x100, 0x110))
+    data_words = (ctypes.c_uint * 8)(*range(0x200, 0x208))
+    if (release == 2):
+        data_words[3] = 0xdeadc0de
+    keep += [text_words, data_words]
+    text = populate_section(strtab, melf, ".text", pylibelf.elf.SHT_PROGBITS,
+                            pylibelf.elf.SHF_ALLOC | pylibelf.elf.SHF_EXECINSTR, text_words)
+    data = populate_section(strtab, melf, ".data", pylibelf.elf.SHT_PROGBITS,
+                            pylibelf.elf.SHF_ALLOC | pylibelf.elf.SHF_WRITE, data_words)
+
+    symstrtab = testhelper.ElfStringTable()
+    symtab = testhelper.ElfSymbolTable()
+    symtab.add(pylibelf.elf.Elf32_Sym(symstrtab.add(""), 0, 0, 0, 0, pylibelf.elf.SHN_UNDEF))
+    funcinfo = pylibelf.elf.ELF32_ST_INFO(pylibelf.elf.STB_GLOBAL, pylibelf.elf.STT_FUNC)
+    varinfo = pylibelf.elf.ELF32_ST_INFO(pylibelf.elf.STB_GLOBAL, pylibelf.elf.STT_OBJECT)
+    symtab.add(pylibelf.elf.Elf32_Sym(symstrtab.add("myfunc"), 0x20 if release == 2 else 0x10,
+                                      0x10, funcinfo, 0, text.elf_ndxscn()))
+    symtab.add(pylibelf.elf.Elf32_Sym(symstrtab.add("hisfunc"), 0x0, 0x10, funcinfo, 0,
+                                      text.elf_ndxscn()))
+    symtab.add(pylibelf.elf.Elf32_Sym(symstrtab.add("myvar"), 0x0, 8 if release == 2 else 4,
+                                      varinfo, 0, data.elf_ndxscn()))
+    if (release == 1):
+        symtab.add(pylibelf.elf.Elf32_Sym(symstrtab.add("hisvar"), 0x10, 4, varinfo, 0,
+                                          data.elf_ndxscn()))
+
+    symstrdata = symstrtab.packsyms()
+    symdata = symtab.packsyms()
+    keep += [symstrdata, symdata]
+    symstr = populate_section(strtab, melf, ".strtab", pylibelf.elf.SHT_STRTAB, 0, symstrdata, 1)
+    symscn = populate_section(strtab, melf, ".symtab", pylibelf.elf.SHT_SYMTAB, 0, symdata, 4,
+                              ctypes.sizeof(pylibelf.elf.Elf32_Sym))
+    symshdr = symscn.elf32_getshdr()
+    symshdr.contents.sh_link = symstr.elf_ndxscn()
+    symshdr.contents.sh_info = 1
+
+    if (release == 2):
+        comment = ctypes.create_string_buffer(b"release 2")
+        keep.append(comment)
+        populate_section(strtab, melf, ".comment", pylibelf.elf.SHT_PROGBITS, 0, comment, 1)
+
+    shstrscn = melf.elf_newscn()
+    shstrscn.elf32_getshdr().contents.sh_name = strtab.add(".shstrtab")
+    shstrdata = strtab.packsyms()
+    keep.append(shstrdata)
+    shstr_data = shstrscn.elf_newdata()
+    shstr_data.contents.d_align = 1
+    shstr_data.contents.d_off = 0
+    shstr_data.contents.d_buf = ctypes.cast(shstrdata, ctypes.c_void_p)
+    shstr_data.contents.d_type = pylibelf.libelf.Elf_Type.ELF_T_BYTE
+    shstr_data.contents.d_size = ctypes.sizeof(shstrdata)
+    shstr_data.contents.d_version = pylibelf.elf.EV_CURRENT
+    shstrshdr = shstrscn.elf32_getshdr()
+    shstrshdr.contents.sh_type = pylibelf.elf.SHT_STRTAB
+    shstrshdr.contents.sh_flags = pylibelf.elf.SHF_STRINGS
+    ehdr.contents.e_shstrndx = shstrscn.elf_ndxscn()
+
+    melf.elf_update(pylibelf.libelf.Elf_Cmd.ELF_C_WRITE)
+
+def check_store(tmpdir, release1, release2):
+    """ Both releases share .text, rebuilding gives back the same bytes """
+    store = pylibelf.dedup.SectionStore(os.path.join(tmpdir, "store"))
+    size1 = os.path.getsize(release1)
+    assert(store.add(release1, "release1") == size1)
+    assert(store.add(release1, "copy") == 0)
+    assert(0 < store.add(release2, "release2") < os.path.getsize(release2))
+    assert(store.names() == ["copy", "release1", "release2"])
+    try:
+        store.add(release2, "release1")
+        assert(False), "Manifest of release1 overwritten"
+    except ValueError:
+        pass
+
+    result = store.stats()
+    print(result)
+    assert(result.files == 3 and result.logical_size == 2 * size1 + os.path.getsize(release2))
+    assert(result.unique_chunks < result.chunks)
+
+    for name, original in [("release1", release1), ("release2", release2)]:
+        rebuilt = os.path.join(tmpdir, name + ".rebuilt")
+        store.rebuild(name, rebuilt)
+        with open(rebuilt, "rb") as handle, open(original, "rb") as orighandle:
+            assert(handle.read() == orighandle.read())
+        assert(os.stat(rebuilt).st_mode == os.stat(original).st_mode)
+
+    # Store files get the permissions open() would give, rebuilt files those of the original
+    umask = pylibelf.atomic.umask()
+    manifest = os.path.join(tmpdir, "store", "manifests", "release1.json")
+    assert(os.stat(manifest).st_mode & 0o777 == 0o666 & ~umask)
+    executable = os.path.join(tmpdir, "executable")
+    shutil.copy(release1, executable)
+    os.chmod(executable, 0o751)
+    store.add(executable)
+    store.rebuild("executable", executable + ".rebuilt")
+    assert(os.stat(executable + ".rebuilt").st_mode & 0o7777 == 0o751)
+    # A file failing to verify is neither written nor leaves a temporary file behind
+    listing = sorted(os.listdir(tmpdir))
+    with open(manifest, "r", encoding = "utf-8") as handle:
+        contents = handle.read()
+    with open(manifest, "w", encoding = "utf-8") as handle:
+        handle.write(contents.replace('"sha256": "', '"sha256": "0'))
+    try:
+        store.rebuild("release1", os.path.join(tmpdir, "corrupt"))
+        assert(False), "Rebuilt a file not matching its manifest"
+    except ValueError:
+        pass
+    assert(sorted(os.listdir(tmpdir)) == listing)
+
+def check_strip(tmpdir):
+    """ Strip debug sections and the symbol table, the remaining sections are renumbered """
+    elfname = os.path.join(tmpdir, "debug.elf")
+    keep = []
+    strtab = testhelper.ElfStringTable()
+    strtab.add("")
+    melf = pylibelf.libelf.ElfDescriptor.fromfile(elfname, pylibelf.libelf.Elf_Cmd.ELF_C_WRITE)
+    ehdr = melf.elf32_newehdr()
+    ehdr.contents.e_ident[pylibelf.elf.EI_DATA] = pylibelf.elf.ELFDATA2LSB
+    ehdr.contents.e_machine = pylibelf.elf.EM_M32
+    ehdr.contents.e_type = pylibelf.elf.ET_REL
+
+    debug_words = (ctypes.c_uint * 64)(*range(64))
+    text_words = (ctypes.c_uint * 16)(*range(0x100, 0x110))
+    rela = (pylibelf.elf.Elf32_Rela * 2)(pylibelf.elf.Elf32_Rela(0x4, 0x101, 0),
+                                         pylibelf.elf.Elf32_Rela(0x8, 0x101, 4))
+    comment = ctypes.create_string_buffer(b"stripped")
+    # Against myfunc, renumbered once the section symbol of .debug_info is dropped
+    textrela = (pylibelf.elf.Elf32_Rela * 1)(pylibelf.elf.Elf32_Rela(0x4, 0x301, 0))
+    keep += [debug_words, text_words, rela, comment, textrela]
+    debug = populate_section(strtab, melf, ".debug_info", pylibelf.elf.SHT_PROGBITS, 0,
+                             debug_words)
+    relascn = populate_section(strtab, melf, ".rela.debug_info", pylibelf.elf.SHT_RELA, 0, rela,
+                               4, ctypes.sizeof(pylibelf.elf.Elf32_Rela))
+    text = populate_section(strtab, melf, ".text", pylibelf.elf.SHT_PROGBITS,
+                            pylibelf.elf.SHF_ALLOC | pylibelf.elf.SHF_EXECINSTR, text_words, 16)
+
+    symstrtab = testhelper.ElfStringTable()
+    symtab = testhelper.ElfSymbolTable()
+    symtab.add(pylibelf.elf.Elf32_Sym(symstrtab.add(""), 0, 0, 0, 0, pylibelf.elf.SHN_UNDEF))
+    for scn in (debug, text):
+        symtab.add(pylibelf.elf.Elf32_Sym(0, 0, 0, pylibelf.elf.ELF32_ST_INFO(
+            pylibelf.elf.STB_LOCAL, pylibelf.elf.STT_SECTION), 0, scn.elf_ndxscn()))
+    symtab.add(pylibelf.elf.Elf32_Sym(symstrtab.add("myfunc"), 0x10, 0x10,
+                                      pylibelf.elf.ELF32_ST_INFO(pylibelf.elf.STB_GLOBAL,
+                                                                 pylibelf.elf.STT_FUNC),
+                                      0, text.elf_ndxscn()))
+    symtab.add(pylibelf.elf.Elf32_Sym(symstrtab.add("abs"), 0x1234, 0, 0, 0,
+                                      pylibelf.elf.SHN_ABS))
+    symstrdata = symstrtab.packsyms()
+    symdata = symtab.packsyms()
+    keep += [symstrdata, symdata]
+    symstr = populate_section(strtab, melf, ".strtab", pylibelf.elf.SHT_STRTAB, 0, symstrdata, 1)
+    symscn = populate_section(strtab, melf, ".symtab", pylibelf.elf.SHT_SYMTAB, 0, symdata, 4,
+                              ctypes.sizeof(pylibelf.elf.Elf32_Sym))
+    symscn.elf32_getshdr().contents.sh_link = symstr.elf_ndxscn()
+    symscn.elf32_getshdr().contents.sh_info = 3
+    relashdr = relascn.elf32_getshdr()
+    relashdr.contents.sh_link = symscn.elf_ndxscn()
+    relashdr.contents.sh_info = debug.elf_ndxscn()
+    populate_section(strtab, melf, ".comment", pylibelf.elf.SHT_PROGBITS, 0, comment, 1)
+    textrelascn = populate_section(strtab, melf, ".rela.text", pylibelf.elf.SHT_RELA, 0, textrela,
+                                   4, ctypes.sizeof(pylibelf.elf.Elf32_Rela))
+    textrelascn.elf32_getshdr().contents.sh_link = symscn.elf_ndxscn()
+    textrelascn.elf32_getshdr().contents.sh_info = text.elf_ndxscn()
+
+    name = strtab.add(".shstrtab")
+    shstrdata = strtab.packsyms()
+    keep.append(shstrdata)
+    shstrscn = populate_section(testhelper.ElfStringTable(), melf, "", pylibelf.elf.SHT_STRTAB,
+                                0, shstrdata, 1)
+    shstrscn.elf32_getshdr().contents.sh_name = name
+    ehdr.contents.e_shstrndx = shstrscn.elf_ndxscn()
+    melf.elf_update(pylibelf.libelf.Elf_Cmd.ELF_C_WRITE)
+    del melf
+
+    stripped = os.path.join(tmpdir, "stripped.elf")
+    result = pylibelf.strip.strip(elfname, stripped)
+    print(result)
+    assert(result.removed == [".debug_info", ".rela.debug_info"])
+    assert(result.size == os.path.getsize(stripped) < os.path.getsize(elfname))
+    melf = pylibelf.libelf.ElfDescriptor.fromfile(stripped, pylibelf.libelf.Elf_Cmd.ELF_C_READ)
+    sections = pylibelf.sections.SectionIndex(melf)
+    assert([item.name for item in sections] ==
+           ["", ".text", ".strtab", ".symtab", ".comment", ".rela.text", ".shstrtab"])
+    assert(sections.by_name(".text").offset % 16 == 0)
+    assert(sections.by_name(".symtab").link == sections.by_name(".strtab").index)
+    contents = {item.name: bytes(melf.elf_rawfile()[item.offset:item.offset + item.size])
+                for item in sections}
+    assert(contents[".text"] == bytes(text_words) and contents[".comment"] == comment.raw)
+    stripped_symtab = testhelper.ElfSymbolTable(contents[".symtab"], len(contents[".symtab"]))
+    assert([item.st_shndx for item in stripped_symtab] ==
+           [pylibelf.elf.SHN_UNDEF, sections.by_name(".text").index,
+            sections.by_name(".text").index, pylibelf.elf.SHN_ABS])
+    assert(sections.by_name(".symtab").size == 4 * ctypes.sizeof(pylibelf.elf.Elf32_Sym))
+    assert(sections.by_name(".symtab").info == 2)
+    assert(pylibelf.elf.Elf32_Rela.from_buffer_copy(contents[".rela.text"]).r_info == 0x201)
+    del melf
+
+    result = pylibelf.strip.strip(stripped, elfname, [".comment", ".rela.text"], symbols = True)
+    assert(result.removed == [".comment", ".rela.text", ".strtab", ".symtab"])
+    melf = pylibelf.libelf.ElfDescriptor.fromfile(elfname, pylibelf.libelf.Elf_Cmd.ELF_C_READ)
+    assert([item.name for item in pylibelf.sections.SectionIndex(melf)] ==
+           ["", ".text", ".shstrtab"])
+    del melf
+
+    size = os.path.getsize(elfname)
+    try:
+        pylibelf.strip.strip(stripped, elfname, [".text"])
+        assert(False), "Allocated section removed"
+    except ValueError:
+        pass
+    # A failed strip leaves the destination alone
+    assert(os.path.getsize(elfname) == size)
+
+    # .comment made to refer to .symtab through sh_info, which only sh_link may keep
+    with open(stripped, "r+b") as handle:
+        image = bytearray(handle.read())
+        shoff = struct.unpack_from("<I", image, 32)[0]
+        struct.pack_into("<I", image, shoff + 4 * 40 + 8, pylibelf.elf.SHF_INFO_LINK)
+        struct.pack_into("<I", image, shoff + 4 * 40 + 28, 3)
+        handle.seek(0)
+        handle.write(image)
+    try:
+        pylibelf.strip.strip(stripped, elfname, [".rela.text"], symbols = True)
+        assert(False), "Section referring to a removed one kept"
+    except ValueError:
+        pass
+
+    # In place, the source is read whole before it is replaced
+    result = pylibelf.strip.strip(stripped, stripped, [".comment"])
+    assert(result.size == os.path.getsize(stripped))
+    melf = pylibelf.libelf.ElfDescriptor.fromfile(stripped, pylibelf.libelf.Elf_Cmd.ELF_C_READ)
+    assert([item.name for item in pylibelf.sections.SectionIndex(melf)] ==
+           ["", ".text", ".strtab", ".symtab", ".rela.text", ".shstrtab"])
+    assert(not [name for name in os.listdir(tmpdir) if name.startswith("tmp")])
+    del melf
+
+def read_ELF(elfname):
+    assert(not pylibelf.diff.diff_elf(elfname, elfname))
+
+    tmpdir = tempfile.mkdtemp()
+    release2 = os.path.join(tmpdir, "release2.elf")
+    try:
+        write_ELF(release2, 2)
+        result = pylibelf.diff.diff_elf(elfname, release2, max_workers = 2)
+        check_store(tmpdir, elfname, release2)
+        check_strip(tmpdir)
+    finally:
+        shutil.rmtree(tmpdir)
+    print(result)
+
+    sections = {(item.name, item.change) for item in result.sections}
+    assert(sections == {(".data", pylibelf.diff.CHANGED), (".strtab", pylibelf.diff.CHANGED),
+                        (".symtab", pylibelf.diff.CHANGED), (".shstrtab", pylibelf.diff.CHANGED),
+                        (".comment", pylibelf.diff.ADDED)}), sections
+
+    symbols = {(item.name, item.change): (item.left, item.right) for item in result.symbols}
+    info = pylibelf.diff.SymbolInfo
+    assert(symbols == {
+        ("myfunc", pylibelf.diff.MOVED): (info(0x10, 0x10), info(0x20, 0x10)),
+        ("myvar", pylibelf.diff.RESIZED): (info(0x0, 4), info(0x0, 8)),
+        ("hisvar", pylibelf.diff.REMOVED): (info(0x10, 4), None)}), symbols
+
+if __name__ == "__main__":
+    argtab = testhelper.parse_command_line(sys.argv)
+
+    if (argtab.filename != None and argtab.filename[0] != None):
+        print(f"Writing ELF file {argtab.filename[0]}")
+        write_ELF(argtab.filename[0])
+        testhelper.validate_ELF(argtab.filename[0], argtab.reference)
+    elif (argtab.decompile != None and argtab.decompile[0] != None):
+        print(f"Reading ELF file {argtab.decompile[0]}")
+        read_ELF(argtab.decompile[0])
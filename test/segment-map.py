@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+
+"""
+ SPDX-License-Identifier: MIT
+
+ Copyright (C) 2023 Advanced Micro Devices, Inc.
+
+ Text and data+bss PT_LOAD segments, virtual address <-> file offset translation
+ and reads by virtual address
+"""
+
+import sys
+import ctypes
+
+import pylibelf.elf
+import pylibelf.libelf
+import pylibelf.sections
+import pylibelf.segments
+import pylibelf.image
+
+import testhelper
+
+TEXT_ADDR = 0x1000
+DATA_ADDR = 0x2000
+BSS_SIZE = 0x100
+
+def populate_section(strtab, melf, name, sh_type, flags, addr, words, size = 0):
+    scn = melf.elf_newscn()
+    data = scn.elf_newdata()
+    data.contents.d_align = 4
+    data.contents.d_off = 0
+    if (words is not None):
+        data.contents.d_buf = ctypes.cast(words, ctypes.c_void_p)
+        size = ctypes.sizeof(words)
+    data.contents.d_type = pylibelf.libelf.Elf_Type.ELF_T_WORD
+    data.contents.d_size = size
+    data.contents.d_version = pylibelf.elf.EV_CURRENT
+
+    shdr = scn.elf32_getshdr()
+    shdr.contents.sh_name = strtab.add(name)
+    shdr.contents.sh_type = sh_type
+    shdr.contents.sh_flags = flags
+    shdr.contents.sh_addr = addr
+    shdr.contents.sh_entsize = 0
+    return scn
+
+def write_ELF(filename):
+    strtab = testhelper.ElfStringTable()
+    melf = pylibelf.libelf.ElfDescriptor.fromfile(filename, pylibelf.libelf.Elf_Cmd.ELF_C_WRITE)
+    ehdr = melf.elf32_newehdr()
+
+    ehdr.contents.e_ident[pylibelf.elf.EI_DATA] = pylibelf.elf.ELFDATA2LSB
+    ehdr.contents.e_ident[pylibelf.elf.EI_VERSION] = pylibelf.elf.EV_CURRENT
+    # Our own ABI version
+    ehdr.contents.e_ident[pylibelf.elf.EI_OSABI] = 0x40
+    ehdr.contents.e_ident[pylibelf.elf.EI_ABIVERSION] = 0x1
+    # Repurpose obsolete EM_M32 for our machine type
+    ehdr.contents.e_machine = pylibelf.elf.EM_M32
+    ehdr.contents.e_type = pylibelf.elf.ET_EXEC
+    ehdr.contents.e_entry = TEXT_ADDR
+    ehdr.contents.e_flags = 0x0
+
+    strtab.add("")
+
+    phdr = melf.elf32_newphdr(2)
+
+    text_words = (ctypes.c_uint * 16)(*range(0x100, 0x110))
+    data_words = (ctypes.c_uint * 8)(*range(0x200, 0x208))
+    text = populate_section(strtab, melf, ".text", pylibelf.elf.SHT_PROGBITS,
+                            pylibelf.elf.SHF_ALLOC | pylibelf.elf.SHF_EXECINSTR, TEXT_ADDR, text_words)
+    data = populate_section(strtab, melf, ".data", pylibelf.elf.SHT_PROGBITS,
+                            pylibelf.elf.SHF_ALLOC | pylibelf.elf.SHF_WRITE, DATA_ADDR, data_words)
+    populate_section(strtab, melf, ".bss", pylibelf.elf.SHT_NOBITS,
+                     pylibelf.elf.SHF_ALLOC | pylibelf.elf.SHF_WRITE,
+                     DATA_ADDR + ctypes.sizeof(data_words), None, BSS_SIZE)
+
+    scn = melf.elf_newscn()
+    scn_data = scn.elf_newdata()
+    scn_data.contents.d_align = 1
+    scn_data.contents.d_off = 0
+    scn_data.contents.d_type = pylibelf.libelf.Elf_Type.ELF_T_BYTE
+    scn_data.contents.d_version = pylibelf.elf.EV_CURRENT
+
+    shdr = scn.elf32_getshdr()
+    shdr.contents.sh_name = strtab.add(".shstrtab")
+    shdr.contents.sh_type = pylibelf.elf.SHT_STRTAB
+    shdr.contents.sh_flags = pylibelf.elf.SHF_STRINGS
+    shdr.contents.sh_entsize = 0
+
+    symsdata = strtab.packsyms()
+    scn_data.contents.d_size = ctypes.sizeof(symsdata)
+    scn_data.contents.d_buf = ctypes.cast(symsdata, ctypes.c_void_p)
+    ehdr.contents.e_shstrndx = scn.elf_ndxscn()
+
+    melf.elf_update(pylibelf.libelf.Elf_Cmd.ELF_C_NULL)
+
+    text_shdr = text.elf32_getshdr()
+    phdr[0].p_type = pylibelf.elf.PT_LOAD
+    phdr[0].p_offset = text_shdr.contents.sh_offset
+    phdr[0].p_vaddr = TEXT_ADDR
+    phdr[0].p_paddr = TEXT_ADDR
+    phdr[0].p_filesz = text_shdr.contents.sh_size
+    phdr[0].p_memsz = text_shdr.contents.sh_size
+    phdr[0].p_flags = pylibelf.elf.PF_R | pylibelf.elf.PF_X
+    phdr[0].p_align = 0x4
+
+    data_shdr = data.elf32_getshdr()
+    phdr[1].p_type = pylibelf.elf.PT_LOAD
+    phdr[1].p_offset = data_shdr.contents.sh_offset
+    phdr[1].p_vaddr = DATA_ADDR
+    phdr[1].p_paddr = DATA_ADDR
+    phdr[1].p_filesz = data_shdr.contents.sh_size
+    phdr[1].p_memsz = data_shdr.contents.sh_size + BSS_SIZE
+    phdr[1].p_flags = pylibelf.elf.PF_R | pylibelf.elf.PF_W
+    phdr[1].p_align = 0x4
+
+    melf.elf_flagphdr(pylibelf.libelf.Elf_Cmd.ELF_C_SET , pylibelf.libelf.ELF_F_DIRTY)
+    melf.elf_update(pylibelf.libelf.Elf_Cmd.ELF_C_WRITE)
+
+def read_ELF(elfname):
+    melf = pylibelf.libelf.ElfDescriptor.fromfile(elfname, pylibelf.libelf.Elf_Cmd.ELF_C_READ)
+    assert(melf.elf_getphdrnum() == 2)
+    assert(melf.elf32_getphdr()[1].p_vaddr == DATA_ADDR)
+
+    index = pylibelf.segments.SegmentIndex(melf)
+    for segment in index.segments:
+        names = [index.sections[item].name for item in index.sections_in_segment(segment.index)]
+        print(f"[{segment.index}] {hex(segment.vaddr)} {hex(segment.offset)} {names}")
+
+    text = index.sections.by_name(".text")
+    data = index.sections.by_name(".data")
+    bss = index.sections.by_name(".bss")
+    assert(index.vaddr_to_offset(TEXT_ADDR) == text.offset)
+    assert(index.vaddr_to_offset(TEXT_ADDR + 0x3f) == text.offset + 0x3f)
+    assert(index.vaddr_to_offset(TEXT_ADDR + 0x40) is None)
+    assert(index.vaddr_to_offset(DATA_ADDR + 4) == data.offset + 4)
+    # Zero filled tail of the data segment has no file backing
+    assert(index.vaddr_to_offset(bss.addr) is None)
+    assert(index.segment_for_vaddr(bss.addr + BSS_SIZE - 1).index == 1)
+    assert(index.segment_for_vaddr(bss.addr + BSS_SIZE) is None)
+    assert(index.offset_to_vaddr(data.offset + 8) == DATA_ADDR + 8)
+    assert(index.offset_to_vaddr(0) is None)
+    assert(index.sections_in_segment(1) == [data.index, bss.index])
+    assert(index.segments_of_section(text.index) == [0])
+    assert(index.segments_of_section(index.sections.by_name(".shstrtab").index) == [])
+    check_image(elfname)
+    check_tbss()
+
+def check_tbss():
+    """ .tbss overlaps what follows it in the PT_LOAD image but only belongs to PT_TLS """
+    flags = pylibelf.elf.SHF_ALLOC | pylibelf.elf.SHF_WRITE | pylibelf.elf.SHF_TLS
+    tdata = pylibelf.sections.SectionInfo(1, ".tdata", pylibelf.elf.SHT_PROGBITS, flags,
+                                          DATA_ADDR, 0x1000, 0x10, 0, 0, 4, 0)
+    tbss = pylibelf.sections.SectionInfo(2, ".tbss", pylibelf.elf.SHT_NOBITS, flags,
+                                         DATA_ADDR + 0x10, 0x1010, 0x20, 0, 0, 4, 0)
+    load = pylibelf.segments.SegmentInfo(0, pylibelf.elf.PT_LOAD, pylibelf.elf.PF_R, 0x1000,
+                                         DATA_ADDR, DATA_ADDR, 0x10, 0x100, 4)
+    tls = pylibelf.segments.SegmentInfo(1, pylibelf.elf.PT_TLS, pylibelf.elf.PF_R, 0x1000,
+                                        DATA_ADDR, DATA_ADDR, 0x10, 0x30, 4)
+    assert(pylibelf.segments.section_in_segment(tdata, load))
+    assert(pylibelf.segments.section_in_segment(tdata, tls))
+    assert(not pylibelf.segments.section_in_segment(tbss, load))
+    assert(pylibelf.segments.section_in_segment(tbss, tls))
+
+def check_image(elfname):
+    with pylibelf.image.ElfImage(elfname) as image:
+        assert(image.unpack_vaddrs([TEXT_ADDR, TEXT_ADDR + 4, DATA_ADDR + 0x1c]) == [0x100, 0x101, 0x207])
+        view = image.read_vaddr(TEXT_ADDR + 8, 8)
+        assert(isinstance(view, memoryview) and view.tobytes() == bytes([2, 1, 0, 0, 3, 1, 0, 0]))
+        view.release()
+        # Straddles the end of .data and the zero filled .bss
+        assert(image.read_vaddr(DATA_ADDR + 0x1c, 8).tobytes() == bytes([7, 2, 0, 0, 0, 0, 0, 0]))
+        assert(image.read_vaddr(DATA_ADDR + 0x20 + BSS_SIZE - 4, 4).tobytes() == bytes(4))
+        for addr in [0, TEXT_ADDR + 0x40, DATA_ADDR + 0x20 + BSS_SIZE]:
+            try:
+                image.read_vaddr(addr, 4)
+                assert False, f"Read of unmapped {hex(addr)} did not fail"
+            except ValueError:
+                pass
+        try:
+            image.read_vaddr(DATA_ADDR + 0x20 + BSS_SIZE - 2, 4)
+            assert False, "Read running off the end of the data segment did not fail"
+        except ValueError:
+            pass
+
+if __name__ == "__main__":
+    argtab = testhelper.parse_command_line(sys.argv)
+
+    if (argtab.filename != None and argtab.filename[0] != None):
+        print(f"Writing ELF file {argtab.filename[0]}")
+        write_ELF(argtab.filename[0])
+        testhelper.validate_ELF(argtab.filename[0], argtab.reference)
+    elif (argtab.decompile != None and argtab.decompile[0] != None):
+        print(f"Reading ELF file {argtab.decompile[0]}")
+        read_ELF(argtab.decompile[0])
@@ -8,11 +8,20 @@
  Dynamically populate the strtab based on section names
 """
 
+import os
 import sys
+import shutil
 import ctypes
+import struct
+import tempfile
 
 import pylibelf.elf
+import pylibelf.cache
 import pylibelf.libelf
+import pylibelf.names
+import pylibelf.tables
+import pylibelf.sections
+import pylibelf.segments
 
 import testhelper
 
@@ -68,6 +77,8 @@ def write_Symtab(melf, strtab, textindex):
     shdr4.contents.sh_entsize = ctypes.sizeof(pylibelf.elf.Elf32_Sym)
     shdr4.contents.sh_link = scn3.elf_ndxscn()
     shdr4.contents.sh_info = defaultlocal + 1
+    # libelf only references the buffers, they have to outlive elf_update
+    return dsymsdata, symsdata
 
 
 def write_ELF(filename):
@@ -122,7 +133,7 @@ def write_ELF(filename):
     shdr2.contents.sh_flags = pylibelf.elf.SHF_STRINGS | pylibelf.elf.SHF_ALLOC
     shdr2.contents.sh_entsize = 0
 
-    write_Symtab(melf, strtab, scn.elf_ndxscn())
+    keep = write_Symtab(melf, strtab, scn.elf_ndxscn())
     symsdata = strtab.packsyms()
     data2.contents.d_size = ctypes.sizeof(symsdata)
     data2.contents.d_buf = ctypes.cast(symsdata, ctypes.c_void_p)
@@ -152,6 +163,139 @@ def write_ELF(filename):
 
     melf.elf_flagphdr(pylibelf.libelf.Elf_Cmd.ELF_C_SET , pylibelf.libelf.ELF_F_DIRTY)
     melf.elf_update(pylibelf.libelf.Elf_Cmd.ELF_C_WRITE)
+    del keep
+
+def check_names(elfname):
+    melf = pylibelf.libelf.ElfDescriptor.fromfile(elfname, pylibelf.libelf.Elf_Cmd.ELF_C_READ)
+    dynsym = pylibelf.sections.SectionIndex(melf).by_name(".dynsym")
+    assert(pylibelf.names.SHT_NAMES[dynsym.type] == "DYNSYM")
+    assert(pylibelf.names.SHT(dynsym.type) is pylibelf.names.SHT.SHT_DYNSYM)
+    assert(pylibelf.names.flag_names("SHF", dynsym.flags) == ["ALLOC"])
+    data = melf.elf_getscn(dynsym.index).elf_getdata()
+    infos = [item.st_info for item in testhelper.ElfSymbolTable(data.contents.d_buf,
+                                                                 data.contents.d_size)]
+    assert(pylibelf.names.st_bind_names(infos) == ["LOCAL"] + ["GLOBAL"] * 6)
+    assert(pylibelf.names.st_type_names(infos) == ["NOTYPE"] + ["FUNC"] * 3 + ["OBJECT"] * 3)
+    # Aliases resolve to the first real name, range markers never win
+    assert(pylibelf.names.SHT_NAMES.gather([pylibelf.elf.SHT_LOSUNW, pylibelf.elf.SHT_HIOS, 12])
+           == ["SUNW_move", "GNU_versym", "<unknown: 0xc>"])
+    assert(pylibelf.names.EM_NAMES[pylibelf.elf.EM_M32] == "M32")
+    assert(pylibelf.names.PF(pylibelf.elf.PF_R | pylibelf.elf.PF_X) ==
+           pylibelf.names.PF.PF_R | pylibelf.names.PF.PF_X)
+
+def check_tables(elfname):
+    """ Records read back from the packed table behave like the ctypes structures """
+    melf = pylibelf.libelf.ElfDescriptor.fromfile(elfname, pylibelf.libelf.Elf_Cmd.ELF_C_READ)
+    dynsym = pylibelf.sections.SectionIndex(melf).by_name(".dynsym")
+    data = melf.elf_getscn(dynsym.index).elf_getdata()
+    symtab = testhelper.ElfSymbolTable(data.contents.d_buf, data.contents.d_size)
+    assert(len(symtab) == 7)
+    assert(symtab.space() == 7 * ctypes.sizeof(pylibelf.elf.Elf32_Sym) == data.contents.d_size)
+    raw = ctypes.string_at(data.contents.d_buf, data.contents.d_size)
+    entsize = ctypes.sizeof(pylibelf.elf.Elf32_Sym)
+    for index, item in enumerate(symtab):
+        copy = pylibelf.elf.Elf32_Sym.from_buffer_copy(raw, index * entsize)
+        assert(bytes(item) == bytes(copy))
+        assert(item.st_name == copy.st_name and item.st_value == copy.st_value)
+        assert(item.st_info == copy.st_info and item.st_shndx == copy.st_shndx)
+    assert(symtab[-1] == symtab[6] and symtab[1:3] == [symtab[1], symtab[2]])
+    # Assignments go to the packed storage and so to packsyms()
+    symtab[2].st_size = 1234
+    assert(symtab[2].st_size == 1234 and symtab.get(2 * entsize).st_size == 1234)
+    assert(pylibelf.elf.Elf32_Sym.from_buffer(symtab.packsyms(), 2 * entsize).st_size == 1234)
+    assert(symtab[2].to_structure().st_size == 1234)
+    # Tables of the other ELF class take the structure
+    wide = pylibelf.tables.ElfRecordTable(structure = pylibelf.elf.Elf64_Sym)
+    wide.add(pylibelf.elf.Elf64_Sym(st_name = 1, st_value = 1 << 40))
+    assert(wide[0].st_value == 1 << 40 and wide.space() == ctypes.sizeof(pylibelf.elf.Elf64_Sym))
+    # Bulk appends from a packed buffer or an iterable, packsyms() is a view of the storage
+    packed = testhelper.ElfSymbolTable()
+    assert(packed.extend((pylibelf.elf.Elf32_Sym * 3).from_buffer_copy(symtab.packsyms())) == 0)
+    assert(packed.extend(symtab[3:]) == 3 * entsize and packed[:] == symtab[:])
+    view = packed.packsyms()
+    assert(ctypes.sizeof(view) == packed.space() and bytes(view) == bytes(symtab.packsyms()))
+    packed[0].st_value = 42
+    assert(pylibelf.elf.Elf32_Sym.from_buffer(view).st_value == 42)
+    # Growing while libelf may still use the view leaves the view alone
+    packed.extend([symtab[1]] * 1000)
+    assert(len(packed) == 1007 and ctypes.sizeof(view) == 7 * entsize)
+    try:
+        packed.extend(b"\0" * (entsize + 1))
+        assert(False), "Partial entries accepted"
+    except ValueError:
+        pass
+
+def check_xlate(elfname):
+    """ A big endian copy of .dynsym translates back to the table libelf reads """
+    melf = pylibelf.libelf.ElfDescriptor.fromfile(elfname, pylibelf.libelf.Elf_Cmd.ELF_C_READ)
+    dynsym = pylibelf.sections.SectionIndex(melf).by_name(".dynsym")
+    data = melf.elf_getscn(dynsym.index).elf_getdata()
+    native = ctypes.string_at(data.contents.d_buf, data.contents.d_size)
+    rows = list(struct.iter_unpack("=IIIBBH", native))
+    msb = b"".join(struct.pack(">IIIBBH", *row) for row in rows)
+    sym = pylibelf.libelf.Elf_Type.ELF_T_SYM
+    assert(pylibelf.libelf.xlatetom(msb, sym, pylibelf.elf.ELFDATA2MSB) == native)
+    assert(pylibelf.libelf.xlatetof(native, sym, pylibelf.elf.ELFDATA2MSB) == msb)
+    # In place, both ways
+    buffer = bytearray(msb)
+    pylibelf.libelf.xlatetom(buffer, sym, pylibelf.elf.ELFDATA2MSB, out = buffer)
+    assert(buffer == native)
+    pylibelf.libelf.xlatetof(buffer, sym, pylibelf.elf.ELFDATA2MSB, out = buffer)
+    assert(buffer == msb)
+    table = testhelper.ElfSymbolTable.from_file(msb, pylibelf.elf.ELFDATA2MSB)
+    assert([item.st_value for item in table] == [row[1] for row in rows])
+    wide = pylibelf.libelf.xlatetom(struct.pack(">QQq", 0x10, 0x100000007, -8),
+                                    pylibelf.libelf.Elf_Type.ELF_T_RELA,
+                                    pylibelf.elf.ELFDATA2MSB, pylibelf.elf.ELFCLASS64)
+    assert(struct.unpack("=QQq", wide) == (0x10, 0x100000007, -8))
+    try:
+        pylibelf.libelf.xlatetom(msb[:-1], sym, pylibelf.elf.ELFDATA2MSB)
+        assert(False), "Partial entry translated"
+    except pylibelf.libelf.ElfError:
+        pass
+
+    try:
+        view = pylibelf.tables.numpy_view(msb, pylibelf.elf.Elf32_Sym, pylibelf.elf.ELFDATA2MSB)
+    except ImportError:
+        return
+    assert(view["st_value"].tolist() == [row[1] for row in rows])
+    assert(view["st_shndx"].tolist() == [row[5] for row in rows])
+
+def check_cache(elfname):
+    """ A cached entry matches what libelf parses and goes stale with the file """
+    tmpdir = tempfile.mkdtemp()
+    try:
+        copy = os.path.join(tmpdir, "a.elf")
+        shutil.copy(elfname, copy)
+        cache = pylibelf.cache.MetadataCache(os.path.join(tmpdir, "cache"))
+        assert(cache.lookup(copy) is None)
+        cache.add(copy).close()
+
+        melf = pylibelf.libelf.ElfDescriptor.fromfile(copy, pylibelf.libelf.Elf_Cmd.ELF_C_READ)
+        segments = pylibelf.segments.SegmentIndex(melf)
+        with cache.lookup(copy) as cached:
+            assert(list(cached.sections) == list(segments.sections))
+            assert(cached.sections.by_name(".dynsym").index == 4)
+            assert(cached.segments == segments.segments)
+            assert(cached.sections_in_segment(1) == segments.sections_in_segment(1))
+            assert(cached.machine == pylibelf.elf.EM_M32 and cached.build_id is None)
+            assert(cached.symbol_tables() == [4])
+            assert(cached.symbol_names(4) == ["", "myfunc", "hisfunc", "herfunc", "myvar",
+                                              "hisvar", "hervar"])
+            columns = cached.symbols(4)
+            assert(columns.info.tolist() == [0] + [0x12] * 3 + [0x11] * 3)
+        # The columns outlive the closed entry
+        assert(columns.shndx.tolist() == [0] + [1] * 6)
+        del columns
+
+        # A new mtime makes it a different file
+        stat = os.stat(copy)
+        os.utime(copy, ns = (stat.st_atime_ns, stat.st_mtime_ns + 1000000000))
+        assert(cache.lookup(copy) is None)
+        cache.open(copy).close()
+        assert(cache.lookup(copy) is not None)
+    finally:
+        shutil.rmtree(tmpdir)
 
 if __name__ == "__main__":
     argtab = testhelper.parse_command_line(sys.argv)
@@ -163,3 +307,7 @@ if __name__ == "__main__":
     elif (argtab.decompile != None and argtab.decompile[0] != None):
         print(f"Reading ELF file {argtab.decompile[0]}")
         testhelper.read_ELF(argtab.decompile[0])
+        check_names(argtab.decompile[0])
+        check_tables(argtab.decompile[0])
+        check_xlate(argtab.decompile[0])
+        check_cache(argtab.decompile[0])
@@ -12,12 +12,27 @@ import subprocess
 import hashlib
 
 import pylibelf
+import pylibelf.compare
+import pylibelf.names
+import pylibelf.readelf
+import pylibelf.sections
+import pylibelf.tables
 
 def validate_ELF(elfname, goldname):
     """
-    Read the ELF file headers using binutils version of ``readelf`` (not ``eu-readelf``)
-    and compare it with the golden version provided
+    Compare the ELF file with the golden version provided. A golden ELF file is
+    compared structurally in-process, any other golden file is taken to be the
+    output of binutils version of ``readelf -a`` (not ``eu-readelf``)
     """
+    if (goldname is not None):
+        with open(goldname, "rb") as goldhandle:
+            magic = goldhandle.read(pylibelf.elf.SELFMAG)
+        if (magic == pylibelf.elf.ELFMAG.encode("latin-1")):
+            differences = pylibelf.compare.compare_elf(goldname, elfname)
+            assert(not differences), (f"ELF mismatch for {elfname}\n"
+                                      + pylibelf.compare.format_differences(differences))
+            return
+
     result = subprocess.run(["readelf", "-a", elfname], capture_output = True,
                             check = True)
     sig = hashlib.md5(result.stdout).hexdigest()
@@ -33,18 +48,18 @@ def validate_ELF(elfname, goldname):
 
 def dump_section_contents(scn_data):
     data = ctypes.string_at(scn_data.contents.d_buf, scn_data.contents.d_size)
-    for index in range(scn_data.contents.d_size):
-        if (index % 16 == 0):
-            print()
-        print(f"{hex(data[index])} ", end = '')
-
-    print()
+    print("\n".join(pylibelf.readelf.hexdump(data)))
 
-def dump_dynsym(scn_data):
+def dump_dynsym(scn_data, shndx_data = None):
     symtab = ElfSymbolTable(scn_data.contents.d_buf, scn_data.contents.d_size)
+    if (shndx_data is not None):
+        symtab.load_shndx(shndx_data.contents.d_buf, shndx_data.contents.d_size)
+    infos = [item.st_info for item in symtab]
+    binds = pylibelf.names.st_bind_names(infos)
+    types = pylibelf.names.st_type_names(infos)
     index = 0
     for item in symtab:
-        print(f"[{ index}] {item.st_name} {item.st_value} {item.st_size} {item.st_info} {item.st_other} {item.st_shndx}")
+        print(f"[{ index}] {item.st_name} {item.st_value} {item.st_size} {binds[index]} {types[index]} {item.st_other} {symtab.shndx(index)}")
         index += 1
 
 def dump_dynrela(scn_data):
@@ -59,9 +74,9 @@ def read_ELF(elfname):
     Read the ELF file headers and display details
     """
     melf = pylibelf.libelf.ElfDescriptor.fromfile(elfname, pylibelf.libelf.Elf_Cmd.ELF_C_READ)
-    ehdr = melf.elf32_getehdr()
 
-    curr = melf.elf_getscn(ehdr.contents.e_shstrndx)
+    sections = pylibelf.sections.SectionIndex(melf)
+    curr = melf.elf_getscn(melf.elf_getshdrstrndx())
     curr_shdr = curr.elf32_getshdr()
     curr_data = curr.elf_getdata()
     assert(curr_data.contents.d_size == curr_shdr.contents.sh_size)
@@ -75,9 +90,12 @@ def read_ELF(elfname):
         name = strtab.get(curr_name)
         scn_data = curr.elf_getdata()
         assert(scn_data.contents.d_size == curr_shdr.contents.sh_size)
-        print(f"[ {index}] {name} {hex(curr_shdr.contents.sh_size)} {hex(curr_shdr.contents.sh_addralign)}")
+        sh_type = pylibelf.names.SHT_NAMES[curr_shdr.contents.sh_type]
+        print(f"[ {index}] {name} {sh_type} {hex(curr_shdr.contents.sh_size)} {hex(curr_shdr.contents.sh_addralign)}")
         if (name == ".dynsym"):
-            dump_dynsym(scn_data)
+            xsection = sections.shndx_section(curr.elf_ndxscn())
+            dump_dynsym(scn_data, melf.elf_getscn(xsection.index).elf_getdata()
+                        if xsection is not None else None)
         elif (name == ".rela.dyn"):
             dump_dynrela(scn_data)
         else:
@@ -96,128 +114,7 @@ def parse_command_line(args):
     # strip out the argv[0]
     return parser.parse_args(args[1:])
 
-class ElfStringTable:
-    """
-    Helper data structure to store and pack strings for ELF which is later
-    used to build ELF .shstrtab section
-    """
-    def __init__(self, data = None, size = 0):
-        self._size = size
-        self._syms = []
-        self._data = None
-        if (data == None):
-            return
-        self._data = ctypes.string_at(data, size)
-        # Virtual dispatch to class specific deserialize implementation
-        self._populate()
-
-    def _populate(self):
-        # Populate our syms list
-        pos = 0
-        while (pos < self._size):
-            item = self.get(pos)
-            self._syms.append(item)
-            pos += len(item)
-            # Go past the null char
-            pos += 1
-
-    # Support len() operator on the table e.g. len(mystab)
-    # Inherited by the derived classes
-    def __len__(self):
-        return len(self._syms)
-
-    # Support indexing into the table e.g. mystab[i]
-    # Inherited by the derived classes
-    def __getitem__(self, index):
-        return self._syms[index]
-
-    def add(self, item):
-        pos = self._size
-        self._syms.append(item)
-        self._size += (len(item) + 1)
-        return pos
-
-    # Used by all derived classes as well
-    def _pack(self, arr, index):
-        subdata = ctypes.cast(ctypes.addressof(self._data) + index, ctypes.c_void_p)
-        ctypes.memmove(subdata, arr, len(arr))
-        index += len(arr)
-        return index
-
-    def packsyms(self):
-        self._data = ctypes.create_string_buffer(self._size)
-        index = 0
-        for item in self._syms:
-            arr = bytes(item, "utf-8")
-            index = self._pack(arr, index)
-            self._data[index] = b'\0'
-            index += 1
-        return self._data
-
-    def get(self, pos):
-        assert(pos < self._size), f"Illegal offset into table storage"
-        item = ctypes.string_at(self._data[pos:])
-        return item.decode("utf-8")
-
-    def space(self):
-        return self._size
-
-    def __str__(self):
-        return f"{self._syms}\n{self._data}"
-
-# TODO: Move to python Generics so can use the same class for
-# ElfRelaTable and ElfSymbolTable
-
-class ElfSymbolTable(ElfStringTable):
-    """
-    Helper data structure to store and pack Elf32_Sym which is later
-    used to build ELF .dynsym section
-    """
-    def __init__(self, data = None, size = 0):
-        super().__init__(data, size)
-
-    def _populate(self):
-        # Populate our syms list
-        pos = 0
-        while (pos < self._size):
-            self._syms.append(self.get(pos))
-            pos += ctypes.sizeof(pylibelf.elf.Elf32_Sym)
-
-    def add(self, item):
-        pos = self._size
-        self._syms.append(item)
-        self._size += ctypes.sizeof(item)
-        return pos
-
-    def packsyms(self):
-        self._data = ctypes.create_string_buffer(self._size)
-        index = 0
-        for item in self._syms:
-            arr = bytes(item)
-            index = self._pack(arr, index)
-        return self._data
-
-    def get(self, pos):
-        assert(pos < self._size), f"Illegal offset into table storage"
-        item = pylibelf.elf.Elf32_Sym.from_buffer_copy(self._data, pos)
-        return item
-
-class ElfRelaTable(ElfSymbolTable):
-    """
-    Helper data structure to store and pack Elf32_Rela which is later
-    used to build ELF .rela.dyn section
-    """
-    def __init__(self, data = None, size = 0):
-        super().__init__(data, size)
-
-    def _populate(self):
-        # Populate our syms list
-        pos = 0
-        while (pos < self._size):
-            self._syms.append(self.get(pos))
-            pos += ctypes.sizeof(pylibelf.elf.Elf32_Rela)
-
-    def get(self, pos):
-        assert(pos < self._size), f"Illegal offset into table storage"
-        item = pylibelf.elf.Elf32_Rela.from_buffer_copy(self._data, pos)
-        return item
+# The table helpers moved to pylibelf.tables, kept here for the tests and tools using them
+ElfStringTable = pylibelf.tables.ElfStringTable
+ElfSymbolTable = pylibelf.tables.ElfSymbolTable
+ElfRelaTable = pylibelf.tables.ElfRelaTable